@@ -0,0 +1,4 @@
+"""
+Benchmarks for the parser pipeline, running on seeded synthetic transaction histories.
+Run them with python -m benchmarks, from the repository root.
+"""
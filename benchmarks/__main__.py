@@ -0,0 +1,50 @@
+"""
+Runs the benchmark suite, writing its results to a JSON file.
+
+    python -m benchmarks --sizes 1000 10000 100000 1000000 --output results.json
+"""
+import argparse
+import json
+import sys
+
+from benchmarks.suite import BENCHMARKS, DEFAULT_SIZES, run_suite
+from src.transactions.parser import DEFAULT_MARGIN
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='History sizes to run.')
+    parser.add_argument('--benchmarks', nargs='+', choices=sorted(BENCHMARKS), help='Benchmarks to run.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the history generator.')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs of each benchmark.')
+    parser.add_argument('--no-memory', action='store_true', help='Skip measuring peak memory.')
+    parser.add_argument('--merchants', type=int, help='Number of recurring merchants.')
+    parser.add_argument('--recurring-ratio', type=float, default=0.5, help='Ratio of recurring transactions.')
+    parser.add_argument('--jitter', type=int, default=DEFAULT_MARGIN, help='Jitter of recurring dates, in days.')
+    parser.add_argument('--noise', type=float, default=0.1, help='Ratio of descriptions carrying references.')
+    parser.add_argument('--output', help='JSON file for the results. Defaults to the standard output.')
+    options = parser.parse_args(args)
+
+    def log(result):
+        print('{name:<34} {size:>9} rows {seconds:>10.4f}s {throughput:>14.1f}/s'.format(**result), file=sys.stderr)
+
+    results = run_suite(sizes=options.sizes,
+                        names=options.benchmarks,
+                        seed=options.seed,
+                        repeat=options.repeat,
+                        memory=not options.no_memory,
+                        generator_options=dict(merchants=options.merchants,
+                                               recurring_ratio=options.recurring_ratio,
+                                               jitter=options.jitter,
+                                               noise=options.noise),
+                        log=log)
+
+    if options.output:
+        with open(options.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
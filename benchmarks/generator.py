@@ -0,0 +1,87 @@
+"""
+Seeded generator for realistic transaction histories.
+
+Histories mix recurring merchants, which charge on a regular interval with some jitter, and one-off purchases.
+Descriptions may carry noise, such as reference numbers, which should not prevent them from being grouped.
+The same seed always generates the same history.
+"""
+import datetime
+import random
+
+from src.transactions.dates import DATE_FORMAT
+from src.transactions.parser import DEFAULT_MARGIN
+
+
+START_DATE = datetime.date(2018, 1, 1)
+INTERVALS = [7, 14, 15, 30, 30, 30, 91, 365]
+ROWS_PER_MERCHANT = 50
+
+NAMES = ['NETFLIX', 'SPOTIFY', 'EXXON', 'MOBIL', 'WALMART', 'TARGET', 'COMCAST', 'VERIZON', 'GEICO', 'ADOBE',
+         'AMAZON', 'APPLE', 'HULU', 'PLANET', 'FITNESS', 'CITY', 'WATER', 'POWER', 'GAS', 'RENT', 'DROPBOX',
+         'GOOGLE', 'KROGER', 'COSTCO', 'SHELL', 'CHEVRON', 'STARBUCKS', 'UBER', 'LYFT', 'PAYPAL']
+KINDS = ['SUBSCRIPTION', 'INVOICE', 'PAYMENT', 'CORPORATION', 'SERVICES', 'BILL', 'STORE', 'MARKET', 'ONLINE',
+         'AUTOPAY', 'MEMBERSHIP', 'INSURANCE']
+SEPARATORS = [' ', ' ', ' ', '*', '--']
+
+
+def get_description(rand):
+    words = [rand.choice(NAMES), rand.choice(KINDS), str(rand.randrange(100, 10000))]
+    return rand.choice(SEPARATORS).join(words)
+
+
+def add_noise(rand, description, noise):
+    """
+    Appends a reference to some descriptions. References go after the description's words,
+    so the description is still similar to its merchant's.
+    """
+    if rand.random() < noise:
+        return '{}*{}'.format(description, rand.randrange(10 ** 5, 10 ** 6))
+    return description
+
+
+def generate_transactions(count, merchants=None, recurring_ratio=0.5, jitter=DEFAULT_MARGIN, noise=0.1, seed=0):
+    """
+    Generates a transaction history, sorted by date.
+
+    :param count: Number of transactions to be generated.
+    :param merchants: Number of recurring merchants. Defaults to one for every 50 transactions.
+    :param recurring_ratio: Ratio of the transactions that are charged by recurring merchants.
+    :param jitter: Largest number of days a recurring charge may be early or late, up to DEFAULT_MARGIN.
+    :param noise: Probability of a description carrying a reference number.
+    :param seed: Seed for the random generator.
+    :return: List of transactions in a dict format.
+    """
+    if not 0 <= jitter <= DEFAULT_MARGIN:
+        raise ValueError('The jitter should be between 0 and {} days'.format(DEFAULT_MARGIN))
+    if not 0 <= recurring_ratio <= 1:
+        raise ValueError('The recurring ratio should be between 0 and 1')
+
+    rand = random.Random(seed)
+    if merchants is None:
+        merchants = max(1, count // ROWS_PER_MERCHANT)
+
+    recurring = int(count * recurring_ratio)
+    per_merchant, extra = divmod(recurring, merchants) if recurring else (0, 0)
+
+    rows = []
+    span = 1
+    for merchant in range(merchants if recurring else 0):
+        description = get_description(rand)
+        interval = rand.choice(INTERVALS)
+        amount = round(rand.uniform(5, 500), 2)
+        day = rand.randrange(interval)
+        for _ in range(per_merchant + (merchant < extra)):
+            rows.append((day + rand.randint(-jitter, jitter), add_noise(rand, description, noise), amount))
+            day += interval
+        span = max(span, day)
+
+    for _ in range(count - recurring):
+        rows.append((rand.randrange(span), add_noise(rand, get_description(rand), noise),
+                     round(rand.uniform(-500, 500), 2)))
+
+    rows.sort(key=lambda row: row[0])
+    dates = {}
+    for day in range(rows[-1][0] + 1 if rows else 0):
+        dates[day] = (START_DATE + datetime.timedelta(days=day)).strftime(DATE_FORMAT)
+    return [dict(date=dates[max(day, 0)], description=description, amount=amount)
+            for day, description, amount in rows]
@@ -0,0 +1,169 @@
+"""
+Benchmarks for each stage of the parser pipeline, and for the API endpoints.
+Every benchmark records its wall time, peak traced memory and throughput, so results from different commits
+can be compared.
+"""
+from itertools import islice
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from benchmarks.generator import generate_transactions
+from src.app import create_app
+from src.transactions.comparison import compare_sentences
+from src.transactions.models import Transaction
+from src.transactions.parser import parse_sequences, parse_storage, group_descriptions
+
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+MAX_COMPARISONS = 100000
+MAX_LOOKUPS = 1000
+MAX_BATCH_LOOKUPS = 10000
+
+
+def measure(name, size, items, run, setup=None, repeat=3, memory=True):
+    """
+    Measures a function, taking its best wall time over a number of runs.
+    Peak memory is measured on a separate run, since tracing allocations slows the function down.
+
+    :param name: Name of the benchmark.
+    :param size: Number of transactions in the benchmark's history.
+    :param items: Number of items processed by each run, for the throughput.
+    :param run: Function to be measured, receiving the result of the setup.
+    :param setup: Optional function preparing the run's argument, which is not measured.
+    :param repeat: Number of timed runs.
+    :param memory: Indicates whether the peak memory should be measured.
+    :return: Dict with the benchmark's results.
+    """
+    seconds = None
+    for _ in range(repeat):
+        argument = setup() if setup else None
+        start = time.perf_counter()
+        run(argument)
+        elapsed = time.perf_counter() - start
+        seconds = elapsed if seconds is None else min(seconds, elapsed)
+
+    peak = None
+    if memory:
+        argument = setup() if setup else None
+        tracemalloc.start()
+        try:
+            run(argument)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return dict(name=name,
+                size=size,
+                items=items,
+                seconds=seconds,
+                peak_bytes=peak,
+                throughput=items / seconds if seconds else None)
+
+
+def bench_compare_sentences(transactions, **options):
+    descriptions = [transaction['description'] for transaction in islice(transactions, MAX_COMPARISONS + 1)]
+    pairs = list(zip(descriptions, descriptions[1:]))
+
+    def run(argument):
+        for sentence_a, sentence_b in pairs:
+            compare_sentences(sentence_a, sentence_b)
+
+    return [measure('compare_sentences', len(transactions), len(pairs), run, **options)]
+
+
+def bench_parse_sequences(transactions, **options):
+    def setup():
+        # Parsing sets the transactions' ownership, so each run gets new ones.
+        return group_descriptions([Transaction(**transaction) for transaction in transactions])
+
+    def run(groups):
+        for group in groups:
+            parse_sequences(group)
+
+    return [measure('parse_sequences', len(transactions), len(transactions), run, setup, **options)]
+
+
+def bench_parse_storage(transactions, **options):
+    return [measure('parse_storage', len(transactions), len(transactions),
+                    lambda argument: parse_storage(transactions), **options)]
+
+
+def bench_endpoints(transactions, **options):
+    client = create_app().test_client()
+    body = json.dumps(dict(transactions=transactions))
+    lookups = transactions[:MAX_LOOKUPS]
+    batch = json.dumps(dict(transactions=transactions[:MAX_BATCH_LOOKUPS]))
+
+    def check(response):
+        if response.status_code != 200:
+            raise RuntimeError('The endpoint answered {}'.format(response.status))
+
+    def load(argument):
+        check(client.post('/transactions/load', data=body, content_type='application/json'))
+
+    def get_sequence(argument):
+        for transaction in lookups:
+            check(client.post('/transactions/get_sequence', json=dict(transaction=transaction)))
+
+    def get_sequences(argument):
+        check(client.post('/transactions/get_sequences', data=batch, content_type='application/json'))
+
+    results = [measure('POST /transactions/load', len(transactions), len(transactions), load, **options)]
+    results.append(measure('POST /transactions/get_sequence', len(transactions), len(lookups),
+                           get_sequence, **options))
+    results.append(measure('POST /transactions/get_sequences', len(transactions),
+                           min(len(transactions), MAX_BATCH_LOOKUPS), get_sequences, **options))
+    return results
+
+
+BENCHMARKS = {
+    'compare_sentences': bench_compare_sentences,
+    'parse_sequences': bench_parse_sequences,
+    'parse_storage': bench_parse_storage,
+    'endpoints': bench_endpoints,
+}
+
+
+def get_environment():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return dict(python=sys.version.split()[0],
+                platform=platform.platform(),
+                commit=commit,
+                timestamp=time.time())
+
+
+def run_suite(sizes=DEFAULT_SIZES, names=None, seed=0, repeat=3, memory=True, generator_options=None,
+              log=None):
+    """
+    Runs the benchmarks for each history size.
+
+    :param sizes: List of history sizes, in transactions.
+    :param names: Names of the benchmarks to be run, from BENCHMARKS. Defaults to all of them.
+    :param seed: Seed for the history generator.
+    :param repeat: Number of timed runs of each benchmark.
+    :param memory: Indicates whether peak memory should be measured.
+    :param generator_options: Extra arguments for generator.generate_transactions.
+    :param log: Optional function receiving each result as it is measured.
+    :return: Dict with the environment, the generator settings and the results.
+    """
+    names = names or list(BENCHMARKS)
+    generator_options = dict(generator_options or {}, seed=seed)
+
+    results = []
+    for size in sizes:
+        transactions = generate_transactions(size, **generator_options)
+        for name in names:
+            for result in BENCHMARKS[name](transactions, repeat=repeat, memory=memory):
+                results.append(result)
+                if log:
+                    log(result)
+
+    return dict(environment=get_environment(), generator=generator_options, results=results)
@@ -1,9 +1,18 @@
 from flask import Flask
 
+import os
+
 from src.transactions.blueprint import mod_transactions
 
 
 def create_app():
     app = Flask(__name__)
+    app.config['TRANSACTIONS_SNAPSHOT_DIR'] = os.environ.get('TRANSACTIONS_SNAPSHOT_DIR')
+    app.config['TRANSACTIONS_PROFILE'] = bool(os.environ.get('TRANSACTIONS_PROFILE'))
+    app.config['TRANSACTIONS_SPILL_DIR'] = os.environ.get('TRANSACTIONS_SPILL_DIR')
+    app.config['TRANSACTIONS_SQLITE_DIR'] = os.environ.get('TRANSACTIONS_SQLITE_DIR')
+    for key in ('TRANSACTIONS_MAX_TENANTS', 'TRANSACTIONS_MAX_TENANT_TRANSACTIONS', 'TRANSACTIONS_RETENTION_DAYS'):
+        if os.environ.get(key):
+            app.config[key] = int(os.environ[key])
     app.register_blueprint(mod_transactions)
     return app
@@ -1,17 +1,25 @@
 """
 Example script for running the algorithm for a file.
+Pass --ndjson to stream one sequence per line instead of printing the whole storage at once.
 """
 
 import json
+import sys
 
+from src.transactions.export import write_ndjson
+from src.transactions.loader import iter_transactions
 from src.transactions.parser import parse_storage
 
 
-def get_transactions():
+def get_storage():
     with open('./transactions.json', 'r') as file:
-        return json.loads(file.read())
+        return parse_storage(iter_transactions(file))
 
 
-transactions = get_transactions()
-storage = parse_storage(transactions)
-print(storage)
\ No newline at end of file
+storage = get_storage()
+if '--ndjson' in sys.argv[1:]:
+    write_ndjson(storage, sys.stdout.buffer)
+else:
+    # Each sequence is printed once, along with the map from transaction keys to sequences.
+    # SequenceStorage.from_compact_dict rebuilds the storage from this output.
+    print(json.dumps(storage.to_compact_dict()))
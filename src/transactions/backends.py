@@ -0,0 +1,269 @@
+"""
+Storage backends, keeping parsed sequences outside of the process memory.
+
+A backend answers the same lookups as a SequenceStorage, and receives all the sequences of a parse at once,
+through add_storage or add_sequences. Backends don't keep the description groups sequences were parsed from,
+so they can't be extended. parse_storage adds each description group's sequences to a backend as soon as they are
+parsed, so the whole storage is never held in memory.
+"""
+from collections import OrderedDict
+import json
+import os
+import sqlite3
+import threading
+import weakref
+
+from src.transactions.models import TransactionSequence
+
+
+DEFAULT_CACHE_SIZE = 1024
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sequences (
+    id INTEGER PRIMARY KEY,
+    interval INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS keys (
+    key INTEGER PRIMARY KEY,
+    sequence INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS keys_sequence ON keys (sequence);
+'''
+
+
+def close_database(connection, path=None):
+    """
+    Closes a database connection, removing its file if a path is provided.
+
+    :param connection: The database connection.
+    :param path: Optional path of the database file to be removed.
+    """
+    connection.close()
+    if path is not None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def decode_sequence(data):
+    """
+    Rebuilds a sequence from its stored JSON encoding, which is kept as the sequence's response.
+
+    :param data: The encoded sequence.
+    :return: TransactionSequence
+    """
+    sequence = TransactionSequence.from_dict(json.loads(data.decode('utf-8')))
+    sequence.encoded = bytes(data)
+    return sequence
+
+
+class StorageBackend:
+    """
+    Base class for storage backends. Backends implement add_sequences, add_storage and get_sequence_by_key,
+    and the remaining lookups are built on those.
+    """
+
+    def add_sequences(self, sequences):
+        """
+        Adds a list of sequences to the backend. A key of a transaction in more than one sequence
+        points to the last of them, just like in a SequenceStorage.
+
+        :param sequences: Iterable of sequences of transactions to be added.
+        """
+        raise NotImplementedError
+
+    def add_storage(self, storage):
+        """
+        Adds the sequences of a SequenceStorage to the backend, keeping the storage's keys as they are.
+
+        :param storage: SequenceStorage to be added.
+        """
+        raise NotImplementedError
+
+    def get_sequence_by_key(self, key):
+        """
+        Returns the sequence of a transaction key.
+
+        :param key: The transaction's key.
+        :return: The transaction's sequence, or None if the key has no sequence.
+        """
+        raise NotImplementedError
+
+    def iter_sequences(self):
+        """
+        Yields each sequence in the backend once.
+        """
+        raise NotImplementedError
+
+    def clear_cache(self):
+        """
+        Drops the sequences the backend keeps in memory, if any.
+        """
+
+    def add_sequence(self, sequence):
+        self.add_sequences([sequence])
+
+    def get_sequence(self, transaction):
+        """
+        Given a transaction, returns its sequence.
+
+        :param transaction: Transaction whose sequence should be returned.
+        :return: The transaction's sequence.
+        """
+        return self.get_sequence_by_key(transaction.id)
+
+    def get_response(self, transaction):
+        """
+        Given a transaction, returns its sequence encoded as JSON.
+
+        :param transaction: Transaction whose sequence should be returned.
+        :return: The encoded sequence, or None if the transaction has no sequence.
+        """
+        return self.get_response_by_key(transaction.id)
+
+    def get_response_by_key(self, key):
+        """
+        Returns the encoded sequence of a transaction key.
+
+        :param key: The transaction's key.
+        :return: The encoded sequence, or None if the key has no sequence.
+        """
+        sequence = self.get_sequence_by_key(key)
+        if sequence is None:
+            return None
+        return sequence.to_bytes()
+
+
+class SQLiteStorage(StorageBackend):
+    """
+    A storage backend on an SQLite database, which may be a file that outlives the process.
+    Sequences are stored as their JSON encoding, which lookup responses are served from, and transaction keys
+    are the primary key of their own table. The most recently used sequences are kept in memory.
+
+    :param path: Path of the database file, or ':memory:'.
+    :param cache_size: Number of sequences kept in memory.
+    :param delete: Indicates whether the database file is removed when the storage is closed or released.
+    """
+
+    def __init__(self, path=':memory:', cache_size=DEFAULT_CACHE_SIZE, delete=False):
+        self.path = path
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.duplicates = {}
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        # The finalizer only holds the connection, so it runs once the storage itself is released.
+        self.finalizer = weakref.finalize(self, close_database, self.connection, path if delete else None)
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+
+    def insert(self, sequences, keys=None):
+        """
+        Inserts sequences and their keys in a single transaction.
+
+        :param sequences: Iterable of sequences of transactions to be inserted.
+        :param keys: Optional iterable of (key, sequence) tuples. Defaults to the keys of the sequences' transactions.
+        """
+        with self.lock, self.connection:
+            first = self.connection.execute('SELECT COALESCE(MAX(id) + 1, 0) FROM sequences').fetchone()[0]
+
+            numbers = {}
+            rows = []
+            for number, sequence in enumerate(sequences, first):
+                numbers[id(sequence)] = number
+                rows.append((number, sequence.interval, sequence.to_bytes()))
+            self.connection.executemany('INSERT INTO sequences (id, interval, data) VALUES (?, ?, ?)', rows)
+
+            if keys is None:
+                keys = ((transaction.id, numbers[id(sequence)]) for sequence in sequences for transaction in sequence)
+            else:
+                keys = ((key, numbers[id(sequence)]) for key, sequence in keys)
+            self.connection.executemany('INSERT OR REPLACE INTO keys (key, sequence) VALUES (?, ?)', keys)
+
+            # Keys may now point to other sequences, so cached sequences are looked up again.
+            self.cache.clear()
+
+    def add_sequences(self, sequences):
+        """
+        Adds a list of sequences to the database, inserting all of them in a single transaction.
+
+        :param sequences: Iterable of sequences of transactions to be added.
+        """
+        self.insert(list(sequences))
+
+    def add_storage(self, storage):
+        """
+        Adds the sequences of a SequenceStorage to the database, inserting all of them in a single transaction.
+
+        :param storage: SequenceStorage to be added.
+        """
+        sequences = {id(sequence): sequence for sequence in storage.sequences.values()}
+        self.insert(list(sequences.values()), storage.sequences.items())
+
+    def get_sequence_number(self, key):
+        """
+        Finds the number of the sequence a transaction key belongs to.
+
+        :param key: The transaction's key.
+        :return: The sequence number, or None if the key has no sequence.
+        """
+        with self.lock:
+            row = self.connection.execute('SELECT sequence FROM keys WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def get_sequence_by_number(self, number):
+        """
+        Returns a sequence by its number, from the cache or from the database.
+
+        :param number: Number of the sequence.
+        :return: TransactionSequence
+        """
+        with self.lock:
+            sequence = self.cache.get(number)
+            if sequence is not None:
+                self.cache.move_to_end(number)
+                return sequence
+
+            data = self.connection.execute('SELECT data FROM sequences WHERE id = ?', (number,)).fetchone()[0]
+            sequence = self.cache[number] = decode_sequence(data)
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+            return sequence
+
+    def iter_sequences(self, chunk_size=256):
+        """
+        Yields each sequence in the database, in the order they were added. Sequences whose keys were all taken
+        by later ones are skipped, since lookups never return them. Sequences are read in chunks, so other lookups
+        can run in between.
+
+        :param chunk_size: Number of sequences read at a time.
+        """
+        last = -1
+        while True:
+            with self.lock:
+                rows = self.connection.execute('SELECT id, data FROM sequences WHERE id > ? AND EXISTS '
+                                               '(SELECT 1 FROM keys WHERE keys.sequence = sequences.id) '
+                                               'ORDER BY id LIMIT ?', (last, chunk_size)).fetchall()
+            if not rows:
+                return
+            for last, data in rows:
+                yield decode_sequence(data)
+
+    def clear_cache(self):
+        with self.lock:
+            self.cache.clear()
+
+    def get_sequence_by_key(self, key):
+        number = self.get_sequence_number(key)
+        if number is None:
+            return None
+        return self.get_sequence_by_number(number)
+
+    def close(self):
+        self.finalizer()
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM keys').fetchone()[0]
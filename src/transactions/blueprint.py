@@ -1,34 +1,301 @@
-from flask import Blueprint, request, make_response, current_app
-from werkzeug.exceptions import BadRequest
+from flask import Blueprint, Response, request, make_response, current_app, jsonify, url_for
+from werkzeug.exceptions import BadRequest, Conflict, NotFound
 
-from src.transactions.models import Transaction
-from src.transactions.parser import parse_storage
+from src.transactions.backends import SQLiteStorage
+from src.transactions.dates import parse_date, DATE_FORMAT
+from src.transactions.export import iter_ndjson
+from src.transactions.jobs import StorageState, Job
+from src.transactions.loader import iter_transactions, StreamBuffer, DEFAULT_KEY
+from src.transactions.models import Transaction, SequenceStorage, get_transaction_key
+from src.transactions.parser import parse_storage, DEFAULT_MARGIN
+from src.transactions.profiling import ParseProfile
+from src.transactions.snapshot import SnapshotDirectory, StaleSnapshotError, VERSION_FILE, read_job
+from src.transactions.tenants import TenantRegistry, DEFAULT_ACCOUNT, get_account_name
 
+import datetime
 import json
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+DATE_QUERIES = ('active', 'first', 'last')
+ACCOUNT_HEADER = 'X-Account-Id'
+SPOOL_SIZE = 8 * 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def get_snapshot_dir(app, account):
+    # With a snapshot directory, storages are shared with every worker process through memory-mapped
+    # snapshots, in a directory of their own for each account other than the default one.
+    snapshot_dir = app.config.get('TRANSACTIONS_SNAPSHOT_DIR')
+    if snapshot_dir and account != DEFAULT_ACCOUNT:
+        snapshot_dir = os.path.join(snapshot_dir, get_account_name(account))
+    return snapshot_dir
+
+
+def create_registry(app):
+    # Snapshots are written from the sequences held in memory, so they can't be combined with SQLite storages.
+    sqlite_dir = app.config.get('TRANSACTIONS_SQLITE_DIR')
+    if sqlite_dir and app.config.get('TRANSACTIONS_SNAPSHOT_DIR'):
+        raise ValueError('TRANSACTIONS_SQLITE_DIR and TRANSACTIONS_SNAPSHOT_DIR cannot be used together')
+    if sqlite_dir:
+        os.makedirs(sqlite_dir, exist_ok=True)
+
+    registry = TenantRegistry(max_tenants=app.config.get('TRANSACTIONS_MAX_TENANTS'),
+                              max_transactions=app.config.get('TRANSACTIONS_MAX_TENANT_TRANSACTIONS'),
+                              spill_dir=app.config.get('TRANSACTIONS_SPILL_DIR'))
+
+    def create_state(account):
+        snapshot_dir = get_snapshot_dir(app, account)
+        snapshots = SnapshotDirectory(snapshot_dir) if snapshot_dir else None
+        return StorageState(snapshots=snapshots, executor=registry.executor, indexed=True)
+
+    def has_storage(account):
+        # Accounts loaded by another worker are found through their published snapshot.
+        snapshot_dir = get_snapshot_dir(app, account)
+        return bool(snapshot_dir) and os.path.exists(os.path.join(snapshot_dir, VERSION_FILE))
+
+    registry.create_state = create_state
+    registry.has_storage = has_storage
+    return registry
 
 
 def create_blueprint():
     bp = Blueprint('transactions', __name__, url_prefix='/transactions')
+    bp.record_once(lambda state: state.app.extensions.setdefault('transactions', create_registry(state.app)))
     return bp
 
 
 mod_transactions = create_blueprint()
 
 
+def get_account():
+    # Each account has its own storage. Requests without an account use the default one.
+    return request.args.get('account') or request.headers.get(ACCOUNT_HEADER) or DEFAULT_ACCOUNT
+
+
+def find_state():
+    # Lookups never create a state, so unknown accounts don't take the place of loaded ones.
+    return current_app.extensions['transactions'].find(get_account())
+
+
+def get_state():
+    state = find_state()
+    if state is None:
+        raise BadRequest("The Storage was not loaded")
+    return state
+
+
+def use_state():
+    # Requests publishing a storage hold their account's state, so the account isn't evicted until they are done.
+    return current_app.extensions['transactions'].use(get_account())
+
+
+def get_storage():
+    storage = get_state().storage
+    if storage is None:
+        raise BadRequest("The Storage was not loaded")
+    return storage
+
+
+def get_reader_storage():
+    # Lookups are served from the current snapshot when there is one, which may have been published by any worker.
+    snapshots = get_state().snapshots
+    if snapshots is None:
+        return get_storage()
+
+    snapshot = snapshots.current()
+    if snapshot is None:
+        return get_storage()
+    return snapshot
+
+
+def get_default_storage(retention=None, backend=None):
+    with open('./transactions.json', 'r') as file:
+        return parse_storage(iter_transactions(file), retention=retention, storage=backend)
+
+
+def encode_sequences(storage, keys):
+    """
+    Encodes the sequences of several transaction keys as a single JSON object. Sequences are listed once,
+    under "sequences", and each key points to its sequence's position in that list, under "transactions".
+
+    :param storage: Storage to look the keys up in.
+    :param keys: List of transaction keys.
+    :return: The encoded object.
+    """
+    positions = {}
+    indexes = []
+    for key in keys:
+        response = storage.get_response_by_key(key)
+        if response is None:
+            indexes.append(None)
+        else:
+            # Each sequence's encoding is cached, so sequences are told apart by their encodings.
+            indexes.append(positions.setdefault(response, len(positions)))
+
+    return b''.join([b'{"sequences": [', b', '.join(positions), b'], "transactions": ',
+                     json.dumps(indexes).encode('utf-8'), b'}'])
+
+
+def encode_sequence_list(sequences):
+    # Sequences cache their encodings, so lists of them are joined without encoding them again.
+    return b''.join([b'{"sequences": [', b', '.join(sequence.to_bytes() for sequence in sequences), b']}'])
+
+
+def encode_upcoming(upcoming, margin):
+    """
+    Encodes upcoming transactions as a single JSON object, listing under "upcoming" the expected date of each one,
+    the earliest and latest dates within the margin, and its sequence.
+
+    :param upcoming: List of (expected datetime, sequence) tuples.
+    :param margin: Acceptable margin around the expected dates.
+    :return: The encoded object.
+    """
+    delta = datetime.timedelta(days=margin)
+    items = []
+    for date, sequence in upcoming:
+        dates = json.dumps(dict(date=date.strftime(DATE_FORMAT),
+                                earliest=(date - delta).strftime(DATE_FORMAT),
+                                latest=(date + delta).strftime(DATE_FORMAT)))
+        items.append(b''.join([dates[:-1].encode('utf-8'), b', "sequence": ', sequence.to_bytes(), b'}']))
+    return b''.join([b'{"upcoming": [', b', '.join(items), b']}'])
+
+
+def create_profile():
+    # With TRANSACTIONS_PROFILE set, loads log their stage timings and slowest description groups.
+    return ParseProfile() if current_app.config.get('TRANSACTIONS_PROFILE') else None
+
+
+def get_retention():
+    # With TRANSACTIONS_RETENTION_DAYS set, loaded storages only keep that many days of transactions.
+    return current_app.config.get('TRANSACTIONS_RETENTION_DAYS')
+
+
+def create_backend():
+    # With TRANSACTIONS_SQLITE_DIR set, each load is parsed into an SQLite database of its own, which is removed
+    # once the storage is replaced and no longer read.
+    sqlite_dir = current_app.config.get('TRANSACTIONS_SQLITE_DIR')
+    if not sqlite_dir:
+        return None
+    name = '{}-{}.sqlite'.format(get_account_name(get_account()), uuid.uuid4().hex)
+    return SQLiteStorage(os.path.join(sqlite_dir, name), delete=True)
+
+
+def parse_transactions(transactions, profile=None, retention=None, backend=None):
+    storage = parse_storage(transactions, profile=profile, retention=retention, storage=backend)
+    if profile is not None:
+        profile.log(logger)
+    return storage
+
+
+def load_storage(stream, mimetype, profile=None, retention=None, backend=None):
+    # Transactions are parsed as they are streamed, either from the "transactions" key
+    # of a json body or from an ndjson body.
+    if mimetype == NDJSON_MIMETYPE:
+        transactions = iter_transactions(stream, ndjson=True)
+    elif stream is not None:
+        buffer = StreamBuffer(stream)
+        # we load the default data if the transactions were not provided.
+        if not buffer.peek():
+            return get_default_storage(retention, backend)
+        transactions = iter_transactions(buffer)
+    else:
+        return get_default_storage(retention, backend)
+
+    try:
+        return parse_transactions(transactions, profile, retention, backend)
+    except KeyError as e:
+        if e.args != (DEFAULT_KEY,):
+            raise BadRequest("The Transactions are not valid")
+        # Transactions are all read before any sequence is added, so the backend is still empty.
+        return get_default_storage(retention, backend)
+    except (TypeError, ValueError):
+        # Bodies that can't be decoded or parsed are rejected, even if some transactions were already parsed.
+        raise BadRequest("The Transactions are not valid")
+
+
+def load_spooled_storage(spool, mimetype, profile=None, retention=None, backend=None):
+    with spool:
+        spool.seek(0)
+        return load_storage(spool, mimetype, profile, retention, backend)
+
+
 @mod_transactions.route('/load', methods=['POST'])
 def load():
-    def get_transactions():
-        with open('./transactions.json', 'r') as file:
-            return json.loads(file.read())
+    mimetype = request.mimetype
+    stream = request.stream if mimetype == NDJSON_MIMETYPE or request.is_json else None
 
-    try:
-        jdata = request.get_json()
-        transactions = jdata['transactions']
-    except (KeyError, BadRequest) as e:
-        # we load the default data if the transactions were not provided.
-        transactions = get_transactions()
+    if request.args.get('async'):
+        # The body is spooled before responding, so the job can stream it after the request is over.
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        if stream is not None:
+            shutil.copyfileobj(stream, spool)
+        with use_state() as state:
+            job = state.submit(load_spooled_storage, spool, mimetype, create_profile(), get_retention(),
+                               create_backend())
+
+        # Accounts given by a header are also given as a parameter, so the Location is enough to find the job.
+        account = get_account()
+        response = jsonify(job.to_dict())
+        response.headers['Location'] = url_for('transactions.get_job', job_id=job.id,
+                                               account=account if account != DEFAULT_ACCOUNT else None)
+        return response, 202
 
-    current_app.storage = parse_storage(transactions)
+    with use_state() as state:
+        state.publish(load_storage(stream, mimetype, create_profile(), get_retention(), create_backend()))
+
+    return make_response('OK'), 200
+
+
+@mod_transactions.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    state = find_state()
+    if state is not None:
+        job = state.get_job(job_id)
+    else:
+        # Jobs submitted by another worker, for an account this one never loaded, are read from the snapshots.
+        snapshot_dir = get_snapshot_dir(current_app, get_account())
+        data = read_job(snapshot_dir, job_id) if snapshot_dir else None
+        job = Job.from_dict(data) if data is not None else None
+    if job is None:
+        raise NotFound("The Job was not found")
+
+    return jsonify(job.to_dict()), 200
+
+
+@mod_transactions.route('/append', methods=['POST'])
+def append():
+    def extend(storage):
+        # Storages restored from a snapshot don't hold their description groups.
+        if not isinstance(storage, SequenceStorage):
+            raise BadRequest("The Storage can't be extended, it should be loaded again")
+
+        # The published storage is never modified, so readers keep a consistent version meanwhile.
+        extended = storage.copy()
+        if request.mimetype == NDJSON_MIMETYPE:
+            extended.extend(iter_transactions(request.stream, ndjson=True))
+        else:
+            extended.extend(iter_transactions(request.stream))
+        return extended
+
+    # Only the description groups the new transactions fall into are parsed again.
+    with use_state() as state:
+        if state.storage is None:
+            raise BadRequest("The Storage was not loaded")
+        try:
+            state.update(extend)
+        except (KeyError, json.JSONDecodeError):
+            raise BadRequest("The Transactions were not provided")
+        except (TypeError, ValueError):
+            raise BadRequest("The Transactions are not valid")
+        except StaleSnapshotError:
+            # Another worker published a newer storage, which this worker doesn't hold.
+            raise Conflict("The Storage was replaced by another worker, it should be loaded again")
 
     return make_response('OK'), 200
 
@@ -42,13 +309,94 @@ def get_sequence():
         raise BadRequest("The Transaction was not provided")
 
     try:
-        storage = current_app.storage
-    except AttributeError:
-        raise BadRequest("The Storage was not loaded")
+        transaction = Transaction(**jtransaction)
+    except (TypeError, ValueError):
+        raise BadRequest("The Transaction is not valid")
+
+    storage = get_reader_storage()
+    body = storage.get_response(transaction)
+
+    # Transactions without a sequence keep the historic "None" response.
+    response = make_response(body if body is not None else str(None))
+    response.mimetype = 'application/json'
+    return response, 200
+
+
+@mod_transactions.route('/get_sequences', methods=['POST'])
+def get_sequences():
+    jdata = request.get_json()
+    try:
+        jtransactions = jdata['transactions']
+        # Only the keys are needed for lookups, so no Transaction is created.
+        keys = [get_transaction_key(jtransaction['date'], jtransaction['description'], jtransaction['amount'])
+                for jtransaction in jtransactions]
+    except (KeyError, TypeError, ValueError):
+        raise BadRequest("The Transactions were not provided")
+
+    storage = get_reader_storage()
+
+    response = make_response(encode_sequences(storage, keys))
+    response.mimetype = 'application/json'
+    return response, 200
+
+
+@mod_transactions.route('/export', methods=['GET'])
+def export():
+    storage = get_reader_storage()
+
+    # Sequences are encoded as the response is written, one per line, so the response is never held in memory.
+    return Response(iter_ndjson(storage), mimetype=NDJSON_MIMETYPE)
+
+
+@mod_transactions.route('/sequences', methods=['GET'])
+def query_sequences():
+    # Sequences are queried either by a date range or by an interval, through the indexes of the storage.
+    args = request.args
+    try:
+        if 'interval' in args:
+            # Both kinds of queries can't be combined, so none of them is silently dropped.
+            if 'from' in args or 'to' in args or 'by' in args:
+                raise ValueError('interval')
+            interval = int(args['interval'])
+            margin = int(args.get('margin', DEFAULT_MARGIN))
+            query = None
+        else:
+            if 'margin' in args:
+                raise ValueError('margin')
+            start, end = parse_date(args['from']), parse_date(args['to'])
+            query = args.get('by', 'active')
+            if query not in DATE_QUERIES:
+                raise ValueError(query)
+    except (KeyError, ValueError):
+        raise BadRequest("Either a date range or an interval should be provided, but not both")
+
+    storage = get_reader_storage()
+    index = get_state().get_index(storage)
+
+    if query is None:
+        sequences = index.get_by_interval(interval, margin)
+    elif query == 'first':
+        sequences = index.get_started(start, end)
+    elif query == 'last':
+        sequences = index.get_ended(start, end)
+    else:
+        sequences = index.get_active(start, end)
+
+    response = make_response(encode_sequence_list(sequences))
+    response.mimetype = 'application/json'
+    return response, 200
+
+
+@mod_transactions.route('/upcoming', methods=['GET'])
+def upcoming():
+    # The next transaction of every sequence is forecast when its storage is loaded, so only the range is searched.
+    try:
+        start, end = parse_date(request.args['from']), parse_date(request.args['to'])
+    except (KeyError, ValueError):
+        raise BadRequest("A date range should be provided")
 
-    transaction = Transaction(**jtransaction)
-    sequence = storage.get_sequence(transaction)
+    index = get_state().get_index(get_reader_storage())
 
-    response = make_response(str(sequence))
+    response = make_response(encode_upcoming(index.get_upcoming(start, end), index.margin))
     response.mimetype = 'application/json'
     return response, 200
@@ -1,10 +1,24 @@
 """
 Pretty simple comparison algorithm for strings, lists and sentences in general.
 We could improve this project's performance by leveraging specialized libraries instead.
+
+Sentences are split into interned word tuples only once, and similarity ratios between those tuples are memoized,
+since transaction feeds repeat the same descriptions over and over. Both caches are bounded, so a long-lived process
+doesn't hold every description it has ever seen.
+Large blocks of word tuples can also be encoded as word id matrices, and compared to a single tuple at once.
 """
+from functools import lru_cache
+import sys
+
+import numpy as np
 
 
 DEFAULT_SPLITTERS = ['--', '*']
+SIMILARITY_CACHE_SIZE = 2 ** 16
+TOKEN_CACHE_SIZE = 2 ** 16
+
+_sentence_tokens = {}
+_interned_tokens = {}
 
 
 def compare_iterables(iterable_a, iterable_b):
@@ -29,6 +43,64 @@ def compare_iterables(iterable_a, iterable_b):
     return ratio
 
 
+def split_sentence(sentence, extra_splits=DEFAULT_SPLITTERS):
+    """
+    Splits a sentence into a list of words, considering whitespaces and the provided splitters.
+    Splitters are replaced in the order they are provided.
+
+    :param sentence: Sentence to be split.
+    :param extra_splits: List of strings other than whitespaces to be considered as splitters.
+    :return: List of words in the sentence.
+    """
+    for chars in extra_splits:
+        sentence = sentence.replace(chars, ' ')
+    return sentence.split()
+
+
+def tokenize(sentence, extra_splits=DEFAULT_SPLITTERS):
+    """
+    Splits a sentence into an interned tuple of words. Each distinct sentence is split only once, and sentences
+    with the same words share the same tuple, until the caches are full and start over.
+
+    :param sentence: Sentence to be split.
+    :param extra_splits: List of strings other than whitespaces to be considered as splitters.
+    :return: Tuple of words in the sentence.
+    """
+    cache = _sentence_tokens.get(tuple(extra_splits))
+    if cache is None:
+        cache = _sentence_tokens.setdefault(tuple(extra_splits), {})
+
+    tokens = cache.get(sentence)
+    if tokens is None:
+        tokens = tuple(sys.intern(word) for word in split_sentence(sentence, extra_splits))
+        if len(_interned_tokens) >= TOKEN_CACHE_SIZE:
+            _interned_tokens.clear()
+        tokens = _interned_tokens.setdefault(tokens, tokens)
+        if len(cache) >= TOKEN_CACHE_SIZE:
+            cache.clear()
+        cache[sentence] = tokens
+    return tokens
+
+
+@lru_cache(maxsize=SIMILARITY_CACHE_SIZE)
+def _compare_tokens(tokens_a, tokens_b):
+    return compare_iterables(tokens_a, tokens_b)
+
+
+def compare_tokens(tokens_a, tokens_b):
+    """
+    Compares 2 word tuples returned by tokenize. Their similarity ratios are memoized, in either order.
+
+    :param tokens_a: Word tuple for comparison.
+    :param tokens_b: Word tuple for comparison.
+    :return: A similarity ratio, ranging from 0 to 1.
+    """
+    # Interned tuples are ordered by their ids, which is cheaper than comparing them.
+    if id(tokens_a) > id(tokens_b):
+        tokens_a, tokens_b = tokens_b, tokens_a
+    return _compare_tokens(tokens_a, tokens_b)
+
+
 def compare_sentences(sentence_a, sentence_b, extra_splits=DEFAULT_SPLITTERS):
     """
     Compares 2 sentences, splitting both into lists and then comparing each of their values.
@@ -38,13 +110,78 @@ def compare_sentences(sentence_a, sentence_b, extra_splits=DEFAULT_SPLITTERS):
     :param extra_splits: List of strings other than whitespaces to be considered as splitters.
     :return: A similarity ratio, ranging from 0 to 1.
     """
+    return compare_tokens(tokenize(sentence_a, extra_splits), tokenize(sentence_b, extra_splits))
+
+
+class TokenMatrix:
+    """
+    A block of word tuples, encoded as a matrix of word ids with a row for each tuple.
+    Rows are padded with -1 past the tuple's length, which never matches a word.
+    Word ids are only meaningful within the matrix, so each matrix holds its own word table,
+    which is released along with it.
+    """
+
+    __slots__ = ('ids', 'lengths', 'word_ids')
+
+    def __init__(self, ids, lengths, word_ids):
+        self.ids = ids
+        self.lengths = lengths
+        self.word_ids = word_ids
+
+    def take(self, positions):
+        """
+        Returns the matrix of a subset of the rows.
+
+        :param positions: Sequence of row positions.
+        :return: TokenMatrix
+        """
+        return TokenMatrix(self.ids[positions], self.lengths[positions], self.word_ids)
+
+    def __len__(self):
+        return len(self.lengths)
+
+
+def encode_tokens(token_tuples):
+    """
+    Encodes a list of word tuples as a TokenMatrix. Each distinct tuple is only encoded once.
+
+    :param token_tuples: List of word tuples, such as the ones returned by tokenize.
+    :return: TokenMatrix
+    """
+    distinct = {}
+    word_ids = {}
+    rows = np.fromiter((distinct.setdefault(tokens, len(distinct)) for tokens in token_tuples),
+                       dtype=np.int64, count=len(token_tuples))
+
+    width = max((len(tokens) for tokens in distinct), default=0)
+    ids = np.full((len(distinct), width), -1, dtype=np.int32)
+    lengths = np.zeros(len(distinct), dtype=np.int64)
+    for row, tokens in enumerate(distinct):
+        ids[row, :len(tokens)] = [word_ids.setdefault(word, len(word_ids)) for word in tokens]
+        lengths[row] = len(tokens)
+
+    return TokenMatrix(ids[rows], lengths[rows], word_ids)
+
+
+def compare_many(seed, candidates):
+    """
+    Compares a word tuple to a whole block of candidates at once, with the same results as calling
+    compare_iterables for each candidate.
+
+    :param seed: Word tuple for comparison.
+    :param candidates: TokenMatrix, or list of word tuples, to be compared to the seed.
+    :raise ZeroDivisionError: If the seed or any of the candidates is empty, just like compare_iterables.
+    :return: Array of similarity ratios, ranging from 0 to 1, one for each candidate.
+    """
+    if not isinstance(candidates, TokenMatrix):
+        candidates = encode_tokens(candidates)
 
-    def split_sentence(sentence):
-        reworked_sentence = sentence.strip()
-        for chars in extra_splits:
-            reworked_sentence = reworked_sentence.replace(chars, ' ')
-        return reworked_sentence.split()
+    width = min(len(seed), candidates.ids.shape[1])
+    # Words missing from the candidates' word table can't match any candidate.
+    seed_ids = np.array([candidates.word_ids.get(word, -2) for word in seed[:width]], dtype=np.int32)
+    matches = np.count_nonzero(candidates.ids[:, :width] == seed_ids, axis=1)
 
-    reworked_a = split_sentence(sentence_a)
-    reworked_b = split_sentence(sentence_b)
-    return compare_iterables(reworked_a, reworked_b)
+    lengths = np.minimum(candidates.lengths, len(seed))
+    if not lengths.all():
+        raise ZeroDivisionError('division by zero')
+    return matches / lengths
@@ -0,0 +1,65 @@
+"""
+Fast parsing for the MM/DD/YYYY dates used by transactions.
+Dates in the canonical format are parsed without strptime, and every parsed string is memoized,
+since a year of transactions has at most 366 distinct dates.
+Anything outside of the canonical format falls back to strptime, so the same inputs are accepted and rejected.
+"""
+from array import array
+import datetime
+import re
+
+
+DATE_FORMAT = '%m/%d/%Y'
+DATE_CACHE_SIZE = 2 ** 16
+
+_date_pattern = re.compile(r'(\d\d)/(\d\d)/(\d\d\d\d)', re.ASCII)
+_dates = {}
+
+
+def parse_date(date):
+    """
+    Parses a MM/DD/YYYY date, just like datetime.strptime(date, '%m/%d/%Y').
+
+    :param date: Date string to be parsed.
+    :return: A datetime at midnight of the date.
+    """
+    parsed = _dates.get(date)
+    if parsed is None:
+        match = _date_pattern.fullmatch(date) if isinstance(date, str) else None
+        if match:
+            month, day, year = match.groups()
+            parsed = datetime.datetime(int(year), int(month), int(day))
+        else:
+            parsed = datetime.datetime.strptime(date, DATE_FORMAT)
+
+        if len(_dates) >= DATE_CACHE_SIZE:
+            _dates.clear()
+        _dates[date] = parsed
+    return parsed
+
+
+def parse_ordinal(date):
+    """
+    Parses a MM/DD/YYYY date into its ordinal.
+
+    :param date: Date string to be parsed.
+    :return: The date's proleptic Gregorian ordinal.
+    """
+    return parse_date(date).toordinal()
+
+
+def parse_ordinals(dates):
+    """
+    Parses a whole column of MM/DD/YYYY dates into ordinals. Each distinct date is only parsed once.
+
+    :param dates: Iterable of date strings.
+    :return: An array of ordinals.
+    """
+    ordinals = {}
+    column = array('i')
+    for date in dates:
+        ordinal = ordinals.get(date)
+        if ordinal is None:
+            ordinal = ordinals[date] = parse_ordinal(date)
+        column.append(ordinal)
+    return column
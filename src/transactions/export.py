@@ -0,0 +1,52 @@
+"""
+Streaming export of a storage as newline delimited JSON, with one sequence per line.
+Sequences are encoded as they are written, so memory use doesn't grow with the size of the storage.
+"""
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+def encode_sequence(sequence):
+    # Cached encodings are reused, but new ones aren't cached, so exporting doesn't keep every encoding around.
+    if sequence.encoded is not None:
+        return sequence.encoded
+    return str(sequence).encode('utf-8')
+
+
+def iter_ndjson(storage, chunk_size=CHUNK_SIZE):
+    """
+    Yields a storage's sequences as newline delimited JSON, in chunks of about chunk_size bytes.
+    The first sequence is yielded on its own, so writing can start right away.
+
+    :param storage: Any storage providing iter_sequences, such as a SequenceStorage.
+    :param chunk_size: Size of the chunks, in bytes.
+    """
+    buffer = []
+    size = 0
+    first = True
+    for sequence in storage.iter_sequences():
+        line = encode_sequence(sequence)
+        buffer.append(line)
+        buffer.append(b'\n')
+        size += len(line) + 1
+        if first or size >= chunk_size:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+            first = False
+
+    if buffer:
+        yield b''.join(buffer)
+
+
+def write_ndjson(storage, file, chunk_size=CHUNK_SIZE):
+    """
+    Writes a storage's sequences to a binary file as newline delimited JSON.
+
+    :param storage: Any storage providing iter_sequences, such as a SequenceStorage.
+    :param file: Binary file to be written to.
+    :param chunk_size: Size of the chunks written at a time, in bytes.
+    """
+    for chunk in iter_ndjson(storage, chunk_size):
+        file.write(chunk)
@@ -0,0 +1,184 @@
+"""
+Interval-histogram engine for parsing sequences, an alternative to parser.parse_sequences for large groups.
+
+Instead of evaluating every pair of transactions in Python, the group's dates are turned into an ordinal array,
+pairwise day deltas are counted in vectorized blocks, and candidate intervals are taken from the peaks of the
+delta histogram, considering the margin. Transactions are then chained for each candidate interval, and only
+the accepted chains are turned into TransactionSequence objects.
+"""
+import numpy as np
+
+from src.transactions.models import TransactionSequence
+from src.transactions.parser import MINIMUM_TRANSACTIONS, MINIMUM_INTERVAL, DEFAULT_MARGIN
+
+
+BLOCK_SIZE = 256
+NEAR_SUPPORT_RATIO = 0.5
+
+
+def get_delta_histogram(ordinals, max_interval):
+    """
+    Counts the day deltas between every pair of transactions, up to a maximum interval.
+
+    :param ordinals: Sorted array of date ordinals.
+    :param max_interval: Longest delta to be counted.
+    :return: Array of pair counts, indexed by delta.
+    """
+    histogram = np.zeros(max_interval + 1, dtype=np.int64)
+
+    for start in range(0, len(ordinals), BLOCK_SIZE):
+        block = ordinals[start:start + BLOCK_SIZE]
+        # Since ordinals are sorted, only the following transactions within max_interval days can be counted.
+        end = np.searchsorted(ordinals, block[-1] + max_interval, side='right')
+        deltas = ordinals[np.newaxis, start:end] - block[:, np.newaxis]
+        deltas = deltas[(deltas >= MINIMUM_INTERVAL) & (deltas <= max_interval)]
+        histogram += np.bincount(deltas, minlength=max_interval + 1)
+
+    return histogram
+
+
+def get_candidate_intervals(histogram, margin):
+    """
+    Finds candidate intervals from a delta histogram. Each interval is supported by the pairs whose delta
+    falls within its margin, and intervals are picked by decreasing support, and then by their own pair count,
+    skipping those within the margin of an interval already picked.
+
+    Multiples of an interval are supported by about as many pairs as the interval itself, and with jittered dates
+    either may come first. So before an interval is picked, a divisor of it with a near-equal support is picked
+    instead, leaving the interval itself to the transactions the divisor doesn't chain.
+
+    :param histogram: Array of pair counts, indexed by delta.
+    :param margin: Acceptable margin for the interval rule.
+    :return: List of candidate intervals.
+    """
+    padded = np.concatenate([np.zeros(margin + 1, dtype=np.int64), histogram, np.zeros(margin, dtype=np.int64)])
+    cumulative = np.cumsum(padded)
+    support = cumulative[2 * margin + 1:] - cumulative[:-(2 * margin + 1)]
+
+    intervals = np.arange(len(support))
+    valid = (intervals >= MINIMUM_INTERVAL) & (support >= MINIMUM_TRANSACTIONS - 1)
+    intervals = intervals[valid]
+    intervals = intervals[np.lexsort((intervals, -histogram[valid], -support[valid]))]
+    supports = dict(zip(intervals.tolist(), support[intervals].tolist()))
+
+    picked = []
+    blocked = bytearray(len(support) + margin)
+
+    def get_divisor(interval):
+        # Smaller divisors are tried first. Among the divisors for the same multiple, they are ranked like intervals.
+        for multiple in range(interval // MINIMUM_INTERVAL, 1, -1):
+            divisors = [divisor for divisor in range(-(-(interval - margin) // multiple),
+                                                     (interval + margin) // multiple + 1)
+                        if divisor in supports and not blocked[divisor]]
+            if divisors:
+                divisor = max(divisors, key=lambda divisor: (supports[divisor], histogram[divisor], -divisor))
+                if supports[divisor] >= NEAR_SUPPORT_RATIO * supports[interval]:
+                    return divisor
+        return None
+
+    for interval in intervals.tolist():
+        while not blocked[interval]:
+            chosen = get_divisor(interval) or interval
+            picked.append(chosen)
+            for neighbour in range(max(chosen - margin, 0), chosen + margin + 1):
+                blocked[neighbour] = 1
+    return picked
+
+
+def get_chains(ordinals, interval, margin):
+    """
+    Chains transactions that follow each other within the interval's margin. Each transaction points to the one
+    closest to a full interval after it, and each transaction is preceded by at most one other.
+
+    :param ordinals: Sorted array of date ordinals.
+    :param interval: Expected interval between transactions.
+    :param margin: Acceptable margin for the interval rule.
+    :return: Array with the position of each transaction's chain head, in the ordinals array.
+    """
+    size = len(ordinals)
+    positions = np.arange(size)
+    low = max(interval - margin, MINIMUM_INTERVAL)
+    high = interval + margin
+
+    after = np.searchsorted(ordinals, ordinals + interval, side='left')
+    before = after - 1
+    after_gap = ordinals[np.minimum(after, size - 1)] - ordinals
+    before_gap = ordinals[before] - ordinals
+    after_valid = (after < size) & (after_gap >= low) & (after_gap <= high)
+    before_valid = (before > positions) & (before_gap >= low) & (before_gap <= high)
+
+    # Ties favor the earlier transaction.
+    use_before = before_valid & (~after_valid | (interval - before_gap <= after_gap - interval))
+    following = np.where(use_before, before, np.where(after_valid, after, -1))
+
+    # A transaction followed by more than one keeps the one closest to a full interval before it.
+    linked = positions[following >= 0]
+    targets = following[linked]
+    deviations = np.abs(ordinals[targets] - ordinals[linked] - interval)
+    by_target = np.lexsort((linked, deviations, targets))
+    first = np.ones(len(by_target), dtype=bool)
+    first[1:] = targets[by_target][1:] != targets[by_target][:-1]
+    previous = np.full(size, size, dtype=np.int64)
+    previous[targets[by_target][first]] = linked[by_target][first]
+
+    heads = np.where(previous < size, previous, positions)
+    while True:
+        next_heads = heads[heads]
+        if np.array_equal(next_heads, heads):
+            return heads
+        heads = next_heads
+
+
+def parse_sequences_histogram(transaction_list, margin=DEFAULT_MARGIN):
+    """
+    Given a list of transactions with similar descriptions, find sequences that respect
+    the interval rule, using an interval histogram instead of evaluating every pair in Python.
+
+    :param transaction_list: List of transactions with similar descriptions.
+    :param margin: Acceptable margin for the interval rule.
+    :return: List of valid sequences, sorted by their first transaction.
+    """
+    transactions = [transaction for transaction in transaction_list
+                    if not transaction.sequence]                                    # Single-sequence evaluation
+    if len(transactions) < MINIMUM_TRANSACTIONS:
+        return []
+
+    ordinals = np.fromiter((transaction.date.toordinal() for transaction in transactions),
+                           dtype=np.int64, count=len(transactions))
+    order = np.argsort(ordinals, kind='stable')
+    ordinals = ordinals[order]
+
+    span = int(ordinals[-1] - ordinals[0])
+    max_interval = span // (MINIMUM_TRANSACTIONS - 1) + margin
+    if max_interval < MINIMUM_INTERVAL:
+        return []
+
+    chains = []
+    for interval in get_candidate_intervals(get_delta_histogram(ordinals, max_interval), margin):
+        if len(order) < MINIMUM_TRANSACTIONS:
+            break
+
+        heads = get_chains(ordinals, interval, margin)
+        lengths = np.bincount(heads, minlength=len(heads))
+        accepted = lengths[heads] >= MINIMUM_TRANSACTIONS       # Minimum transactions evaluation
+        if not accepted.any():
+            continue
+
+        accepted_heads = heads[accepted]
+        by_head = np.argsort(accepted_heads, kind='stable')
+        boundaries = np.flatnonzero(np.diff(accepted_heads[by_head])) + 1
+        for members in np.split(order[accepted][by_head], boundaries):
+            chains.append((interval, members.tolist()))
+
+        order = order[~accepted]
+        ordinals = ordinals[~accepted]
+
+    sequences = []
+    chains.sort(key=lambda chain: (transactions[chain[1][0]].date, chain[1][0]))
+    for interval, members in chains:
+        sequence = TransactionSequence(interval=interval)
+        sequence.add_transactions([transactions[position] for position in members],
+                                  margin=margin, set_ownership=True)
+        sequences.append(sequence)
+
+    return sequences
@@ -0,0 +1,126 @@
+"""
+Secondary indexes over the sequences of a storage, for queries that a lookup by transaction can't answer.
+
+Storages map each transaction key to its sequence, so finding sequences by date or by interval would mean going
+through every transaction. A SequenceIndex lists each sequence once, sorted by its first date and by its last date,
+and grouped by interval, so those queries are answered with bisect in O(log n + results).
+
+It also forecasts each sequence's next transaction, expected one interval after its last one, within the margin.
+Sequences are sorted by that date too, so upcoming transactions within a date range are found the same way.
+"""
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+import datetime
+
+from src.transactions.parser import DEFAULT_MARGIN
+
+
+def sort_sequences(sequences, ordinals):
+    order = sorted(range(len(sequences)), key=ordinals.__getitem__)
+    return [ordinals[number] for number in order], [sequences[number] for number in order]
+
+
+class SequenceIndex:
+    """
+    Sequences sorted by their first, last and next expected dates, and grouped by interval.
+    Indexes are built once, for storages that are never modified after being published.
+
+    :param sequences: Iterable of sequences, each listed once.
+    :param margin: Acceptable margin around the next expected dates.
+    """
+
+    def __init__(self, sequences, margin=DEFAULT_MARGIN):
+        sequences = list(sequences)
+        firsts = [sequence.get_first_transaction().date.toordinal() for sequence in sequences]
+        lasts = [sequence.get_last_transaction().date.toordinal() for sequence in sequences]
+        self.margin = margin
+        self.first_ordinals, self.by_first = sort_sequences(sequences, firsts)
+        self.last_ordinals, self.by_last = sort_sequences(sequences, lasts)
+        self.expected_ordinals, self.by_expected = sort_sequences(
+            sequences, [last + sequence.interval for last, sequence in zip(lasts, sequences)])
+
+        intervals = defaultdict(list)
+        for sequence in self.by_first:
+            intervals[sequence.interval].append(sequence)
+        self.intervals = sorted(intervals)
+        self.by_interval = [intervals[interval] for interval in self.intervals]
+
+    @classmethod
+    def from_storage(cls, storage):
+        """
+        Builds the indexes of a storage.
+
+        :param storage: Any storage implementing iter_sequences.
+        :return: SequenceIndex
+        """
+        return cls(storage.iter_sequences())
+
+    def get_started(self, start, end):
+        """
+        Returns the sequences whose first transaction is within a date range.
+
+        :param start: First datetime of the range.
+        :param end: Last datetime of the range.
+        :return: List of sequences, sorted by their first date.
+        """
+        return self.by_first[bisect_left(self.first_ordinals, start.toordinal()):
+                             bisect_right(self.first_ordinals, end.toordinal())]
+
+    def get_ended(self, start, end):
+        """
+        Returns the sequences whose last transaction is within a date range.
+
+        :param start: First datetime of the range.
+        :param end: Last datetime of the range.
+        :return: List of sequences, sorted by their last date.
+        """
+        return self.by_last[bisect_left(self.last_ordinals, start.toordinal()):
+                            bisect_right(self.last_ordinals, end.toordinal())]
+
+    def get_active(self, start, end):
+        """
+        Returns the sequences active within a date range: those starting before its end and ending after its start.
+        Only one of the two conditions can be answered by bisect, so the shorter of the two candidate lists
+        is filtered by the other.
+
+        :param start: First datetime of the range.
+        :param end: Last datetime of the range.
+        :return: List of sequences, sorted by their first or last date.
+        """
+        start, end = start.toordinal(), end.toordinal()
+        started = bisect_right(self.first_ordinals, end)
+        ended = bisect_left(self.last_ordinals, start)
+        if started <= len(self.by_last) - ended:
+            return [sequence for sequence in self.by_first[:started]
+                    if sequence.get_last_transaction().date.toordinal() >= start]
+        return [sequence for sequence in self.by_last[ended:]
+                if sequence.get_first_transaction().date.toordinal() <= end]
+
+    def get_by_interval(self, interval, margin=DEFAULT_MARGIN):
+        """
+        Returns the sequences whose interval is within a margin of a given one.
+
+        :param interval: Interval in days.
+        :param margin: Acceptable distance from the interval.
+        :return: List of sequences, by interval and then by first date.
+        """
+        numbers = range(bisect_left(self.intervals, interval - margin),
+                        bisect_right(self.intervals, interval + margin))
+        return [sequence for number in numbers for sequence in self.by_interval[number]]
+
+    def get_upcoming(self, start, end):
+        """
+        Returns the sequences whose next transaction may happen within a date range,
+        that is, whose next expected date is within the margin of the range.
+
+        :param start: First datetime of the range.
+        :param end: Last datetime of the range.
+        :return: List of (expected datetime, sequence) tuples, sorted by expected date.
+        """
+        first = bisect_left(self.expected_ordinals, start.toordinal() - self.margin)
+        last = bisect_right(self.expected_ordinals, end.toordinal() + self.margin)
+        return [(datetime.datetime.fromordinal(ordinal), sequence)
+                for ordinal, sequence in zip(self.expected_ordinals[first:last], self.by_expected[first:last])]
+
+    def __len__(self):
+        return len(self.by_first)
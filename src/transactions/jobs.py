@@ -0,0 +1,208 @@
+"""
+Shared state for the transactions API: the published storage, and the background jobs building new ones.
+Storages are never modified after being published. Writers build a new version and publish it with a single
+reference swap, so readers always see one complete storage.
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import uuid
+
+from src.transactions.backends import StorageBackend
+from src.transactions.indexes import SequenceIndex
+from src.transactions.snapshot import StaleSnapshotError, read_job
+
+
+MAX_JOBS = 100
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class Job:
+    """
+    A background job building a new storage.
+    """
+
+    __slots__ = ('id', 'status', 'error', 'version', 'created', 'finished')
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = PENDING
+        self.error = None
+        self.version = None
+        self.created = time.time()
+        self.finished = None
+
+    def to_dict(self):
+        return dict(id=self.id,
+                    status=self.status,
+                    error=self.error,
+                    version=self.version,
+                    created=self.created,
+                    finished=self.finished)
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Rebuilds a job from its dict format, as returned by to_dict.
+
+        :param data: The job in a dict format.
+        :return: Job
+        """
+        job = cls()
+        for name in cls.__slots__:
+            setattr(job, name, data[name])
+        return job
+
+
+class StorageState:
+    """
+    Holds the storage currently published by an app, along with its version number.
+    Writers are serialized by a lock, while readers just take a reference to the current storage.
+    When snapshots are provided, every published storage is also written to them, for other processes to read,
+    along with the status of every job.
+    An executor can be shared by several states, so they don't each hold their own threads.
+    When indexed, the secondary indexes of every published storage are built along with it, except for storage
+    backends, whose indexes are only built on first use, since they hold every sequence in memory.
+    An on_swap function can be set, receiving every storage after it is published.
+    """
+
+    def __init__(self, max_workers=1, snapshots=None, executor=None, indexed=False):
+        self.storage = None
+        self.index = None
+        self.indexed = indexed
+        self.snapshots = snapshots
+        self.version = 0
+        self.lock = threading.Lock()
+        self.executor = executor or ThreadPoolExecutor(max_workers=max_workers)
+        self.jobs = OrderedDict()
+        self.users = 0
+        self.on_swap = None
+
+    def publish(self, storage):
+        """
+        Publishes a new storage, replacing the current one.
+
+        :param storage: Storage to be published.
+        :return: The published version number.
+        """
+        with self.lock:
+            return self.swap(storage)
+
+    def swap(self, storage, check=False):
+        """
+        Publishes a new storage, when the writer lock is already held.
+
+        :param storage: Storage to be published.
+        :param check: Indicates whether the storage was built from the current one, which should still be
+                      the current snapshot.
+        :raise StaleSnapshotError: If checking, and another process published a newer snapshot.
+        :return: The published version number.
+        """
+        if self.snapshots is not None:
+            self.snapshots.publish(storage, check)
+        # The index is set first, so readers finding the new storage also find its index.
+        if self.indexed and storage is not None and not isinstance(storage, StorageBackend):
+            self.index = (storage, SequenceIndex.from_storage(storage))
+        else:
+            # The previous storage's index is dropped, so it doesn't keep that storage alive.
+            self.index = None
+        self.version += 1
+        self.storage = storage
+        if self.on_swap is not None:
+            self.on_swap(storage)
+        return self.version
+
+    def get_index(self, storage):
+        """
+        Returns the secondary indexes of a storage. Published storages of an indexed state are indexed as they are
+        published, while other storages, such as snapshots published by other processes, are indexed on first use.
+
+        :param storage: The storage being read.
+        :return: SequenceIndex
+        """
+        index = self.index
+        if index is None or index[0] is not storage:
+            index = self.index = (storage, SequenceIndex.from_storage(storage))
+        return index[1]
+
+    def update(self, function):
+        """
+        Publishes a new storage built from the current one, holding the writer lock so no other
+        version is published in between.
+
+        With snapshots, the current storage should also be the current snapshot, or it would replace a newer
+        snapshot published by another process.
+
+        :param function: Function receiving the current storage and returning the new one.
+        :raise StaleSnapshotError: If another process published a newer snapshot.
+        :return: The published version number.
+        """
+        with self.lock:
+            if self.snapshots is not None and self.snapshots.is_stale():
+                raise StaleSnapshotError("Another process published a newer snapshot")
+            return self.swap(function(self.storage), check=True)
+
+    def submit(self, function, *args):
+        """
+        Runs a function returning a new storage on the background executor, and publishes its result.
+
+        :param function: Function returning the storage to be published.
+        :param args: Arguments to the function.
+        :return: The Job tracking the function.
+        """
+        job = Job()
+        self.save_job(job)
+        with self.lock:
+            self.jobs[job.id] = job
+            while len(self.jobs) > MAX_JOBS:
+                oldest = next(iter(self.jobs.values()))
+                if oldest.status not in (DONE, FAILED):
+                    break
+                self.jobs.popitem(last=False)
+
+        def run():
+            job.status = RUNNING
+            try:
+                self.save_job(job)
+                job.version = self.publish(function(*args))
+                job.status = DONE
+            except Exception as e:
+                job.error = str(e) or type(e).__name__
+                job.status = FAILED
+            finally:
+                job.finished = time.time()
+                self.save_job(job)
+
+        self.executor.submit(run)
+        return job
+
+    def is_busy(self):
+        """
+        Indicates whether the state is in use by a request publishing a storage,
+        or any of its jobs is still pending or running.
+        """
+        return self.users > 0 or any(job.status in (PENDING, RUNNING) for job in self.jobs.values())
+
+    def save_job(self, job):
+        # With snapshots, job statuses are shared with the other processes, which may be asked for them.
+        if self.snapshots is not None:
+            self.snapshots.write_job(job.to_dict())
+
+    def get_job(self, job_id):
+        """
+        Returns a job by its id, either submitted by this state or, with snapshots, by another process.
+
+        :param job_id: Id of the job.
+        :return: The Job, or None if it is unknown.
+        """
+        job = self.jobs.get(job_id)
+        if job is None and self.snapshots is not None:
+            data = read_job(self.snapshots.path, job_id)
+            if data is not None:
+                job = Job.from_dict(data)
+        return job
@@ -0,0 +1,152 @@
+"""
+Streaming readers for transaction payloads.
+Transactions are decoded one by one from a file or request stream, which is read in fixed-size chunks,
+so the raw payload never has to be held in memory as a whole.
+"""
+import codecs
+import json
+import re
+
+
+READ_SIZE = 64 * 1024
+DEFAULT_KEY = 'transactions'
+
+_whitespace = re.compile(r'[ \t\n\r]*')
+_decoder = json.JSONDecoder()
+
+
+class StreamBuffer:
+    """
+    A window over a text or binary stream, which is refilled as JSON values are decoded from it.
+    Binary streams are decoded as UTF-8.
+    """
+
+    def __init__(self, stream, read_size=READ_SIZE):
+        self.stream = stream
+        self.read_size = read_size
+        self.text = ''
+        self.position = 0
+        self.eof = False
+        self.decoder = None
+
+    def read(self):
+        """
+        Reads the next chunk from the stream, dropping the text that was already consumed.
+        """
+        data = self.stream.read(self.read_size)
+        if not data:
+            self.eof = True
+        if isinstance(data, bytes):
+            if self.decoder is None:
+                self.decoder = codecs.getincrementaldecoder('utf-8')()
+            data = self.decoder.decode(data, final=self.eof)
+
+        self.text = self.text[self.position:] + data
+        self.position = 0
+
+    def peek(self):
+        """
+        Skips whitespaces, returning the next character, or an empty string at the end of the stream.
+        """
+        while True:
+            self.position = _whitespace.match(self.text, self.position).end()
+            if self.position < len(self.text):
+                return self.text[self.position]
+            if self.eof:
+                return ''
+            self.read()
+
+    def expect(self, chars):
+        """
+        Consumes the next character, which should be one of the provided ones.
+
+        :param chars: String of accepted characters.
+        :return: The consumed character.
+        """
+        char = self.peek()
+        if not char or char not in chars:
+            raise json.JSONDecodeError('Expecting one of {!r}'.format(chars), self.text, self.position)
+        self.position += 1
+        return char
+
+    def decode(self):
+        """
+        Decodes the next JSON value, reading more of the stream until the value is complete.
+
+        :return: The decoded value.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.position)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            else:
+                # A number at the end of the window could still continue in the next chunk.
+                if end < len(self.text) or self.eof:
+                    self.position = end
+                    return value
+            self.read()
+
+
+def iter_array(buffer):
+    """
+    Yields the values of a JSON array, whose opening bracket was already consumed.
+
+    :param buffer: StreamBuffer positioned inside the array.
+    """
+    if buffer.peek() == ']':
+        buffer.position += 1
+        return
+
+    while True:
+        yield buffer.decode()
+        if buffer.expect(',]') == ']':
+            return
+
+
+def iter_transactions(stream, key=DEFAULT_KEY, ndjson=False, read_size=READ_SIZE):
+    """
+    Yields transactions in a dict format from a stream, as they are decoded.
+    The stream may contain a JSON array of transactions, an object holding that array under the provided key,
+    or, when ndjson is set, one transaction per line.
+
+    :param stream: Text or binary stream, such as a file or a request stream, or a StreamBuffer reading one.
+    :param key: Key of the transactions array, when the stream contains an object.
+    :param ndjson: Indicates whether the stream contains newline delimited JSON.
+    :param read_size: Size of the chunks read from the stream.
+    :raise json.JSONDecodeError: If the stream does not contain valid JSON, or the key does not hold an array.
+    :raise KeyError: If the stream contains an object without the provided key.
+    """
+    buffer = stream if isinstance(stream, StreamBuffer) else StreamBuffer(stream, read_size)
+
+    if ndjson:
+        while buffer.peek():
+            yield buffer.decode()
+        return
+
+    if buffer.expect('[{') == '[':
+        yield from iter_array(buffer)
+        return
+
+    found = False
+    if buffer.peek() == '}':
+        buffer.position += 1
+    else:
+        while True:
+            name = buffer.decode()
+            if not isinstance(name, str):
+                raise json.JSONDecodeError('Expecting property name', buffer.text, buffer.position)
+            buffer.expect(':')
+            if name == key and not found:
+                buffer.expect('[')
+                found = True
+                yield from iter_array(buffer)
+            else:
+                buffer.decode()
+            if buffer.expect(',}') == '}':
+                break
+
+    if not found:
+        raise KeyError(key)
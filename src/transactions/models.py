@@ -1,25 +1,121 @@
 """
 Class representations of our key entities
 """
+import heapq
 import json
-from collections import OrderedDict
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, defaultdict, deque
+from decimal import Decimal, InvalidOperation
+from hashlib import blake2b
 
-from src.transactions.comparison import compare_sentences
+import numpy as np
+
+from src.transactions.comparison import compare_sentences, tokenize
+from src.transactions.dates import parse_date, parse_ordinal
 import datetime
 
 
+def to_cents(amount):
+    """
+    Converts an amount, either a number or a numeric string, to its exact amount of cents.
+    Amounts are keyed by their cents, so they are never rounded, which would give different transactions the same key.
+
+    :param amount: Amount to be converted.
+    :raise ValueError: If the amount isn't a finite number.
+    :return: The amount in cents, as an integer, or as a normalized Decimal for amounts with a fraction of a cent.
+    """
+    if type(amount) is int:
+        return amount * 100
+
+    # Floats are converted through their shortest representation, which is the one they were decoded from.
+    try:
+        cents = Decimal(str(amount)) * 100
+    except InvalidOperation:
+        raise ValueError('Invalid amount: {!r}'.format(amount))
+    if not cents.is_finite():
+        raise ValueError('Invalid amount: {!r}'.format(amount))
+    if cents == cents.to_integral_value():
+        return int(cents)
+    # Normalizing drops trailing zeros, so equal amounts share the same key however they are written.
+    return cents.normalize()
+
+
+def get_key(ordinal, description, cents):
+    """
+    Generates a stable key from a transaction's contents. Transactions with the same date, description and amount
+    share the same key, which is also the same across processes.
+
+    :param ordinal: The transaction's date ordinal.
+    :param description: The transaction's description.
+    :param cents: The transaction's amount in cents.
+    :return: A signed 64-bit integer key.
+    """
+    content = '{}:{}:{}'.format(ordinal, cents, description).encode('utf-8', 'surrogatepass')
+    return int.from_bytes(blake2b(content, digest_size=8).digest(), 'little', signed=True)
+
+
+def get_transaction_key(date, description, amount):
+    """
+    Generates the key of a transaction in a dict format, without creating a Transaction.
+
+    :param date: The transaction's date, in the MM/DD/YYYY format.
+    :param description: The transaction's description.
+    :param amount: The transaction's amount.
+    :return: The same key as the Transaction's id.
+    """
+    return get_key(parse_ordinal(date), description, to_cents(amount))
+
+
 class Transaction:
     """
     Represents a Transaction, the most granular of our entities.
     Transactions contain a date, description and amount.
     They also contain an optional reference to the Transaction Sequence they belong to.
+    Their id is generated from their contents once, when they are created, so different objects
+    with the same contents share the same id.
     """
 
+    __slots__ = ('date', 'description', 'amount', 'sequence', 'id')
+
     def __init__(self, date, description, amount):
-        self.date = datetime.datetime.strptime(date, '%m/%d/%Y')
+        self.date = parse_date(date)
         self.description = description
         self.amount = amount
         self.sequence = None
+        self.id = get_key(self.date.toordinal(), description, to_cents(amount))
+
+    @classmethod
+    def from_ordinal(cls, ordinal, description, amount):
+        """
+        Creates a transaction from a date ordinal instead of a date string.
+
+        :param ordinal: The transaction's date ordinal.
+        :param description: The transaction's description.
+        :param amount: The transaction's amount.
+        :return: Transaction
+        """
+        transaction = cls.__new__(cls)
+        transaction.date = datetime.datetime.fromordinal(ordinal)
+        transaction.description = description
+        transaction.amount = amount
+        transaction.sequence = None
+        transaction.id = get_key(ordinal, description, to_cents(amount))
+        return transaction
+
+    def copy(self):
+        """
+        Returns a copy of the transaction, without its sequence.
+
+        :return: Transaction
+        """
+        transaction = type(self).__new__(type(self))
+        transaction.date = self.date
+        transaction.description = self.description
+        transaction.amount = self.amount
+        transaction.sequence = None
+        transaction.id = self.id
+        return transaction
 
     def compare_description(self, description):
         """
@@ -42,14 +138,6 @@ class Transaction:
     def __repr__(self):
         return str(self)
 
-    @property
-    def id(self):
-        """
-        Generates an id based on the transaction's contents. Different objects with the same contents
-        should generate the same id.
-        """
-        return hash(str(self))
-
 
 class TransactionSequence:
     """
@@ -60,11 +148,15 @@ class TransactionSequence:
     - Intervals longer than 4 days between each other.
     Sequences also should have at least 4 transactions, and transactions should be owned by no more
     than one sequence.
+    Sequences are not modified once parsed, so their JSON encoding is cached for lookup responses.
     """
 
+    __slots__ = ('transactions', 'interval', 'encoded')
+
     def __init__(self, interval):
         self.transactions = OrderedDict()
         self.interval = interval
+        self.encoded = None
 
     def add_transaction(self, transaction, margin, set_ownership=False):
         """
@@ -83,6 +175,7 @@ class TransactionSequence:
 
         if diff in range(self.interval-margin, self.interval+margin+1):
             self.transactions[transaction.id] = transaction
+            self.encoded = None
             if set_ownership:
                 transaction.sequence = self
 
@@ -118,6 +211,32 @@ class TransactionSequence:
                     transactions=[transaction.to_dict()
                                   for key, transaction in self.transactions.items()])
 
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Rebuilds a sequence from its dict format, as returned by to_dict.
+
+        :param data: The sequence in a dict format.
+        :return: TransactionSequence
+        """
+        sequence = cls(interval=data['interval'])
+        for jtransaction in data['transactions']:
+            # Sequences were validated when parsed, so their transactions are added as they are.
+            transaction = Transaction(**jtransaction)
+            transaction.sequence = sequence
+            sequence.transactions[transaction.id] = transaction
+        return sequence
+
+    def to_bytes(self):
+        """
+        Returns the sequence encoded as UTF-8 JSON, the same as str(sequence), encoding it on the first call.
+
+        :return: The encoded sequence.
+        """
+        if self.encoded is None:
+            self.encoded = str(self).encode('utf-8')
+        return self.encoded
+
     def __str__(self):
         return json.dumps(self.to_dict())
 
@@ -138,10 +257,238 @@ class SequenceStorage:
     """
     A Storage for sequences and their transactions. It contains a dictionary acting as a lookup,
     enabling O(n) access to a transaction's sequence.
+    It also keeps the description groups its sequences were parsed from, so it can be extended
+    without parsing the whole history again.
+
+    Copies of a storage share its transactions and sequences, and only copy a description group, along with
+    its sequences, before changing it. Since transactions point to their sequence, a group shared with another
+    storage is never modified in place.
+
+    Description groups are kept by number, each one a deque of transactions in arrival order, so groups can be
+    retired once empty, and their oldest transactions removed from their front.
+    With a retention window, the storage also keeps its transaction keys in a heap ordered by date, so the ones
+    older than the window can be evicted without going through the others.
+    Exact duplicates found when parsing are counted in duplicates, a dict from their keys to their number of copies.
+
+    :param retention: Optional number of days kept, counting back from the latest transaction.
     """
 
-    def __init__(self):
+    def __init__(self, retention=None):
         self.sequences = OrderedDict()
+        self.groups = {}
+        self.seeds = {}
+        self.seed_index = defaultdict(set)
+        self.next_group = 0
+        self.duplicates = {}
+        self.private = set()
+        self.retention = retention
+        self.expiry = []
+        self.serial = 0
+        self.latest = None
+
+    def copy(self):
+        """
+        Returns a copy of the storage, which can be extended without affecting this one.
+        Sequences and transactions are shared until a group is changed by either storage.
+
+        :return: SequenceStorage
+        """
+        self.private.clear()
+        storage = type(self)(self.retention)
+        storage.sequences = OrderedDict(self.sequences)
+        storage.groups = {number: deque(group) for number, group in self.groups.items()}
+        storage.seeds = dict(self.seeds)
+        for key, numbers in self.seed_index.items():
+            storage.seed_index[key] = set(numbers)
+        storage.next_group = self.next_group
+        storage.duplicates = dict(self.duplicates)
+        storage.expiry = list(self.expiry)
+        storage.serial = self.serial
+        storage.latest = self.latest
+        return storage
+
+    def add_group(self, transactions, sequences=()):
+        """
+        Adds a group of transactions with similar descriptions, and the sequences parsed from it.
+        The group's first transaction is its seed, which new transactions are compared to.
+
+        :param transactions: List of transactions with similar descriptions.
+        :param sequences: List of sequences parsed from the group.
+        :return: The group's number.
+        """
+        number = self.next_group
+        self.next_group += 1
+        seed = tokenize(transactions[0].description)
+        self.groups[number] = deque()
+        self.private.add(number)
+        self.seeds[number] = seed
+        for key in enumerate(seed):
+            self.seed_index[key].add(number)
+        for transaction in transactions:
+            self.add_to_group(number, transaction)
+        self.add_sequences(sequences)
+        return number
+
+    def add_to_group(self, number, transaction):
+        """
+        Adds a transaction to a description group, keeping track of its date if the storage has a retention window.
+
+        :param number: The group's number.
+        :param transaction: Transaction to be added.
+        """
+        self.groups[number].append(transaction)
+        if self.retention is not None:
+            ordinal = transaction.date.toordinal()
+            heapq.heappush(self.expiry, (ordinal, self.serial, number, transaction.id))
+            self.serial += 1
+            if self.latest is None or ordinal > self.latest:
+                self.latest = ordinal
+
+    def own_group(self, number):
+        """
+        Makes sure a description group can be changed, copying its transactions and their sequences
+        if they may be shared with another storage.
+
+        :param number: The group's number.
+        """
+        if number in self.private:
+            return
+
+        group = self.groups[number]
+        copies = {id(transaction): transaction.copy() for transaction in group}
+        sequences = {id(transaction.sequence): transaction.sequence for transaction in group if transaction.sequence}
+        self.groups[number] = deque(copies[id(transaction)] for transaction in group)
+
+        for sequence in sequences.values():
+            copy = TransactionSequence(sequence.interval)
+            for transaction in sequence:
+                owned = copies[id(transaction)]
+                copy.transactions[transaction.id] = owned
+                if transaction.sequence is sequence:
+                    owned.sequence = copy
+                if self.sequences.get(transaction.id) is sequence:
+                    self.sequences[transaction.id] = copy
+        self.private.add(number)
+
+    def evict(self, date=None):
+        """
+        Evicts the transactions older than the retention window, which ends at a given date or at the latest
+        transaction. Only the evicted transactions are visited: they are removed from the front of their groups,
+        and from their sequences in place, along with their counted duplicates. Sequences left with less than
+        MINIMUM_TRANSACTIONS transactions are dropped, and groups left empty are retired.
+
+        Evicting from a group is O(evicted), except for groups still shared with a copy of the storage,
+        which are copied first, and groups whose transactions didn't arrive in date order, which are filtered.
+        Both are O(group).
+
+        :param date: Optional datetime ending the window.
+        :return: Number of evicted transactions.
+        """
+        if self.retention is None or self.latest is None:
+            return 0
+
+        # The parser depends on this module, so it can only be imported here.
+        from src.transactions.parser import MINIMUM_TRANSACTIONS
+
+        cutoff = (date.toordinal() if date is not None else self.latest) - self.retention
+        evicted = defaultdict(set)
+        count = 0
+        while self.expiry and self.expiry[0][0] < cutoff:
+            _, _, number, key = heapq.heappop(self.expiry)
+            evicted[number].add(key)
+            count += 1
+
+        for number, keys in evicted.items():
+            self.own_group(number)
+            group = self.groups[number]
+            # Groups are in date order when transactions arrive in date order, so the evicted ones come first.
+            transactions = []
+            while group and group[0].id in keys:
+                transactions.append(group.popleft())
+            if len(transactions) < len(keys):
+                transactions.extend(transaction for transaction in group if transaction.id in keys)
+                group = self.groups[number] = deque(transaction for transaction in group
+                                                    if transaction.id not in keys)
+
+            trimmed = {}
+            for transaction in transactions:
+                self.duplicates.pop(transaction.id, None)
+                sequence = transaction.sequence
+                if sequence is None:
+                    continue
+                # The group is owned by this storage, so its sequences can be trimmed in place.
+                del sequence.transactions[transaction.id]
+                sequence.encoded = None
+                transaction.sequence = None
+                if self.sequences.get(transaction.id) is sequence:
+                    del self.sequences[transaction.id]
+                trimmed[id(sequence)] = sequence
+
+            for sequence in trimmed.values():
+                if len(sequence) < MINIMUM_TRANSACTIONS:
+                    self.remove_sequence(sequence)
+
+            if not group:
+                self.retire_group(number)
+
+        return count
+
+    def retire_group(self, number):
+        """
+        Removes an empty description group, along with its seed, so new transactions can't join it.
+
+        :param number: The group's number.
+        """
+        del self.groups[number]
+        for key in enumerate(self.seeds.pop(number)):
+            numbers = self.seed_index[key]
+            numbers.discard(number)
+            if not numbers:
+                del self.seed_index[key]
+        self.private.discard(number)
+
+    def get_group_candidates(self, words):
+        """
+        Returns the groups whose seeds share a word in the same position with a tokenized description.
+
+        :param words: Word tuple, as returned by comparison.tokenize.
+        :return: Sorted list of group numbers.
+        """
+        candidates = set()
+        for key in enumerate(words):
+            candidates.update(self.seed_index.get(key, ()))
+        return sorted(candidates)
+
+    def remove_sequence(self, sequence):
+        """
+        Removes a sequence from the storage, releasing its transactions' ownership.
+
+        :param sequence: Sequence of transactions to be removed.
+        """
+        for transaction in sequence:
+            if self.sequences.get(transaction.id) is sequence:
+                del self.sequences[transaction.id]
+            if transaction.sequence is sequence:
+                transaction.sequence = None
+
+    def extend(self, transactions, sequence_parser=None):
+        """
+        Adds new transactions to the storage, parsing sequences again only for the description groups
+        they fall into. The result is the same as parsing the whole history again, with the new transactions
+        at its end. Transactions falling out of the retention window are evicted afterwards.
+
+        :param transactions: List of transactions in a dict format.
+        :param sequence_parser: Function used to parse the sequences of each affected group.
+        :return: List of the affected group numbers.
+        """
+        if self.sequences and not self.groups:
+            raise ValueError('The Storage was loaded without its description groups and cannot be extended')
+
+        # The parser depends on this module, so it can only be imported here.
+        from src.transactions.parser import extend_storage
+        affected = extend_storage(self, transactions, sequence_parser)
+        self.evict()
+        return affected
 
     def add_sequence(self, sequence):
         """
@@ -173,9 +520,319 @@ class SequenceStorage:
         else:
             return None
 
+    def get_response(self, transaction):
+        """
+        Given a transaction, returns its sequence encoded as JSON, which is cached after the first request.
+
+        :param transaction: Transaction whose sequence should be returned.
+        :return: The encoded sequence, or None if the transaction has no sequence.
+        """
+        return self.get_response_by_key(transaction.id)
+
+    def get_response_by_key(self, key):
+        """
+        Returns the encoded sequence of a transaction key.
+
+        :param key: The transaction's key.
+        :return: The encoded sequence, or None if the key has no sequence.
+        """
+        sequence = self.sequences.get(key)
+        if sequence is None:
+            return None
+        return sequence.to_bytes()
+
+    def iter_sequences(self):
+        """
+        Yields each sequence in the storage once, in the order of their keys in the storage.
+        A sequence is yielded at the first of its transactions whose key still points to it. That key is found once
+        for each sequence, so long sequences aren't scanned again for each of their keys.
+        """
+        first_keys = {}
+        for key, sequence in self.sequences.items():
+            first_key = first_keys.get(id(sequence))
+            if first_key is None:
+                first_key = first_keys[id(sequence)] = next(
+                    transaction_id for transaction_id in sequence.transactions
+                    if self.sequences.get(transaction_id) is sequence)
+            if key == first_key:
+                yield sequence
+
     def to_dict(self):
         return {'transactions': {key: sequence.to_dict()
                                  for key, sequence in self.sequences.items()}}
 
+    def to_compact_dict(self):
+        """
+        Returns the storage in a compact dict format, in which each sequence is written once, with an id,
+        and each transaction key points to its sequence's id.
+
+        :return: Dict with the "sequences" list and the "keys" map.
+        """
+        ids = {}
+        sequences = []
+        keys = {}
+        for key, sequence in self.sequences.items():
+            if id(sequence) not in ids:
+                ids[id(sequence)] = len(sequences)
+                sequences.append(dict(sequence.to_dict(), id=len(sequences)))
+            keys[key] = ids[id(sequence)]
+        return {'sequences': sequences, 'keys': keys}
+
+    @classmethod
+    def from_compact_dict(cls, data):
+        """
+        Rebuilds a storage from the compact dict format, without parsing its sequences again.
+        The description groups are not part of that format, so the storage only answers lookups
+        and cannot be extended.
+
+        :param data: Dict in the format returned by to_compact_dict, which may have been through JSON.
+        :return: SequenceStorage
+        """
+        sequences = {jsequence['id']: TransactionSequence.from_dict(jsequence) for jsequence in data['sequences']}
+
+        storage = cls()
+        for key, sequence_id in data['keys'].items():
+            storage.sequences[int(key)] = sequences[sequence_id]
+        return storage
+
     def __str__(self):
         return json.dumps(self.to_dict())
+
+
+class TransactionBatch:
+    """
+    A columnar representation of a whole load of transactions, for bulk parsing.
+    Rows are stored as parallel arrays of date ordinals, keys, description ids and amount ids, which point
+    into interned tables of descriptions and amounts. Amounts are kept as they were provided, so transactions
+    are rebuilt with the same amounts. Once parsed, each row also holds the number of its sequence.
+
+    A parsed batch answers the same lookups as a SequenceStorage, creating Transaction and
+    TransactionSequence objects only on demand. Rows that are exact duplicates of an earlier row are not parsed,
+    and are counted in duplicates.
+    """
+
+    __slots__ = ('ordinals', 'keys', 'descriptions', 'amounts', 'sequences', 'description_table', 'description_ids',
+                 'amount_table', 'amount_ids', 'intervals', 'margin', 'sequence_offsets', 'sequence_rows',
+                 'index_keys', 'index_rows', 'cache', 'duplicates')
+
+    def __init__(self):
+        self.ordinals = array('i')
+        self.keys = array('q')
+        self.descriptions = array('i')
+        self.amounts = array('i')
+        self.sequences = array('i')
+        self.description_table = []
+        self.description_ids = {}
+        self.amount_table = []
+        self.amount_ids = {}
+        self.intervals = array('i')
+        self.margin = None
+        self.sequence_offsets = array('i', [0])
+        self.sequence_rows = array('i')
+        self.index_keys = array('q')
+        self.index_rows = array('i')
+        self.cache = {}
+        self.duplicates = {}
+
+    @classmethod
+    def from_dicts(cls, json_transactions):
+        """
+        Creates a batch from a list of transactions in a dict format.
+
+        :param json_transactions: List of transactions in a dict format.
+        :return: TransactionBatch
+        """
+        batch = cls()
+        batch.extend(json_transactions)
+        return batch
+
+    def append(self, date, description, amount):
+        """
+        Adds a transaction to the batch.
+
+        :param date: The transaction's date, in the MM/DD/YYYY format.
+        :param description: The transaction's description.
+        :param amount: The transaction's amount.
+        """
+        description_id = self.description_ids.get(description)
+        if description_id is None:
+            description_id = self.description_ids[description] = len(self.description_table)
+            self.description_table.append(description)
+
+        # Amounts are interned by type as well, since 10 and 10.0 would share a dict key.
+        cents = to_cents(amount)
+        amount_id = self.amount_ids.get((type(amount), amount))
+        if amount_id is None:
+            amount_id = self.amount_ids[(type(amount), amount)] = len(self.amount_table)
+            self.amount_table.append(amount)
+
+        ordinal = parse_ordinal(date)
+        self.ordinals.append(ordinal)
+        self.keys.append(get_key(ordinal, description, cents))
+        self.descriptions.append(description_id)
+        self.amounts.append(amount_id)
+        self.sequences.append(-1)
+
+    def extend(self, json_transactions):
+        """
+        Adds a list of transactions in a dict format to the batch.
+
+        :param json_transactions: List of transactions in a dict format.
+        """
+        for transaction in json_transactions:
+            self.append(**transaction)
+
+    def get_description(self, row):
+        return self.description_table[self.descriptions[row]]
+
+    def get_key(self, row):
+        """
+        Returns a row's key, the same id a Transaction with the row's contents would have.
+
+        :param row: Position of the transaction in the batch.
+        :return: The transaction's key.
+        """
+        return self.keys[row]
+
+    def get_transaction(self, row):
+        """
+        Creates a Transaction from a row.
+
+        :param row: Position of the transaction in the batch.
+        :return: Transaction
+        """
+        return Transaction.from_ordinal(self.ordinals[row], self.get_description(row),
+                                        self.amount_table[self.amounts[row]])
+
+    def set_sequences(self, sequences, margin):
+        """
+        Assigns parsed sequences to the batch's rows, and indexes their transactions' keys for lookups.
+
+        :param sequences: List of (interval, rows) tuples.
+        :param margin: Margin the sequences were parsed with.
+        """
+        self.margin = margin
+        for interval, rows in sequences:
+            number = len(self.intervals)
+            self.intervals.append(interval)
+            for row in rows:
+                self.sequences[row] = number
+            self.sequence_rows.extend(rows)
+            self.sequence_offsets.append(len(self.sequence_rows))
+
+        # The key index is kept sorted, so lookups are a binary search. Rows sharing a key resolve to
+        # the last sequence they were added to, just like in a SequenceStorage. The index is sorted as arrays,
+        # without creating an object for each row.
+        rows = np.frombuffer(self.sequence_rows, dtype=np.int32)
+        keys = np.frombuffer(self.keys, dtype=np.int64)[rows]
+        order = np.lexsort((rows, np.frombuffer(self.sequences, dtype=np.int32)[rows], keys))
+        self.index_keys = array('q', keys[order].tobytes())
+        self.index_rows = array('i', rows[order].tobytes())
+        self.cache = {}
+
+    def create_sequence(self, number):
+        """
+        Creates the TransactionSequence for a sequence number.
+
+        :param number: Number of the sequence, in the order sequences were assigned.
+        :return: TransactionSequence
+        """
+        sequence = TransactionSequence(interval=self.intervals[number])
+        rows = self.sequence_rows[self.sequence_offsets[number]:self.sequence_offsets[number + 1]]
+        sequence.add_transactions([self.get_transaction(row) for row in rows],
+                                  margin=self.margin, set_ownership=True)
+        return sequence
+
+    def get_sequence_by_number(self, number):
+        """
+        Returns the TransactionSequence for a sequence number, creating it on its first request.
+
+        :param number: Number of the sequence, in the order sequences were assigned.
+        :return: TransactionSequence
+        """
+        if number not in self.cache:
+            self.cache[number] = self.create_sequence(number)
+        return self.cache[number]
+
+    def get_sequence(self, transaction):
+        """
+        Given a transaction, returns its sequence.
+
+        :param transaction: Transaction whose sequence should be returned.
+        :return: The transaction's sequence.
+        """
+        number = self.get_sequence_number(transaction.id)
+        if number is None:
+            return None
+        return self.get_sequence_by_number(number)
+
+    def get_sequence_number(self, key):
+        """
+        Finds the number of the sequence a transaction key belongs to.
+
+        :param key: The transaction's key.
+        :return: The sequence number, or None if the key has no sequence.
+        """
+        position = bisect_left(self.index_keys, key)
+        if position == len(self.index_keys) or self.index_keys[position] != key:
+            return None
+
+        position = bisect_right(self.index_keys, key, lo=position) - 1
+        return self.sequences[self.index_rows[position]]
+
+    def get_response(self, transaction):
+        """
+        Given a transaction, returns its sequence encoded as JSON, which is cached after the first request.
+
+        :param transaction: Transaction whose sequence should be returned.
+        :return: The encoded sequence, or None if the transaction has no sequence.
+        """
+        return self.get_response_by_key(transaction.id)
+
+    def get_response_by_key(self, key):
+        """
+        Returns the encoded sequence of a transaction key.
+
+        :param key: The transaction's key.
+        :return: The encoded sequence, or None if the key has no sequence.
+        """
+        number = self.get_sequence_number(key)
+        if number is None:
+            return None
+        return self.get_sequence_by_number(number).to_bytes()
+
+    def to_dict(self):
+        transactions = {}
+        for number in range(len(self.intervals)):
+            sequence = self.create_sequence(number)
+            for transaction in sequence:
+                transactions[transaction.id] = sequence
+        return {'transactions': {key: sequence.to_dict() for key, sequence in transactions.items()}}
+
+    def iter_sequences(self):
+        """
+        Yields each of the batch's sequences, creating them as they are yielded.
+        """
+        for number in range(len(self.intervals)):
+            yield self.create_sequence(number)
+
+    def to_compact_dict(self):
+        """
+        Returns the batch's sequences in the same compact dict format as SequenceStorage.to_compact_dict.
+
+        :return: Dict with the "sequences" list and the "keys" map.
+        """
+        sequences = []
+        keys = {}
+        for number in range(len(self.intervals)):
+            sequence = self.create_sequence(number)
+            sequences.append(dict(sequence.to_dict(), id=number))
+            for transaction in sequence:
+                keys[transaction.id] = number
+        return {'sequences': sequences, 'keys': keys}
+
+    def __str__(self):
+        return json.dumps(self.to_dict())
+
+    def __len__(self):
+        return len(self.ordinals)
@@ -1,78 +1,520 @@
-from collections import OrderedDict
+from array import array
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import heapq
 
 import itertools
 
-from src.transactions.models import TransactionSequence, Transaction, SequenceStorage
+import numpy as np
+
+from src.transactions.comparison import compare_tokens, tokenize, compare_many, encode_tokens
+from src.transactions.models import TransactionSequence, Transaction, SequenceStorage, TransactionBatch
+from src.transactions.profiling import stage
 
 
 MINIMUM_TRANSACTIONS = 4
 MINIMUM_INTERVAL = 4
 DEFAULT_MARGIN = 3
 SIMILARITY_RATIO = 0.5
+BATCHES_PER_WORKER = 4
+BLOCK_COMPARISON_SIZE = 64
 
 
-def parse_sequences(transaction_list, margin=DEFAULT_MARGIN):
+def find_sequences(ordinals, keys, owned=None, margin=DEFAULT_MARGIN, stats=None):
     """
-    Given a list of transactions with similar descriptions, find sequences that respect
-    the interval rule.
+    Given the date ordinals and ids of a list of transactions with similar descriptions, find sequences
+    that respect the interval rule. Transactions are referred to by their positions in the list, so this
+    can run on any representation of the transactions.
 
-    :param transaction_list: List of transactions with similar descriptions.
+    :param ordinals: List of date ordinals.
+    :param keys: List of transaction ids. Transactions with the same id are only added once to a sequence.
+    :param owned: Optional list of flags, indicating transactions that already belong to a sequence.
+    This list is updated with the transactions in the returned sequences.
     :param margin: Acceptable margin for the interval rule.
-    :return: List of valid sequences.
+    :param stats: Optional dict, whose pairs, candidates and rejected counters are increased.
+    :return: List of (interval, positions) tuples, one for each valid sequence.
     """
-    def get_margin(days):
-        return [str(i) for i in range(days - margin, days+margin+1)]
+    if owned is None:
+        owned = [False] * len(ordinals)
+
+    def add_position(interval, members, position):
+        if members:
+            diff = ordinals[position] - ordinals[members[next(reversed(members))]]
+        else:
+            diff = interval
+
+        if interval - margin <= diff <= interval + margin:
+            members[keys[position]] = position
+            return True
+        return False
 
     # First, we should evaluate sequence candidates from transaction combinations.
     # By using itertools.combinations, we avoid the issue of singleton transactions breaking
     # a possible sequence.
-    delta_hash = OrderedDict()
-    for a, b in itertools.combinations(transaction_list, 2):
-        xdiff = b.date - a.date
-        if xdiff.days >= MINIMUM_INTERVAL:                                            # '4 day rule' evaluation
-            keys = list(set(delta_hash.keys()).intersection(get_margin(xdiff.days)))  # margin evaluation
-            if len(keys) > 0:
-                delta_hash[keys[0]].add_transactions([a, b], margin=margin)
+    # When the margins of two candidates overlap, the one created first takes the pair.
+    candidates = OrderedDict()
+    creation = {}
+    for a, b in itertools.combinations(range(len(ordinals)), 2):
+        days = ordinals[b] - ordinals[a]
+        if days >= MINIMUM_INTERVAL:                                                # '4 day rule' evaluation
+            intervals = [interval for interval in range(days - margin, days + margin + 1)
+                         if interval in candidates]                                 # margin evaluation
+            if intervals:
+                interval = min(intervals, key=creation.get)
             else:
-                sequence = TransactionSequence(interval=xdiff.days)
-                sequence.add_transactions([a, b], margin=margin)
-                delta_hash[str(xdiff.days)] = sequence
+                interval = days
+                creation[interval] = len(creation)
+                candidates[interval] = OrderedDict()
+            add_position(interval, candidates[interval], a)
+            add_position(interval, candidates[interval], b)
 
     sequences = []
     # Now that we have the candidates, we should make sure that we are adhering to the minimum transactions and
     # the single-sequence rules, iterating through our candidates to get rid of extra sequences.
-    for key, sequence in delta_hash.items():
-        transactions = [transaction for transaction in sequence
-                        if not transaction.sequence]                                # Single-sequence evaluation
+    for interval, members in candidates.items():
+        positions = [position for position in members.values()
+                     if not owned[position]]                                        # Single-sequence evaluation
+
+        if len(positions) >= MINIMUM_TRANSACTIONS:                                  # Minimum transactions evaluation
+            clean_members = OrderedDict()
+            for position in positions:
+                if add_position(interval, clean_members, position):
+                    owned[position] = True
+            sequences.append((interval, list(clean_members.values())))
+
+    if stats is not None:
+        stats['pairs'] = stats.get('pairs', 0) + len(ordinals) * (len(ordinals) - 1) // 2
+        stats['candidates'] = stats.get('candidates', 0) + len(candidates)
+        stats['rejected'] = stats.get('rejected', 0) + len(candidates) - len(sequences)
+
+    return sequences
+
+
+def parse_sequences(transaction_list, margin=DEFAULT_MARGIN, stats=None):
+    """
+    Given a list of transactions with similar descriptions, find sequences that respect
+    the interval rule.
 
-        if len(transactions) >= MINIMUM_TRANSACTIONS:                               # Minimum transactions evaluation
-            clean_sequence = TransactionSequence(interval=int(key))
-            clean_sequence.add_transactions(transactions, margin=margin, set_ownership=True)
-            sequences.append(clean_sequence)
+    :param transaction_list: List of transactions with similar descriptions.
+    :param margin: Acceptable margin for the interval rule.
+    :param stats: Optional dict, whose pairs, candidates and rejected counters are increased.
+    :return: List of valid sequences.
+    """
+    ordinals = [transaction.date.toordinal() for transaction in transaction_list]
+    keys = [transaction.id for transaction in transaction_list]
+    owned = [bool(transaction.sequence) for transaction in transaction_list]
+
+    sequences = []
+    for interval, positions in find_sequences(ordinals, keys, owned, margin, stats):
+        sequence = TransactionSequence(interval=interval)
+        sequence.add_transactions([transaction_list[position] for position in positions],
+                                  margin=margin, set_ownership=True)
+        sequences.append(sequence)
 
     return sequences
 
 
-def parse_storage(json_transactions):
+def find_duplicates(keys):
+    """
+    Finds exact duplicates among transaction keys, which are derived from the transactions' contents.
+
+    :param keys: Iterable of transaction keys.
+    :return: Tuple of the positions of the first copy of each key, and a dict from each key found more than once
+    to its number of copies.
+    """
+    counts = {}
+    positions = []
+    for position, key in enumerate(keys):
+        count = counts.get(key)
+        if count is None:
+            counts[key] = 1
+            positions.append(position)
+        else:
+            counts[key] = count + 1
+    return positions, {key: count for key, count in counts.items() if count > 1}
+
+
+def group_tokens(words, comparisons=None):
+    """
+    Groups tokenized descriptions by similarity. Each group is seeded by the first description not yet grouped,
+    and takes every remaining description that is similar to the seed.
+
+    Two descriptions can only be similar if they share a word in the same position, so an inverted index from
+    (position, word) to descriptions is used to select the candidates each seed should be compared to.
+    Seeds with many candidates are compared to all of them at once, with comparison.compare_many.
+
+    :param words: List of word tuples, as returned by comparison.tokenize.
+    :param comparisons: Optional list, receiving the number of comparisons made for each group.
+    :return: List of groups, each one a list of positions in the original order.
+    """
+    index = defaultdict(list)
+    for position, sentence in enumerate(words):
+        for key in enumerate(sentence):
+            index[key].append(position)
+
+    grouped = bytearray(len(words))
+    groups = []
+    matrix = None
+    for seed, seed_words in enumerate(words):
+        if grouped[seed]:
+            continue
+
+        candidates = {seed}
+        for key in enumerate(seed_words):
+            # Grouped descriptions never become candidates again, so we drop them from the index as we go.
+            postings = [position for position in index[key] if not grouped[position]]
+            index[key] = postings
+            candidates.update(postings)
+
+        positions = sorted(candidates)
+        if len(positions) >= BLOCK_COMPARISON_SIZE:
+            if matrix is None:
+                matrix = encode_tokens(words)
+            ratios = compare_many(seed_words, matrix.take(positions)).tolist()
+        else:
+            ratios = [compare_tokens(words[position], seed_words) for position in positions]
+
+        group = []
+        for position, ratio in zip(positions, ratios):
+            if ratio > SIMILARITY_RATIO:
+                grouped[position] = 1
+                group.append(position)
+        groups.append(group)
+        if comparisons is not None:
+            comparisons.append(len(candidates))
+
+    return groups
+
+
+def group_descriptions(transactions, comparisons=None):
+    """
+    Groups transactions with similar descriptions. Each group is seeded by the first transaction not yet grouped,
+    and takes every remaining transaction whose description is similar to the seed's.
+
+    :param transactions: List of transactions.
+    :param comparisons: Optional list, receiving the number of comparisons made for each group.
+    :return: List of groups, each one a list of transactions in their original order.
+    """
+    words = [tokenize(transaction.description) for transaction in transactions]
+    return [[transactions[position] for position in group] for group in group_tokens(words, comparisons)]
+
+
+def parse_payloads(payloads, margin=DEFAULT_MARGIN):
+    """
+    Finds the sequences of a list of group payloads. This runs in the worker processes of a parallel parse.
+
+    :param payloads: List of (ordinals, keys) tuples, one for each description group.
+    :param margin: Acceptable margin for the interval rule.
+    :return: List of find_sequences results, one for each payload.
+    """
+    return [find_sequences(ordinals, keys, margin=margin) for ordinals, keys in payloads]
+
+
+def parse_payloads_parallel(payloads, workers, margin=DEFAULT_MARGIN):
+    """
+    Finds the sequences of a list of group payloads on a process pool.
+    Since evaluating a group is quadratic on its size, groups are spread over size-balanced batches,
+    assigning the largest groups first to the lightest batch.
+
+    :param payloads: List of (ordinals, keys) tuples, one for each description group.
+    :param workers: Number of worker processes.
+    :param margin: Acceptable margin for the interval rule.
+    :return: List of find_sequences results, one for each payload, in the same order.
+    """
+    results = [[] for payload in payloads]
+    # Groups too small for a sequence are not worth sending.
+    pending = sorted((index for index, (ordinals, keys) in enumerate(payloads)
+                      if len(ordinals) >= MINIMUM_TRANSACTIONS),
+                     key=lambda index: len(payloads[index][0]), reverse=True)
+    if not pending:
+        return results
+
+    batches = [[] for batch in range(min(workers * BATCHES_PER_WORKER, len(pending)))]
+    heap = [(0, batch) for batch in range(len(batches))]
+    for index in pending:
+        cost, batch = heapq.heappop(heap)
+        batches[batch].append(index)
+        heapq.heappush(heap, (cost + len(payloads[index][0]) ** 2, batch))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        batch_results = executor.map(parse_payloads,
+                                     [[payloads[index] for index in batch] for batch in batches],
+                                     itertools.repeat(margin))
+        for batch, sequences in zip(batches, batch_results):
+            for index, result in zip(batch, sequences):
+                results[index] = result
+
+    return results
+
+
+def parse_batch(batch, margin=DEFAULT_MARGIN, workers=None, profile=None):
+    """
+    Parses the sequences of a TransactionBatch, working directly on its columns.
+    Rows with the same description always fall into the same group, so only distinct descriptions are tokenized
+    and grouped. Rows are then assigned to their groups as arrays, and no Transaction objects are created.
+
+    :param batch: TransactionBatch to be parsed.
+    :param margin: Acceptable margin for the interval rule.
+    :param workers: Optional number of worker processes to parse the description groups on.
+    :param profile: Optional profiling.ParseProfile, receiving the timings of each stage.
+    :return: The parsed TransactionBatch.
+    """
+    comparisons = [] if profile is not None else None
+    with stage(profile, 'grouping'):
+        # Only the first copy of each exact duplicate is grouped and parsed. The other copies share its key,
+        # so they are found by lookups all the same.
+        keys = np.frombuffer(batch.keys, dtype=np.int64)
+        distinct_keys, first_rows, counts = np.unique(keys, return_index=True, return_counts=True)
+        repeated = counts > 1
+        batch.duplicates = dict(zip(distinct_keys[repeated].tolist(), counts[repeated].tolist()))
+        rows = np.sort(first_rows)
+
+        # Descriptions are grouped in the order of their first row, just like their rows would be.
+        descriptions = np.frombuffer(batch.descriptions, dtype=np.int32)[rows]
+        distinct, first_positions = np.unique(descriptions, return_index=True)
+        distinct = distinct[np.argsort(first_positions)]
+        words = [tokenize(batch.description_table[description]) for description in distinct.tolist()]
+        description_groups = group_tokens(words, comparisons)
+
+        group_numbers = np.zeros(len(batch.description_table), dtype=np.int64)
+        for number, group in enumerate(description_groups):
+            group_numbers[distinct[group]] = number
+        row_groups = group_numbers[descriptions]
+        rows = rows[np.argsort(row_groups, kind='stable')]
+        ends = np.cumsum(np.bincount(row_groups, minlength=len(description_groups)))
+        groups = np.split(rows, ends[:-1]) if description_groups else []
+
+    with stage(profile, 'sequences'):
+        ordinals = np.frombuffer(batch.ordinals, dtype=np.int32)
+        payloads = [(array('i', ordinals[group].tobytes()), array('q', keys[group].tobytes())) for group in groups]
+        if workers:
+            results = parse_payloads_parallel(payloads, workers, margin)
+        else:
+            results = parse_payloads(payloads, margin)
+
+    with stage(profile, 'storage'):
+        sequences = []
+        for group, result in zip(groups, results):
+            for interval, positions in result:
+                sequences.append((interval, group[positions].tolist()))
+        batch.set_sequences(sequences, margin)
+
+    if profile is not None:
+        profile.counters['comparisons'] += sum(comparisons)
+    return batch
+
+
+def parse_groups(groups, sequence_parser=parse_sequences, workers=None, profile=None, comparisons=None):
+    """
+    Yields the sequences parsed from each description group, in the order of the groups.
+    Groups are parsed serially as they are yielded, or all at once on a process pool when a number of workers
+    is provided.
+
+    :param groups: List of description groups, each one a list of transactions.
+    :param sequence_parser: Function used to parse the sequences of each description group.
+    :param workers: Optional number of worker processes to parse the description groups on.
+    :param profile: Optional profiling.ParseProfile, receiving the timings of each stage, and of each group
+    when they are parsed serially.
+    :param comparisons: Optional list of the number of comparisons made for each group, recorded by the profile.
+    """
+    if workers:
+        with stage(profile, 'sequences'):
+            payloads = [(array('i', (transaction.date.toordinal() for transaction in group)),
+                         array('q', (transaction.id for transaction in group)))
+                        for group in groups]
+            results = parse_payloads_parallel(payloads, workers)
+
+        for group, result in zip(groups, results):
+            with stage(profile, 'storage'):
+                sequences = []
+                for interval, positions in result:
+                    sequence = TransactionSequence(interval=interval)
+                    sequence.add_transactions([group[position] for position in positions],
+                                              margin=DEFAULT_MARGIN, set_ownership=True)
+                    sequences.append(sequence)
+            yield group, sequences
+        return
+
+    for number, group in enumerate(groups):
+        if profile is None:
+            yield group, sequence_parser(group)
+            continue
+
+        counters = {'comparisons': comparisons[number]}
+        start = profile.clock()
+        if sequence_parser is parse_sequences:
+            sequences = parse_sequences(group, stats=counters)
+        else:
+            sequences = sequence_parser(group)
+        seconds = profile.clock() - start
+        profile.add_time('sequences', seconds)
+        profile.add_group(len(group), group[0].description, seconds, len(sequences), counters)
+        yield group, sequences
+
+
+def trim_sequences(sequences, cutoff):
+    """
+    Removes the transactions older than a cutoff from a list of sequences, just like SequenceStorage.evict.
+    Sequences left with less than MINIMUM_TRANSACTIONS transactions are dropped, and the others are replaced
+    by trimmed copies.
+
+    :param sequences: List of sequences.
+    :param cutoff: Date ordinal of the oldest transaction kept.
+    :return: List of the remaining sequences.
+    """
+    remaining = []
+    for sequence in sequences:
+        if sequence.get_first_transaction().date.toordinal() >= cutoff:
+            remaining.append(sequence)
+            continue
+
+        transactions = [transaction for transaction in sequence.transactions.values()
+                        if transaction.date.toordinal() >= cutoff]
+        if len(transactions) >= MINIMUM_TRANSACTIONS:
+            trimmed = TransactionSequence(sequence.interval)
+            for transaction in transactions:
+                trimmed.transactions[transaction.id] = transaction
+                transaction.sequence = trimmed
+            remaining.append(trimmed)
+    return remaining
+
+
+def parse_storage(json_transactions, sequence_parser=parse_sequences, workers=None, profile=None, storage=None,
+                  retention=None):
     """
     Parses a list of dict transactions into a Sequence Storage.
+    A TransactionBatch is parsed in place instead, and returned as the storage.
 
-    :param json_transactions: List of transactions in a dict format.
-    :return: SequenceStorage
+    When a number of workers is provided, the description groups are parsed on a process pool, receiving
+    only their dates and ids. The result is the same as parsing them serially.
+
+    :param json_transactions: List of transactions in a dict format, or a TransactionBatch.
+    :param sequence_parser: Function used to parse the sequences of each description group,
+    such as parse_sequences or histogram.parse_sequences_histogram.
+    :param workers: Optional number of worker processes to parse the description groups on.
+    Only supported by parse_sequences.
+    :param profile: Optional profiling.ParseProfile, receiving the timings of each stage. The timings and counters
+    of each description group are only recorded when groups are parsed serially, from dict transactions.
+    :param storage: Optional storage backend, such as backends.SQLiteStorage, which is returned instead of
+    a SequenceStorage. Each group's sequences are added to it as soon as they are parsed, and then released,
+    so no SequenceStorage is built.
+    :param retention: Optional number of days kept by the storage, counting back from the latest transaction.
+    Older transactions are evicted once parsed.
+    :return: SequenceStorage, whose duplicates attribute maps the keys of exact duplicates to their number of copies.
+    Only the first copy of each is parsed, since the others would end up in the same sequences.
     """
-    transactions = [Transaction(**transaction) for transaction in json_transactions]
+    if workers and sequence_parser is not parse_sequences:
+        raise ValueError('Parsing on worker processes is only supported by parse_sequences')
 
-    storage = SequenceStorage()
+    if isinstance(json_transactions, TransactionBatch):
+        if storage is not None:
+            raise ValueError('Storage backends are not supported for a TransactionBatch')
+        if sequence_parser is not parse_sequences or retention is not None:
+            raise ValueError('A TransactionBatch is only parsed by parse_sequences, without a retention window')
+        return parse_batch(json_transactions, workers=workers, profile=profile)
 
-    # We iterate through the list of transactions, parsing sequences from those that have similar descriptions
-    # and adding those to a Sequence Storage.
-    while len(transactions) > 0:
-        transaction = transactions[0]
+    with stage(profile, 'transactions'):
+        transactions = [Transaction(**transaction) for transaction in json_transactions]
+        positions, duplicates = find_duplicates(transaction.id for transaction in transactions)
+        if duplicates:
+            transactions = [transactions[position] for position in positions]
+
+    comparisons = [] if profile is not None else None
+    with stage(profile, 'grouping'):
+        groups = group_descriptions(transactions, comparisons)
+
+    if storage is not None:
+        cutoff = None
+        if retention is not None and transactions:
+            cutoff = max(transaction.date.toordinal() for transaction in transactions) - retention
+        del transactions
 
-        descs = list(filter(lambda x: x.compare_description(transaction.description) > SIMILARITY_RATIO, transactions))
-        sequences = parse_sequences(descs)
-        storage.add_sequences(sequences)
-        for tran in descs:
-            transactions.remove(tran)
+        storage.duplicates = duplicates
+        for number, (group, sequences) in enumerate(parse_groups(groups, sequence_parser, workers, profile,
+                                                                 comparisons)):
+            # Groups are released once their sequences are in the backend.
+            groups[number] = None
+            with stage(profile, 'backend'):
+                if cutoff is not None:
+                    sequences = trim_sequences(sequences, cutoff)
+                storage.add_sequences(sequences)
+
+        if workers and profile is not None:
+            profile.counters['comparisons'] += sum(comparisons)
+        return storage
+
+    # We group the transactions by similar descriptions, parsing sequences from each group
+    # and adding those to a Sequence Storage.
+    storage = SequenceStorage(retention)
+    storage.duplicates = duplicates
+    for group, sequences in parse_groups(groups, sequence_parser, workers, profile, comparisons):
+        with stage(profile, 'storage'):
+            storage.add_group(group, sequences)
 
+    # Groups parsed serially record their own comparisons.
+    if workers and profile is not None:
+        profile.counters['comparisons'] += sum(comparisons)
+    if retention is not None:
+        with stage(profile, 'retention'):
+            storage.evict()
     return storage
+
+
+def extend_storage(storage, json_transactions, sequence_parser=None):
+    """
+    Adds new transactions to a Sequence Storage, parsing sequences again only for the description groups
+    they fall into.
+
+    Each new transaction joins the first group whose seed has a similar description, just like it would
+    if the whole history was parsed again. Transactions that match no group are grouped among themselves.
+    Exact duplicates of a transaction already in its group, or earlier in the new ones, are only counted
+    in the storage's duplicates.
+
+    :param storage: SequenceStorage to be extended.
+    :param json_transactions: List of transactions in a dict format.
+    :param sequence_parser: Function used to parse the sequences of each affected group.
+    :return: List of the affected group numbers.
+    """
+    if sequence_parser is None:
+        sequence_parser = parse_sequences
+
+    affected = set()
+    group_keys = {}
+    unmatched = []
+    for transaction in (Transaction(**transaction) for transaction in json_transactions):
+        words = tokenize(transaction.description)
+        for number in storage.get_group_candidates(words):
+            if compare_tokens(words, storage.seeds[number]) > SIMILARITY_RATIO:
+                # Duplicates have the same description, so they can only be found in the same group.
+                keys = group_keys.get(number)
+                if keys is None:
+                    keys = group_keys[number] = {transaction.id for transaction in storage.groups[number]}
+                if transaction.id in keys:
+                    storage.duplicates[transaction.id] = storage.duplicates.get(transaction.id, 1) + 1
+                    break
+
+                # Groups shared with copies of the storage are copied before their sequences are parsed again.
+                storage.own_group(number)
+                storage.add_to_group(number, transaction)
+                keys.add(transaction.id)
+                affected.add(number)
+                break
+        else:
+            unmatched.append(transaction)
+
+    positions, duplicates = find_duplicates(transaction.id for transaction in unmatched)
+    unmatched = [unmatched[position] for position in positions]
+    storage.duplicates.update(duplicates)
+
+    for number in sorted(affected):
+        # Parsers index their groups, which deques only do in linear time.
+        group = list(storage.groups[number])
+        for sequence in {id(transaction.sequence): transaction.sequence
+                         for transaction in group if transaction.sequence}.values():
+            storage.remove_sequence(sequence)
+        storage.add_sequences(sequence_parser(group))
+
+    for group in group_descriptions(unmatched):
+        affected.add(storage.add_group(group, sequence_parser(group)))
+
+    return sorted(affected)
@@ -0,0 +1,128 @@
+"""
+Profiling for the parser. A ParseProfile can be passed to parser.parse_storage, and receives the timings of each
+parsing stage and of each description group, along with counters of the work done:
+- comparisons: descriptions compared to group seeds;
+- pairs: transaction pairs examined for sequence candidates;
+- candidates: sequence candidates, one per distinct interval;
+- rejected: candidates without enough transactions to become sequences.
+
+Nothing is measured when no profile is passed, so parsing is not slowed down.
+"""
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+import heapq
+import time
+
+
+COUNTERS = ('comparisons', 'pairs', 'candidates', 'rejected')
+
+
+class GroupProfile:
+    """
+    Timings and counters of a single description group.
+    """
+
+    __slots__ = ('number', 'size', 'description', 'seconds', 'sequences', 'counters')
+
+    def __init__(self, number, size, description, seconds, sequences, counters):
+        self.number = number
+        self.size = size
+        self.description = description
+        self.seconds = seconds
+        self.sequences = sequences
+        self.counters = counters
+
+    def to_dict(self):
+        return dict(number=self.number,
+                    size=self.size,
+                    description=self.description,
+                    seconds=self.seconds,
+                    sequences=self.sequences,
+                    **{name: self.counters.get(name, 0) for name in COUNTERS})
+
+
+class ParseProfile:
+    """
+    Collects the timings and counters of a parse.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.stages = OrderedDict()
+        self.counters = Counter()
+        self.groups = []
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Times a stage of the parse. Stages run more than once have their timings added up.
+
+        :param name: Name of the stage.
+        """
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.add_time(name, self.clock() - start)
+
+    def add_time(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0) + seconds
+
+    def add_group(self, size, description, seconds, sequences, counters):
+        """
+        Records a parsed description group.
+
+        :param size: Number of transactions in the group.
+        :param description: Description of the group's seed.
+        :param seconds: Time spent parsing the group's sequences.
+        :param sequences: Number of sequences found in the group.
+        :param counters: Dict of the group's counters.
+        """
+        self.groups.append(GroupProfile(len(self.groups), size, description, seconds, sequences, counters))
+        self.counters.update(counters)
+
+    def get_slowest_groups(self, count=10):
+        """
+        Returns the groups that took the longest to parse.
+
+        :param count: Number of groups to be returned.
+        :return: List of GroupProfile, the slowest first.
+        """
+        return heapq.nlargest(count, self.groups, key=lambda group: group.seconds)
+
+    def to_dict(self, count=10):
+        return dict(stages=dict(self.stages),
+                    seconds=sum(self.stages.values()),
+                    groups=len(self.groups),
+                    sequences=sum(group.sequences for group in self.groups),
+                    counters={name: self.counters.get(name, 0) for name in COUNTERS},
+                    slowest_groups=[group.to_dict() for group in self.get_slowest_groups(count)])
+
+    def log(self, logger, count=10):
+        """
+        Logs a summary of the parse, and its slowest groups.
+
+        :param logger: logging.Logger to be used.
+        :param count: Number of groups to be logged.
+        """
+        logger.info('Parsed %d groups in %.3fs: %s; %s', len(self.groups), sum(self.stages.values()),
+                    ', '.join('{} {:.3f}s'.format(name, seconds) for name, seconds in self.stages.items()),
+                    ', '.join('{} {}'.format(name, self.counters.get(name, 0)) for name in COUNTERS))
+        for group in self.get_slowest_groups(count):
+            logger.info('Group %d (%r): %d transactions, %d sequences in %.3fs', group.number, group.description,
+                        group.size, group.sequences, group.seconds)
+
+
+@contextmanager
+def no_stage():
+    yield
+
+
+def stage(profile, name):
+    """
+    Times a stage on a profile, or does nothing if there is no profile.
+
+    :param profile: ParseProfile, or None.
+    :param name: Name of the stage.
+    """
+    return profile.stage(name) if profile is not None else no_stage()
@@ -0,0 +1,352 @@
+"""
+Compact binary snapshots of a SequenceStorage, which can be shared by every worker process of a server.
+Snapshots are opened read-only with mmap, and lookups binary search their sorted key index in place,
+decoding only the sequence that was asked for.
+
+A snapshot file is laid out as:
+- A header, with the section offsets and counts;
+- A string table of descriptions and json encoded amounts, as an offsets array and a UTF-8 blob;
+- Transaction records, grouped by sequence: date ordinal, description id and amount id;
+- Sequence records: interval, first transaction record and number of transactions;
+- The sorted array of transaction keys, followed by the array of their sequence numbers.
+
+A directory of snapshots also holds a version file, naming its current snapshot. Readers check that file
+to pick up new snapshots published by any process. Writers building on their own storage check that it is
+still the current one before publishing, so a process can't overwrite a newer snapshot with an older storage.
+The status of background jobs is written there as well, so it can be reported by any process.
+"""
+from bisect import bisect_left
+import fcntl
+import json
+import mmap
+import os
+import re
+import struct
+import tempfile
+import uuid
+
+from src.transactions.models import Transaction, TransactionSequence
+
+
+MAGIC = b'TPSNAP01'
+HEADER = struct.Struct('<8sIIIIQQQQQ')
+TRANSACTION = struct.Struct('<iII')
+SEQUENCE = struct.Struct('<iII')
+VERSION_FILE = 'CURRENT'
+JOBS_DIR = 'jobs'
+MAX_JOB_FILES = 100
+
+_job_id = re.compile(r'[0-9a-f]{32}')
+
+
+def read_job(path, job_id):
+    """
+    Reads the status of a job written to a snapshot directory by any process.
+
+    :param path: Path of the snapshot directory.
+    :param job_id: Id of the job.
+    :return: The job in a dict format, or None if it is unknown.
+    """
+    # Ids are checked before being used as file names, since they come from requests.
+    if not _job_id.fullmatch(job_id):
+        return None
+    try:
+        with open(os.path.join(path, JOBS_DIR, job_id + '.json'), 'r') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def align(size):
+    return (size + 7) & ~7
+
+
+def write_snapshot(storage, path):
+    """
+    Writes a snapshot of a storage to a file. The file is written under a temporary name and then renamed,
+    so it is never seen incomplete.
+
+    :param storage: SequenceStorage to be written.
+    :param path: Path of the snapshot file.
+    """
+    strings = {}
+
+    def get_string(value):
+        if value not in strings:
+            strings[value] = len(strings)
+        return strings[value]
+
+    numbers = {}
+    sequences = bytearray()
+    transactions = bytearray()
+    for sequence in storage.sequences.values():
+        if id(sequence) in numbers:
+            continue
+        numbers[id(sequence)] = len(numbers)
+        sequences += SEQUENCE.pack(sequence.interval, len(transactions) // TRANSACTION.size, len(sequence))
+        for transaction in sequence:
+            transactions += TRANSACTION.pack(transaction.date.toordinal(),
+                                             get_string(transaction.description),
+                                             get_string(json.dumps(transaction.amount)))
+
+    entries = sorted((key, numbers[id(sequence)]) for key, sequence in storage.sequences.items())
+    keys = struct.pack('<{}q'.format(len(entries)), *(key for key, number in entries))
+    key_numbers = struct.pack('<{}I'.format(len(entries)), *(number for key, number in entries))
+
+    blob = bytearray()
+    string_offsets = [0]
+    for value in strings:
+        blob += value.encode('utf-8', 'surrogatepass')
+        string_offsets.append(len(blob))
+    string_offsets = struct.pack('<{}Q'.format(len(string_offsets)), *string_offsets)
+
+    sections = [string_offsets, bytes(blob), bytes(transactions), bytes(sequences), keys + key_numbers]
+    offsets = []
+    position = HEADER.size
+    for section in sections:
+        offsets.append(position)
+        position = align(position + len(section))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile('wb', dir=directory, delete=False) as file:
+        file.write(HEADER.pack(MAGIC, len(strings), len(transactions) // TRANSACTION.size, len(numbers),
+                               len(entries), *offsets))
+        for offset, section in zip(offsets, sections):
+            file.write(b'\0' * (offset - file.tell()))
+            file.write(section)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(file.name, path)
+
+
+class SnapshotStorage:
+    """
+    A read-only storage served from a memory-mapped snapshot file.
+    It answers the same lookups as a SequenceStorage, creating objects only for the sequences returned.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, self.string_count, self.transaction_count, self.sequence_count, self.key_count,
+         strings_offset, blob_offset, transactions_offset, sequences_offset, keys_offset) = \
+            HEADER.unpack_from(self.buffer)
+        if magic != MAGIC:
+            raise ValueError('{} is not a transactions snapshot'.format(path))
+
+        view = memoryview(self.buffer)
+        self.string_offsets = view[strings_offset:strings_offset + 8 * (self.string_count + 1)].cast('Q')
+        self.blob_offset = blob_offset
+        self.transactions_offset = transactions_offset
+        self.sequences_offset = sequences_offset
+        self.keys = view[keys_offset:keys_offset + 8 * self.key_count].cast('q')
+        numbers_offset = keys_offset + 8 * self.key_count
+        self.numbers = view[numbers_offset:numbers_offset + 4 * self.key_count].cast('I')
+        self.responses = {}
+
+    def get_string(self, number):
+        start = self.blob_offset + self.string_offsets[number]
+        end = self.blob_offset + self.string_offsets[number + 1]
+        return self.buffer[start:end].decode('utf-8', 'surrogatepass')
+
+    def get_sequence_by_number(self, number):
+        """
+        Decodes a sequence from the snapshot.
+
+        :param number: Number of the sequence in the snapshot.
+        :return: TransactionSequence
+        """
+        interval, first, count = SEQUENCE.unpack_from(self.buffer, self.sequences_offset + number * SEQUENCE.size)
+        sequence = TransactionSequence(interval=interval)
+        for record in range(first, first + count):
+            ordinal, description, amount = TRANSACTION.unpack_from(
+                self.buffer, self.transactions_offset + record * TRANSACTION.size)
+            transaction = Transaction.from_ordinal(ordinal, self.get_string(description),
+                                                   json.loads(self.get_string(amount)))
+            # Sequences were validated when parsed, so their transactions are added as they are.
+            transaction.sequence = sequence
+            sequence.transactions[transaction.id] = transaction
+        return sequence
+
+    def get_sequence_number(self, key):
+        """
+        Finds the number of the sequence a transaction key belongs to.
+
+        :param key: The transaction's key.
+        :return: The sequence number, or None if the key is not in the snapshot.
+        """
+        position = bisect_left(self.keys, key)
+        if position < self.key_count and self.keys[position] == key:
+            return self.numbers[position]
+        return None
+
+    def get_sequence(self, transaction):
+        """
+        Given a transaction, returns its sequence.
+
+        :param transaction: Transaction whose sequence should be returned.
+        :return: The transaction's sequence.
+        """
+        number = self.get_sequence_number(transaction.id)
+        if number is None:
+            return None
+        return self.get_sequence_by_number(number)
+
+    def get_response(self, transaction):
+        """
+        Given a transaction, returns its sequence encoded as JSON. Each sequence is only decoded and encoded
+        on its first request, and the encoded sequence is kept for the next ones.
+
+        :param transaction: Transaction whose sequence should be returned.
+        :return: The encoded sequence, or None if the transaction has no sequence.
+        """
+        return self.get_response_by_key(transaction.id)
+
+    def get_response_by_key(self, key):
+        """
+        Returns the encoded sequence of a transaction key.
+
+        :param key: The transaction's key.
+        :return: The encoded sequence, or None if the key is not in the snapshot.
+        """
+        number = self.get_sequence_number(key)
+        if number is None:
+            return None
+
+        response = self.responses.get(number)
+        if response is None:
+            response = self.responses[number] = self.get_sequence_by_number(number).to_bytes()
+        return response
+
+    def iter_sequences(self):
+        """
+        Yields each of the snapshot's sequences, decoding them as they are yielded.
+        """
+        for number in range(self.sequence_count):
+            yield self.get_sequence_by_number(number)
+
+    def close(self):
+        for view in (self.string_offsets, self.keys, self.numbers):
+            view.release()
+        self.buffer.close()
+
+    def __len__(self):
+        return self.key_count
+
+
+class StaleSnapshotError(Exception):
+    """
+    Raised when publishing a storage built from a snapshot that is no longer the current one.
+    """
+
+
+class SnapshotDirectory:
+    """
+    A directory of snapshots shared by several processes. Publishing writes a new snapshot and then
+    points the version file to it, while readers reopen the current snapshot whenever the version file changes.
+    """
+
+    def __init__(self, path, keep=2):
+        self.path = path
+        self.keep = keep
+        self.version = None
+        self.snapshot = None
+        self.published = None
+        os.makedirs(path, exist_ok=True)
+
+    def get_current_name(self):
+        """
+        Reads the name of the current snapshot from the version file.
+
+        :return: The snapshot's file name, or None if nothing was published yet.
+        """
+        try:
+            with open(os.path.join(self.path, VERSION_FILE), 'r') as file:
+                return file.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def is_stale(self):
+        """
+        Indicates whether another process published a snapshot after the last one published by this directory.
+        """
+        return self.get_current_name() != self.published
+
+    def publish(self, storage, check=False):
+        """
+        Writes a snapshot of a storage and makes it the current one.
+
+        :param storage: SequenceStorage to be published.
+        :param check: Indicates whether the storage was built from the last snapshot published by this directory,
+                      which should still be the current one.
+        :raise StaleSnapshotError: If checking, and another process published a snapshot in the meantime.
+        :return: Name of the new snapshot file.
+        """
+        name = 'snapshot-{}.bin'.format(uuid.uuid4().hex)
+        write_snapshot(storage, os.path.join(self.path, name))
+
+        # The directory is locked while the version file is checked and replaced, so concurrent writers
+        # can't both find their own snapshot current.
+        descriptor = os.open(self.path, os.O_RDONLY)
+        try:
+            fcntl.flock(descriptor, fcntl.LOCK_EX)
+            if check and self.is_stale():
+                os.remove(os.path.join(self.path, name))
+                raise StaleSnapshotError("Another process published a newer snapshot")
+
+            with tempfile.NamedTemporaryFile('w', dir=self.path, delete=False) as file:
+                file.write(name)
+            os.replace(file.name, os.path.join(self.path, VERSION_FILE))
+            self.published = name
+        finally:
+            os.close(descriptor)
+
+        # Processes still holding older snapshots keep their mappings after the files are removed.
+        snapshots = sorted((entry for entry in os.scandir(self.path)
+                            if entry.name.startswith('snapshot-') and entry.name != name),
+                           key=lambda entry: entry.stat().st_mtime_ns, reverse=True)
+        for entry in snapshots[self.keep - 1:]:
+            os.remove(entry.path)
+
+        return name
+
+    def write_job(self, job):
+        """
+        Writes the status of a job, replacing its previous one. Only the most recently written jobs are kept.
+
+        :param job: The job in a dict format.
+        """
+        directory = os.path.join(self.path, JOBS_DIR)
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile('w', dir=directory, delete=False) as file:
+            json.dump(job, file)
+        os.replace(file.name, os.path.join(directory, job['id'] + '.json'))
+
+        jobs = sorted((entry for entry in os.scandir(directory) if entry.name.endswith('.json')),
+                      key=lambda entry: entry.stat().st_mtime_ns, reverse=True)
+        for entry in jobs[MAX_JOB_FILES:]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def current(self):
+        """
+        Returns the current snapshot, reopening it if the version file changed since the last call.
+
+        :return: SnapshotStorage, or None if nothing was published yet.
+        """
+        try:
+            stat = os.stat(os.path.join(self.path, VERSION_FILE))
+        except FileNotFoundError:
+            return None
+
+        version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if version != self.version:
+            with open(os.path.join(self.path, VERSION_FILE), 'r') as file:
+                name = file.read().strip()
+            self.snapshot = SnapshotStorage(os.path.join(self.path, name))
+            self.version = version
+        return self.snapshot
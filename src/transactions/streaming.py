@@ -0,0 +1,198 @@
+"""
+Online detection of sequences, for transactions arriving one at a time in date order.
+
+Transactions are grouped by description just like in parser.extend_storage, joining the first group whose seed
+is similar. Each group keeps bounded state: its recent transactions not yet in a sequence, and its open candidates,
+each one a chain of transactions following an interval within the margin. A candidate reaching
+MINIMUM_TRANSACTIONS becomes a sequence and is reported right away, and later transactions extending it are
+reported as well. Candidates that miss their next date by more than the margin are closed.
+
+Each transaction only visits its group's recent transactions and candidates, both of which are capped, so the work
+per transaction doesn't grow with the history.
+"""
+from collections import defaultdict, deque
+
+from src.transactions.comparison import compare_tokens, tokenize
+from src.transactions.models import Transaction, TransactionSequence
+from src.transactions.parser import MINIMUM_TRANSACTIONS, MINIMUM_INTERVAL, DEFAULT_MARGIN, SIMILARITY_RATIO
+
+
+MAX_INTERVAL = 366
+HISTORY_SIZE = 64
+MAX_CANDIDATES = 64
+
+DETECTED = 'detected'
+EXTENDED = 'extended'
+
+
+class SequenceEvent:
+    """
+    Reports a sequence that was just detected, or a transaction extending a detected sequence.
+    """
+
+    __slots__ = ('kind', 'group', 'sequence', 'transaction')
+
+    def __init__(self, kind, group, sequence, transaction):
+        self.kind = kind
+        self.group = group
+        self.sequence = sequence
+        self.transaction = transaction
+
+    def to_dict(self):
+        return dict(kind=self.kind,
+                    group=self.group,
+                    sequence=self.sequence.to_dict(),
+                    transaction=self.transaction.to_dict())
+
+
+class Candidate:
+    """
+    A chain of transactions following an interval, which becomes a sequence once it is long enough.
+    """
+
+    __slots__ = ('interval', 'members', 'last', 'sequence')
+
+    def __init__(self, interval, members):
+        self.interval = interval
+        self.members = members
+        self.last = members[-1].date.toordinal()
+        self.sequence = None
+
+    def accepts(self, ordinal, margin):
+        days = ordinal - self.last
+        return days >= MINIMUM_INTERVAL and self.interval - margin <= days <= self.interval + margin
+
+    def is_expired(self, ordinal, margin):
+        return ordinal - self.last > self.interval + margin
+
+
+class GroupState:
+    """
+    The state kept for a description group: its recent unsequenced transactions and its open candidates.
+    """
+
+    __slots__ = ('history', 'candidates')
+
+    def __init__(self, history_size):
+        self.history = deque(maxlen=history_size)
+        self.candidates = []
+
+
+class StreamingSequenceDetector:
+    """
+    Detects sequences from transactions fed one at a time, in date order.
+
+    :param margin: Acceptable margin for the interval rule.
+    :param max_interval: Longest interval detected, in days.
+    :param history_size: Number of recent transactions kept for each group, to start candidates from.
+    :param max_candidates: Number of open candidates kept for each group. The oldest ones are dropped first.
+    """
+
+    def __init__(self, margin=DEFAULT_MARGIN, max_interval=MAX_INTERVAL, history_size=HISTORY_SIZE,
+                 max_candidates=MAX_CANDIDATES):
+        self.margin = margin
+        self.max_interval = max_interval
+        self.history_size = history_size
+        self.max_candidates = max_candidates
+        self.seeds = []
+        self.seed_index = defaultdict(list)
+        self.groups = []
+        self.last = None
+
+    def get_group(self, description):
+        """
+        Returns the number of the group a description falls into, creating a new group if none is similar.
+
+        :param description: The transaction's description.
+        :return: The group's number.
+        """
+        words = tokenize(description)
+        candidates = set()
+        for key in enumerate(words):
+            candidates.update(self.seed_index.get(key, ()))
+        for number in sorted(candidates):
+            if compare_tokens(words, self.seeds[number]) > SIMILARITY_RATIO:
+                return number
+
+        number = len(self.groups)
+        self.seeds.append(words)
+        for key in enumerate(words):
+            self.seed_index[key].append(number)
+        self.groups.append(GroupState(self.history_size))
+        return number
+
+    def add(self, transaction):
+        """
+        Feeds a transaction to the detector.
+
+        :param transaction: Transaction, not earlier than the ones fed before it.
+        :raise ValueError: If the transaction is earlier than the last one.
+        :return: List of SequenceEvent caused by the transaction.
+        """
+        ordinal = transaction.date.toordinal()
+        if self.last is not None and ordinal < self.last:
+            raise ValueError('Transactions should be fed in date order')
+        self.last = ordinal
+
+        number = self.get_group(transaction.description)
+        group = self.groups[number]
+        margin = self.margin
+
+        group.candidates = [candidate for candidate in group.candidates if not candidate.is_expired(ordinal, margin)]
+
+        # Transactions extending a sequence belong to it, and to nothing else.
+        for candidate in group.candidates:
+            if candidate.sequence is not None and candidate.accepts(ordinal, margin):
+                candidate.sequence.add_transaction(transaction, margin, set_ownership=True)
+                candidate.last = ordinal
+                return [SequenceEvent(EXTENDED, number, candidate.sequence, transaction)]
+
+        events = []
+        extended = set()
+        for candidate in group.candidates:
+            if candidate.sequence is None and candidate.accepts(ordinal, margin):
+                extended.add(candidate.members[-1].id)
+                candidate.members.append(transaction)
+                candidate.last = ordinal
+                if len(candidate.members) >= MINIMUM_TRANSACTIONS:
+                    events.append(self.confirm(number, candidate, transaction))
+                    break
+
+        if events:
+            # Candidates holding transactions of the new sequence can't become sequences anymore.
+            group.candidates = [candidate for candidate in group.candidates
+                                if candidate.sequence is not None
+                                or all(member.sequence is None for member in candidate.members)]
+            return events
+
+        while group.history and ordinal - group.history[0].date.toordinal() > self.max_interval + margin:
+            group.history.popleft()
+
+        for previous in group.history:
+            days = ordinal - previous.date.toordinal()
+            if previous.sequence is None and previous.id not in extended and days >= MINIMUM_INTERVAL:
+                group.candidates.append(Candidate(days, [previous, transaction]))
+
+        if len(group.candidates) > self.max_candidates:
+            confirmed = [candidate for candidate in group.candidates if candidate.sequence is not None]
+            pending = [candidate for candidate in group.candidates if candidate.sequence is None]
+            group.candidates = confirmed + pending[len(group.candidates) - self.max_candidates:]
+
+        group.history.append(transaction)
+        return events
+
+    def confirm(self, number, candidate, transaction):
+        sequence = TransactionSequence(interval=candidate.interval)
+        sequence.add_transactions(candidate.members, self.margin, set_ownership=True)
+        candidate.sequence = sequence
+        candidate.members = []
+        return SequenceEvent(DETECTED, number, sequence, transaction)
+
+    def process(self, json_transactions):
+        """
+        Feeds transactions in a dict format to the detector, yielding events as they happen.
+
+        :param json_transactions: Iterable of transactions in a dict format, in date order.
+        """
+        for transaction in json_transactions:
+            yield from self.add(Transaction(**transaction))
@@ -0,0 +1,249 @@
+"""
+A registry of storages, one for each account, so a single process can serve many accounts.
+
+Each account gets its own StorageState. The registry holds a budget of accounts and of transactions,
+and evicts the least recently used accounts past it. Evicted storages can be spilled to snapshot files,
+which are memory-mapped back on the account's next request instead of being parsed again. Storage backends
+already keep their sequences on disk, so they don't count against the budget of transactions, and evicting them
+only drops their cache.
+
+Only requests publishing a storage create states: lookups find an account's existing or spilled state, so
+lookups for unknown accounts never evict the loaded ones.
+
+Accounts in use by a request publishing a new storage, or by a background job, are never evicted, so their new
+storages can't be lost. The registry's lock only guards its bookkeeping: storages are measured as they are
+published, and spilled after being evicted, without holding it.
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from hashlib import blake2b
+import os
+import threading
+
+from src.transactions.backends import StorageBackend
+from src.transactions.jobs import StorageState
+from src.transactions.models import SequenceStorage
+from src.transactions.snapshot import SnapshotStorage, write_snapshot
+
+
+DEFAULT_ACCOUNT = 'default'
+
+
+def get_account_name(account):
+    """
+    Returns a file name for an account, since account ids may contain any character.
+
+    :param account: The account's id.
+    :return: A hexadecimal digest of the id.
+    """
+    return blake2b(account.encode('utf-8', 'surrogatepass'), digest_size=16).hexdigest()
+
+
+def get_storage_size(storage):
+    """
+    Estimates the size of a storage, in transactions.
+
+    :param storage: Storage to be measured.
+    :return: Number of transactions held by the storage.
+    """
+    if storage is None or isinstance(storage, StorageBackend):
+        return 0
+    if isinstance(storage, SequenceStorage):
+        return sum(len(group) for group in storage.groups.values()) or len(storage.sequences)
+    return len(storage)
+
+
+class TenantRegistry:
+    """
+    Holds a StorageState for each account, in least recently used order.
+
+    :param create_state: Function receiving an account id and returning a new StorageState.
+    :param has_storage: Optional function receiving an account id, and indicating whether the account has a storage
+    outside of the registry, such as a snapshot published by another process.
+    :param max_tenants: Optional number of accounts kept in memory.
+    :param max_transactions: Optional number of transactions kept in memory, over all accounts.
+    :param spill_dir: Optional directory for the snapshots of evicted storages.
+    :param max_workers: Number of threads running background jobs, shared by all accounts.
+    """
+
+    def __init__(self, create_state=None, max_tenants=None, max_transactions=None, spill_dir=None, max_workers=1,
+                 has_storage=None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.create_state = create_state or (lambda account: StorageState(executor=self.executor))
+        self.has_storage = has_storage or (lambda account: False)
+        self.max_tenants = max_tenants
+        self.max_transactions = max_transactions
+        self.spill_dir = spill_dir
+        self.states = OrderedDict()
+        self.sizes = {}
+        self.total = 0
+        self.spilling = {}
+        self.backends = {}
+        self.lock = threading.Lock()
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def get_spill_path(self, account):
+        return os.path.join(self.spill_dir, get_account_name(account) + '.snapshot')
+
+    def get(self, account=DEFAULT_ACCOUNT):
+        """
+        Returns an account's state, creating it or reloading its spilled storage if needed.
+        Other accounts are evicted if the budget was exceeded.
+
+        :param account: The account's id.
+        :return: StorageState
+        """
+        return self.acquire(account)
+
+    def find(self, account=DEFAULT_ACCOUNT):
+        """
+        Returns an account's state for a lookup, reloading its spilled storage if needed, without creating a state
+        for an account that has no storage.
+
+        :param account: The account's id.
+        :return: StorageState, or None if the account has no storage.
+        """
+        with self.lock:
+            state = self.states.get(account)
+            if state is not None:
+                self.states.move_to_end(account)
+                return state
+            if account not in self.spilling and account not in self.backends and not self.is_spilled(account) \
+                    and not self.has_storage(account):
+                return None
+            state = self.create(account)
+        # Restored accounts hold a storage again, so they count against the budget like loaded ones.
+        self.evict(keep=account)
+        return state
+
+    def is_spilled(self, account):
+        return bool(self.spill_dir) and os.path.exists(self.get_spill_path(account))
+
+    @contextmanager
+    def use(self, account=DEFAULT_ACCOUNT):
+        """
+        Provides an account's state to a request publishing a new storage, keeping the account from being evicted
+        until it is done.
+
+        :param account: The account's id.
+        """
+        state = self.acquire(account, users=1)
+        try:
+            yield state
+        finally:
+            with self.lock:
+                state.users -= 1
+
+    def acquire(self, account, users=0):
+        """
+        Returns an account's state, creating it if needed, and adds to its users.
+
+        :param account: The account's id.
+        :param users: Number of users added to the state.
+        :return: StorageState
+        """
+        with self.lock:
+            state = self.states.get(account)
+            if state is None:
+                state = self.create(account)
+            state.users += users
+            self.states.move_to_end(account)
+        self.evict(keep=account)
+        return state
+
+    def create(self, account):
+        # Called with the lock held. Storages still being spilled, or already spilled, are restored as they were,
+        # not published again.
+        state = self.states[account] = self.create_state(account)
+        state.on_swap = lambda storage: self.resize(account, state, storage)
+
+        storage, size = self.spilling.get(account, (None, 0))
+        if storage is None:
+            storage = self.backends.pop(account, None)
+        if storage is None and self.is_spilled(account):
+            storage = SnapshotStorage(self.get_spill_path(account))
+            size = len(storage)
+        if storage is not None:
+            state.storage = storage
+            self.sizes[account] = size
+            self.total += size
+        return state
+
+    def resize(self, account, state, storage):
+        # Storages are measured as they are published, so the registry's total is kept up to date.
+        size = get_storage_size(storage)
+        with self.lock:
+            if self.states.get(account) is state:
+                self.total += size - self.sizes.get(account, 0)
+                self.sizes[account] = size
+
+    def is_over_budget(self):
+        if self.max_tenants is not None and len(self.states) > self.max_tenants:
+            return True
+        return self.max_transactions is not None and self.total > self.max_transactions
+
+    def evict(self, keep=None):
+        """
+        Evicts the least recently used accounts until the registry is within its budget.
+        Accounts in use or with running jobs are never evicted.
+
+        :param keep: Optional account that should not be evicted.
+        :return: List of the evicted account ids.
+        """
+        evicted = []
+        spilled = []
+        backends = []
+        with self.lock:
+            if not self.is_over_budget():
+                return evicted
+
+            for account in list(self.states):
+                if not self.is_over_budget():
+                    break
+                state = self.states[account]
+                if account == keep or state.is_busy():
+                    continue
+
+                del self.states[account]
+                size = self.sizes.pop(account, 0)
+                self.total -= size
+                if isinstance(state.storage, StorageBackend):
+                    self.backends[account] = state.storage
+                    backends.append(state.storage)
+                elif self.spill_dir and state.storage is not None:
+                    self.spilling[account] = (state.storage, size)
+                    spilled.append((account, state.storage))
+                evicted.append(account)
+
+        for storage in backends:
+            storage.clear_cache()
+
+        # Snapshots are written without holding the lock. Meanwhile, requests for the account get
+        # the storage being spilled back.
+        for account, storage in spilled:
+            try:
+                self.spill(account, storage)
+            finally:
+                with self.lock:
+                    if self.spilling.get(account, (None,))[0] is storage:
+                        del self.spilling[account]
+        return evicted
+
+    def spill(self, account, storage):
+        """
+        Writes an evicted storage to its account's snapshot, if the registry has a spill directory.
+
+        :param account: The account's id.
+        :param storage: The account's storage.
+        """
+        # Storages restored from a snapshot are already there.
+        if self.spill_dir and storage is not None and not isinstance(storage, SnapshotStorage):
+            write_snapshot(storage, self.get_spill_path(account))
+
+    def __contains__(self, account):
+        return account in self.states
+
+    def __len__(self):
+        return len(self.states)
@@ -0,0 +1,13 @@
+def get_transactions(description='TEST INVOICE 1234', amount='435.23', start=2, count=4, days=7):
+    """
+    Returns transactions in a dict format with the same description and amount, one every few days of January 2020.
+
+    :param description: The transactions' description.
+    :param amount: The transactions' amount.
+    :param start: Day of the first transaction.
+    :param count: Number of transactions.
+    :param days: Number of days between transactions.
+    :return: List of transactions in a dict format.
+    """
+    return [dict(date='01/{:02d}/2020'.format(day), description=description, amount=amount)
+            for day in range(start, start + days * count, days)]
@@ -0,0 +1,121 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src.transactions.backends import SQLiteStorage
+from src.transactions.models import Transaction, TransactionSequence, TransactionBatch, SequenceStorage
+from src.transactions.parser import parse_storage
+from tests import get_transactions
+
+
+class SQLiteStorageTests(unittest.TestCase):
+
+    def test_parse_storage(self):
+        transactions = get_transactions() + get_transactions('ANOTHER TEST 1432', start=1)
+        expected = parse_storage(transactions)
+        storage = parse_storage(transactions, storage=SQLiteStorage())
+
+        assert isinstance(storage, SQLiteStorage)
+        assert len(storage) == len(expected.sequences) == 8
+        for key, sequence in expected.sequences.items():
+            transaction = sequence.transactions[key]
+            assert storage.get_response(transaction) == sequence.to_bytes()
+            assert str(storage.get_sequence(transaction)) == str(sequence)
+
+        missing = Transaction(date='01/02/2020', description='TEST INVOICE 1234', amount='435.24')
+        assert storage.get_sequence(missing) is None
+        assert storage.get_response(missing) is None
+
+    def test_persistence(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'storage.sqlite')
+            storage = parse_storage(get_transactions(), storage=SQLiteStorage(path))
+            storage.close()
+
+            storage = SQLiteStorage(path)
+            transaction = Transaction(date='01/09/2020', description='TEST INVOICE 1234', amount='435.23')
+            sequence = storage.get_sequence(transaction)
+            assert len(sequence) == 4
+            assert transaction in sequence
+            assert sequence.get_first_transaction().sequence is sequence
+            storage.close()
+
+    def test_add_sequences(self):
+        transactions = [Transaction(**transaction) for transaction in get_transactions()]
+        first = TransactionSequence(7)
+        first.add_transactions(transactions[:2], margin=3)
+        second = TransactionSequence(7)
+        second.add_transactions(transactions[1:], margin=3)
+
+        storage = SQLiteStorage()
+        storage.add_sequences([first])
+        storage.add_sequence(second)
+        # Keys shared by both sequences point to the last one.
+        assert len(storage) == 4
+        assert storage.get_response(transactions[0]) == first.to_bytes()
+        assert storage.get_response(transactions[1]) == second.to_bytes()
+
+    def test_cache(self):
+        storage = parse_storage(get_transactions() + get_transactions('ANOTHER TEST 1432', start=1),
+                                storage=SQLiteStorage(cache_size=1))
+        first = Transaction(date='01/02/2020', description='TEST INVOICE 1234', amount='435.23')
+        second = Transaction(date='01/01/2020', description='ANOTHER TEST 1432', amount='435.23')
+
+        sequence = storage.get_sequence(first)
+        assert storage.get_sequence(first) is sequence
+        storage.get_sequence(second)
+        assert list(storage.cache) == [storage.get_sequence_number(second.id)]
+        assert storage.get_sequence(first) is not sequence
+
+    def test_batch(self):
+        with self.assertRaises(ValueError):
+            parse_storage(TransactionBatch.from_dicts(get_transactions()), storage=SQLiteStorage())
+
+    def test_parse_storage_streaming(self):
+        transactions = get_transactions() + get_transactions('ANOTHER TEST 1432', start=1)
+        expected = parse_storage(transactions)
+        storage = SQLiteStorage()
+
+        # Each group's sequences are added as they are parsed, without building a SequenceStorage.
+        with patch('src.transactions.parser.SequenceStorage', side_effect=AssertionError), \
+                patch.object(storage, 'add_sequences', wraps=storage.add_sequences) as add_sequences:
+            parse_storage(transactions, storage=storage)
+        assert add_sequences.call_count == 2
+        assert [str(sequence) for sequence in storage.iter_sequences()] == \
+            [str(sequence) for sequence in expected.iter_sequences()]
+
+    def test_parse_storage_retention(self):
+        # The first sequence is trimmed, and the second one is dropped.
+        transactions = get_transactions(count=6, days=5) + get_transactions('ANOTHER TEST 1432', start=1)
+        expected = parse_storage(transactions, retention=16)
+        storage = parse_storage(transactions, storage=SQLiteStorage(), retention=16)
+
+        assert isinstance(expected, SequenceStorage)
+        assert sorted(str(sequence) for sequence in storage.iter_sequences()) == \
+            sorted(str(sequence) for sequence in expected.iter_sequences())
+        assert len(storage) == len(expected.sequences) == 4
+
+    def test_iter_sequences_replaced(self):
+        transactions = [Transaction(**transaction) for transaction in get_transactions()]
+        first = TransactionSequence(7)
+        first.add_transactions(transactions[:2], margin=3)
+        second = TransactionSequence(7)
+        second.add_transactions(transactions, margin=3)
+
+        storage = SQLiteStorage()
+        storage.add_sequences([first, second])
+        # Every key of the first sequence was taken by the second one.
+        assert [str(sequence) for sequence in storage.iter_sequences(chunk_size=1)] == [str(second)]
+
+    def test_delete(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'storage.sqlite')
+            storage = parse_storage(get_transactions(), storage=SQLiteStorage(path, delete=True))
+            assert os.path.exists(path)
+            del storage
+            assert not os.path.exists(path)
+
+            storage = SQLiteStorage(path)
+            storage.close()
+            assert os.path.exists(path)
@@ -0,0 +1,44 @@
+import unittest
+
+from benchmarks.generator import generate_transactions
+from benchmarks.suite import measure, run_suite, BENCHMARKS
+from src.transactions.parser import parse_storage
+
+
+class GeneratorTests(unittest.TestCase):
+
+    def test_generate_transactions(self):
+        transactions = generate_transactions(500, seed=3)
+        assert len(transactions) == 500
+        assert transactions == generate_transactions(500, seed=3)
+        assert transactions != generate_transactions(500, seed=4)
+        assert set(transactions[0]) == {'date', 'description', 'amount'}
+
+    def test_recurring_merchants(self):
+        transactions = generate_transactions(200, merchants=4, recurring_ratio=1, noise=0)
+        assert len({transaction['description'] for transaction in transactions}) == 4
+        assert len(parse_storage(transactions).sequences) > 0
+
+    def test_invalid_options(self):
+        with self.assertRaises(ValueError):
+            generate_transactions(10, jitter=10)
+        with self.assertRaises(ValueError):
+            generate_transactions(10, recurring_ratio=2)
+
+
+class SuiteTests(unittest.TestCase):
+
+    def test_measure(self):
+        result = measure('sum', 10, 100, lambda argument: sum(argument), setup=lambda: range(100), repeat=2)
+        assert result['name'] == 'sum'
+        assert result['size'] == 10
+        assert result['items'] == 100
+        assert result['seconds'] > 0
+        assert result['peak_bytes'] is not None
+        assert result['throughput'] == 100 / result['seconds']
+
+    def test_run_suite(self):
+        results = run_suite(sizes=[50], repeat=1, memory=False)
+        assert results['generator']['seed'] == 0
+        assert len(results['results']) == len(BENCHMARKS) + 2
+        assert all(result['peak_bytes'] is None for result in results['results'])
@@ -0,0 +1,493 @@
+import datetime
+import gc
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from flask import Flask
+
+from src.transactions.backends import SQLiteStorage
+from src.transactions.blueprint import mod_transactions, encode_sequences, encode_sequence_list, encode_upcoming
+from src.transactions.models import get_transaction_key
+from src.transactions.parser import parse_storage
+from src.transactions.tenants import DEFAULT_ACCOUNT
+from tests import get_transactions
+
+
+class EncodeSequencesTests(unittest.TestCase):
+
+    def test_encode_sequences(self):
+        storage = parse_storage([dict(date='01/{:02d}/2020'.format(day), description=description, amount=10)
+                                 for description in ['TEST INVOICE 1234', 'STREAMING SUBSCRIPTION']
+                                 for day in range(2, 30, 7)])
+        keys = [get_transaction_key('01/09/2020', 'STREAMING SUBSCRIPTION', 10),
+                get_transaction_key('01/09/2020', 'TEST INVOICE 1234', 10),
+                get_transaction_key('01/10/2020', 'TEST INVOICE 1234', 10),
+                get_transaction_key('01/16/2020', 'STREAMING SUBSCRIPTION', 10)]
+
+        encoded = json.loads(encode_sequences(storage, keys))
+        assert encoded['transactions'] == [0, 1, None, 0]
+        assert encoded['sequences'] == [storage.sequences[keys[0]].to_dict(), storage.sequences[keys[1]].to_dict()]
+
+    def test_encode_no_sequences(self):
+        encoded = json.loads(encode_sequences(parse_storage([]), []))
+        assert encoded == dict(sequences=[], transactions=[])
+
+
+class EncodeSequenceListTests(unittest.TestCase):
+
+    def test_encode_sequence_list(self):
+        storage = parse_storage([dict(date='01/{:02d}/2020'.format(day), description=description, amount=10)
+                                 for description in ['TEST INVOICE 1234', 'STREAMING SUBSCRIPTION']
+                                 for day in range(2, 30, 7)])
+        sequences = list(storage.iter_sequences())
+        encoded = json.loads(encode_sequence_list(sequences))
+        assert encoded == dict(sequences=[sequence.to_dict() for sequence in sequences])
+        assert json.loads(encode_sequence_list([])) == dict(sequences=[])
+
+
+class EncodeUpcomingTests(unittest.TestCase):
+
+    def test_encode_upcoming(self):
+        storage = parse_storage([dict(date='01/{:02d}/2020'.format(day), description='TEST INVOICE 1234', amount=10)
+                                 for day in range(2, 30, 7)])
+        sequence = next(storage.iter_sequences())
+        encoded = json.loads(encode_upcoming([(datetime.datetime(2020, 2, 1), sequence)], 3))
+        assert encoded == dict(upcoming=[dict(date='02/01/2020', earliest='01/29/2020', latest='02/04/2020',
+                                              sequence=sequence.to_dict())])
+        assert json.loads(encode_upcoming([], 3)) == dict(upcoming=[])
+
+
+def create_client(**config):
+    app = Flask(__name__)
+    app.config.update(config)
+    app.register_blueprint(mod_transactions)
+    return app.test_client()
+
+
+def get_payload(description='TEST INVOICE 1234', count=4):
+    return dict(transactions=get_transactions(description, 10, count=count))
+
+
+class LoadTests(unittest.TestCase):
+
+    def test_load(self):
+        client = create_client()
+        response = client.post('/transactions/load', json=get_payload())
+        assert response.status_code == 200
+        response = client.post('/transactions/get_sequence', json=dict(transaction=get_payload()['transactions'][0]))
+        assert json.loads(response.data)['interval'] == 7
+
+    @patch('src.transactions.blueprint.get_default_storage')
+    def test_load_default(self, get_default_storage):
+        get_default_storage.return_value = parse_storage(get_payload()['transactions'])
+        client = create_client()
+        for body in ['', '{"account": 1}']:
+            response = client.post('/transactions/load', data=body, content_type='application/json')
+            assert response.status_code == 200
+        assert get_default_storage.call_count == 2
+
+    def test_load_sample(self):
+        # The sample data is read from the working directory.
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(os.path.join(os.path.dirname(__file__), os.pardir, 'src'))
+        client = create_client()
+        for body in ['', '{"account": 1}']:
+            response = client.post('/transactions/load', data=body, content_type='application/json')
+            assert response.status_code == 200
+        assert client.get('/transactions/export').data.count(b'\n') > 0
+
+    @patch('src.transactions.blueprint.get_default_storage')
+    def test_load_invalid(self, get_default_storage):
+        client = create_client()
+        valid = json.dumps(get_payload())
+        for body in [valid[:-20], valid.replace('"amount": 10', '"amount": 10,,'), '{"transactions": 1}',
+                     '{"transactions": [1]}', '{"transactions": [{"date": "01/02/2020"}]}']:
+            response = client.post('/transactions/load', data=body, content_type='application/json')
+            assert response.status_code == 400
+        assert not get_default_storage.called
+
+    def test_invalid_amounts(self):
+        client = create_client()
+        for amount in ['abc', None, 'NaN']:
+            transaction = dict(date='01/02/2020', description='TEST INVOICE 1234', amount=amount)
+            response = client.post('/transactions/load', json=dict(transactions=[transaction]))
+            assert response.status_code == 400
+            response = client.post('/transactions/get_sequence', json=dict(transaction=transaction))
+            assert response.status_code == 400
+
+
+class SharedSnapshotTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_read_other_worker(self):
+        first = create_client(TRANSACTIONS_SNAPSHOT_DIR=self.directory.name)
+        second = create_client(TRANSACTIONS_SNAPSHOT_DIR=self.directory.name)
+        assert first.post('/transactions/load?account=a', json=get_payload()).status_code == 200
+
+        # Accounts loaded by another worker are read from their snapshot.
+        transaction = dict(transaction=get_payload()['transactions'][0])
+        response = second.post('/transactions/get_sequence?account=a', json=transaction)
+        assert response.get_json()['interval'] == 7
+        assert second.post('/transactions/get_sequence?account=b', json=transaction).status_code == 400
+
+    def test_job_other_worker(self):
+        first = create_client(TRANSACTIONS_SNAPSHOT_DIR=self.directory.name)
+        second = create_client(TRANSACTIONS_SNAPSHOT_DIR=self.directory.name)
+        locations = []
+        for query in ['', '&account=a']:
+            response = first.post('/transactions/load?async=1' + query, json=get_payload())
+            assert response.status_code == 202
+            locations.append(response.headers['Location'])
+        first.application.extensions['transactions'].executor.shutdown(wait=True)
+
+        # Jobs are polled from any worker, even one that never loaded the account.
+        for location in locations:
+            response = second.get(location)
+            assert response.status_code == 200
+            assert response.get_json()['status'] == 'done'
+        assert second.get('/transactions/jobs/{:032x}'.format(0)).status_code == 404
+        assert second.get('/transactions/jobs/{:032x}?account=b'.format(0)).status_code == 404
+
+    def test_append_stale(self):
+        # Two apps sharing a snapshot directory stand for two worker processes.
+        first = create_client(TRANSACTIONS_SNAPSHOT_DIR=self.directory.name)
+        second = create_client(TRANSACTIONS_SNAPSHOT_DIR=self.directory.name)
+        assert first.post('/transactions/load', json=get_payload()).status_code == 200
+        assert second.post('/transactions/load', json=get_payload('STREAMING SUBSCRIPTION')).status_code == 200
+
+        response = first.post('/transactions/append', json=get_payload('MONTHLY RENT'))
+        assert response.status_code == 409
+
+        # The newer snapshot is still the one both apps read from.
+        transaction = get_payload('STREAMING SUBSCRIPTION')['transactions'][0]
+        for client in [first, second]:
+            response = client.post('/transactions/get_sequence', json=dict(transaction=transaction))
+            assert json.loads(response.data)['interval'] == 7
+
+        assert second.post('/transactions/append', json=get_payload('MONTHLY RENT')).status_code == 200
+        transaction = get_payload('MONTHLY RENT')['transactions'][0]
+        response = first.post('/transactions/get_sequence', json=dict(transaction=transaction))
+        assert json.loads(response.data)['interval'] == 7
+
+
+class AccountTests(unittest.TestCase):
+
+    def test_accounts(self):
+        client = create_client()
+        assert client.post('/transactions/load', json=get_payload()).status_code == 200
+        response = client.post('/transactions/load?account=a', json=get_payload('STREAMING SUBSCRIPTION'))
+        assert response.status_code == 200
+        response = client.post('/transactions/load', json=get_payload('MONTHLY RENT'), headers={'X-Account-Id': 'b'})
+        assert response.status_code == 200
+
+        def get_sequence(description, query='', headers=None):
+            transaction = get_payload(description)['transactions'][0]
+            return client.post('/transactions/get_sequence' + query, json=dict(transaction=transaction),
+                               headers=headers)
+
+        # Each account is served from its own storage, given either as a parameter or as a header.
+        assert get_sequence('TEST INVOICE 1234').get_json()['interval'] == 7
+        assert get_sequence('STREAMING SUBSCRIPTION').data == b'None'
+        assert get_sequence('STREAMING SUBSCRIPTION', '?account=a').get_json()['interval'] == 7
+        assert get_sequence('STREAMING SUBSCRIPTION', headers={'X-Account-Id': 'a'}).get_json()['interval'] == 7
+        assert get_sequence('TEST INVOICE 1234', '?account=a').data == b'None'
+        assert get_sequence('MONTHLY RENT', '?account=b').get_json()['interval'] == 7
+        assert get_sequence('MONTHLY RENT', headers={'X-Account-Id': 'a'}).data == b'None'
+
+        # The parameter is preferred to the header.
+        assert get_sequence('MONTHLY RENT', '?account=b', {'X-Account-Id': 'a'}).get_json()['interval'] == 7
+        # Accounts without a loaded storage don't fall back to the default one.
+        assert get_sequence('TEST INVOICE 1234', '?account=c').status_code == 400
+
+    def test_unknown_accounts(self):
+        client = create_client(TRANSACTIONS_MAX_TENANTS=2)
+        assert client.post('/transactions/load?account=a', json=get_payload()).status_code == 200
+        assert client.post('/transactions/load?account=b', json=get_payload()).status_code == 200
+
+        # Lookups for unknown accounts don't evict the loaded ones.
+        transaction = dict(transaction=get_payload()['transactions'][0])
+        for account in ['x', 'y']:
+            assert client.post('/transactions/get_sequence?account=' + account, json=transaction).status_code == 400
+            assert client.get('/transactions/export?account=' + account).status_code == 400
+            assert client.get('/transactions/jobs/unknown?account=' + account).status_code == 404
+        for account in ['a', 'b']:
+            response = client.post('/transactions/get_sequence?account=' + account, json=transaction)
+            assert response.get_json()['interval'] == 7
+
+    def test_job_location(self):
+        client = create_client()
+        for headers, location in [({}, None), ({'X-Account-Id': 'a'}, 'account=a')]:
+            response = client.post('/transactions/load?async=1', json=get_payload(), headers=headers)
+            assert response.status_code == 202
+            if location is None:
+                assert '?' not in response.headers['Location']
+            else:
+                assert response.headers['Location'].endswith(location)
+            job_id = response.get_json()['id']
+            assert client.get(response.headers['Location']).get_json()['id'] == job_id
+
+
+class JobTests(unittest.TestCase):
+
+    def test_load_async(self):
+        client = create_client()
+        response = client.post('/transactions/load?async=1', json=get_payload())
+        assert response.status_code == 202
+        assert response.get_json()['status'] in ('pending', 'running', 'done')
+
+        # Waits for the job to finish.
+        client.application.extensions['transactions'].executor.shutdown(wait=True)
+        response = client.get(response.headers['Location'])
+        assert response.status_code == 200
+        assert response.get_json()['status'] == 'done'
+        assert response.get_json()['version'] == 1
+
+        response = client.post('/transactions/get_sequence', json=dict(transaction=get_payload()['transactions'][0]))
+        assert json.loads(response.data)['interval'] == 7
+
+    def test_load_async_invalid(self):
+        client = create_client()
+        response = client.post('/transactions/load?async=1', data='{"transactions": [1]}',
+                               content_type='application/json')
+        assert response.status_code == 202
+
+        client.application.extensions['transactions'].executor.shutdown(wait=True)
+        job = client.get(response.headers['Location']).get_json()
+        assert job['status'] == 'failed'
+        assert job['error']
+        assert client.post('/transactions/get_sequence',
+                           json=dict(transaction=get_payload()['transactions'][0])).status_code == 400
+
+    def test_unknown_job(self):
+        client = create_client()
+        assert client.get('/transactions/jobs/unknown').status_code == 404
+
+
+class AppendTests(unittest.TestCase):
+
+    def test_append(self):
+        client = create_client()
+        assert client.post('/transactions/load', json=get_payload()).status_code == 200
+        response = client.post('/transactions/append', json=get_payload('STREAMING SUBSCRIPTION'))
+        assert response.status_code == 200
+
+        for description in ['TEST INVOICE 1234', 'STREAMING SUBSCRIPTION']:
+            transaction = get_payload(description)['transactions'][0]
+            response = client.post('/transactions/get_sequence', json=dict(transaction=transaction))
+            assert json.loads(response.data)['interval'] == 7
+
+    def test_append_ndjson(self):
+        client = create_client()
+        assert client.post('/transactions/load', json=get_payload(count=2)).status_code == 200
+        body = '\n'.join(json.dumps(transaction) for transaction in get_payload()['transactions'][2:])
+        response = client.post('/transactions/append', data=body, content_type='application/x-ndjson')
+        assert response.status_code == 200
+
+        transaction = get_payload()['transactions'][0]
+        response = client.post('/transactions/get_sequence', json=dict(transaction=transaction))
+        assert json.loads(response.data)['interval'] == 7
+
+    def test_append_not_loaded(self):
+        client = create_client()
+        response = client.post('/transactions/append', json=get_payload())
+        assert response.status_code == 400
+
+    def test_append_invalid(self):
+        client = create_client()
+        assert client.post('/transactions/load', json=get_payload()).status_code == 200
+        for body in ['', '{"account": 1}', '{"transactions": [1]}', '{"transactions": [{"date": "01/02/2020"}]}']:
+            response = client.post('/transactions/append', data=body, content_type='application/json')
+            assert response.status_code == 400
+
+        # The loaded storage is kept.
+        transaction = get_payload()['transactions'][0]
+        response = client.post('/transactions/get_sequence', json=dict(transaction=transaction))
+        assert json.loads(response.data)['interval'] == 7
+
+
+class GetSequencesTests(unittest.TestCase):
+
+    def test_get_sequences(self):
+        client = create_client()
+        assert client.post('/transactions/load', json=get_payload()).status_code == 200
+        transactions = get_payload()['transactions'][:2] + get_payload('STREAMING SUBSCRIPTION')['transactions'][:1]
+        response = client.post('/transactions/get_sequences', json=dict(transactions=transactions))
+        assert response.status_code == 200
+
+        encoded = response.get_json()
+        assert encoded['transactions'] == [0, 0, None]
+        assert len(encoded['sequences']) == 1
+        assert encoded['sequences'][0]['interval'] == 7
+
+    def test_get_sequences_not_loaded(self):
+        client = create_client()
+        response = client.post('/transactions/get_sequences', json=get_payload())
+        assert response.status_code == 400
+
+    def test_get_sequences_invalid(self):
+        client = create_client()
+        assert client.post('/transactions/load', json=get_payload()).status_code == 200
+        for body in ['{', '{}', '{"transactions": 1}', '{"transactions": [1]}',
+                     '{"transactions": [{"date": "01/02/2020"}]}',
+                     '{"transactions": [{"date": "01/02/2020", "description": "TEST", "amount": "abc"}]}']:
+            response = client.post('/transactions/get_sequences', data=body, content_type='application/json')
+            assert response.status_code == 400
+
+
+class ExportTests(unittest.TestCase):
+
+    def test_export(self):
+        client = create_client()
+        transactions = get_payload()['transactions'] + get_payload('STREAMING SUBSCRIPTION')['transactions']
+        assert client.post('/transactions/load', json=dict(transactions=transactions)).status_code == 200
+        response = client.get('/transactions/export')
+        assert response.status_code == 200
+        assert response.mimetype == 'application/x-ndjson'
+
+        lines = response.data.decode('utf-8').splitlines()
+        sequences = [json.loads(line) for line in lines]
+        assert len(sequences) == 2
+        assert all(sequence['interval'] == 7 for sequence in sequences)
+
+    def test_export_empty(self):
+        client = create_client()
+        assert client.post('/transactions/load', json=dict(transactions=[])).status_code == 200
+        response = client.get('/transactions/export')
+        assert response.status_code == 200
+        assert response.data == b''
+
+    def test_export_not_loaded(self):
+        client = create_client()
+        assert client.get('/transactions/export').status_code == 400
+
+
+def get_monthly_payload():
+    # A weekly sequence in January, and a monthly one from January to April.
+    monthly = [dict(date='{:02d}/15/2020'.format(month), description='MONTHLY RENT', amount=800)
+               for month in range(1, 5)]
+    return dict(transactions=get_payload()['transactions'] + monthly)
+
+
+class QuerySequencesTests(unittest.TestCase):
+
+    def setUp(self):
+        self.client = create_client()
+        assert self.client.post('/transactions/load', json=get_monthly_payload()).status_code == 200
+
+    def query(self, query):
+        response = self.client.get('/transactions/sequences?' + query)
+        assert response.status_code == 200
+        return sorted(sequence['transactions'][0]['description'] for sequence in response.get_json()['sequences'])
+
+    def test_dates(self):
+        assert self.query('from=01/01/2020&to=01/31/2020') == ['MONTHLY RENT', 'TEST INVOICE 1234']
+        assert self.query('from=02/01/2020&to=02/29/2020') == ['MONTHLY RENT']
+        assert self.query('from=01/01/2020&to=01/10/2020&by=first') == ['TEST INVOICE 1234']
+        assert self.query('from=04/01/2020&to=04/30/2020&by=last') == ['MONTHLY RENT']
+        assert self.query('from=05/01/2020&to=05/31/2020') == []
+
+    def test_interval(self):
+        assert self.query('interval=7') == ['TEST INVOICE 1234']
+        assert self.query('interval=30') == ['MONTHLY RENT']
+        assert self.query('interval=14&margin=0') == []
+
+    def test_invalid(self):
+        for query in ['', 'from=01/01/2020', 'from=01/01/2020&to=abc', 'from=01/01/2020&to=01/31/2020&by=middle',
+                      'interval=abc', 'interval=7&margin=abc', 'interval=7&from=01/01/2020&to=01/31/2020',
+                      'interval=7&to=01/31/2020', 'interval=7&by=first', 'from=01/01/2020&to=01/31/2020&margin=3']:
+            assert self.client.get('/transactions/sequences?' + query).status_code == 400
+
+    def test_not_loaded(self):
+        client = create_client()
+        assert client.get('/transactions/sequences?interval=7').status_code == 400
+
+
+class UpcomingTests(unittest.TestCase):
+
+    def test_upcoming(self):
+        client = create_client()
+        assert client.post('/transactions/load', json=get_monthly_payload()).status_code == 200
+        response = client.get('/transactions/upcoming?from=01/25/2020&to=02/05/2020')
+        assert response.status_code == 200
+
+        upcoming = response.get_json()['upcoming']
+        assert [(item['date'], item['earliest'], item['latest']) for item in upcoming] == \
+            [('01/30/2020', '01/27/2020', '02/02/2020')]
+        assert upcoming[0]['sequence']['interval'] == 7
+
+        response = client.get('/transactions/upcoming?from=05/01/2020&to=05/31/2020')
+        upcoming = response.get_json()['upcoming']
+        assert [item['sequence']['transactions'][0]['description'] for item in upcoming] == ['MONTHLY RENT']
+        response = client.get('/transactions/upcoming?from=07/01/2020&to=07/31/2020')
+        assert response.get_json()['upcoming'] == []
+
+    def test_invalid(self):
+        client = create_client()
+        assert client.post('/transactions/load', json=get_monthly_payload()).status_code == 200
+        for query in ['', 'from=01/25/2020', 'to=02/05/2020', 'from=01/25/2020&to=abc']:
+            assert client.get('/transactions/upcoming?' + query).status_code == 400
+
+    def test_not_loaded(self):
+        client = create_client()
+        assert client.get('/transactions/upcoming?from=01/25/2020&to=02/05/2020').status_code == 400
+
+
+class SQLiteTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.client = create_client(TRANSACTIONS_SQLITE_DIR=self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def get_storage(self, account=DEFAULT_ACCOUNT):
+        return self.client.application.extensions['transactions'].find(account).storage
+
+    def test_load(self):
+        assert self.client.post('/transactions/load', json=get_payload()).status_code == 200
+        storage = self.get_storage()
+        assert isinstance(storage, SQLiteStorage)
+        assert os.listdir(self.directory.name) == [os.path.basename(storage.path)]
+
+        transaction = get_payload()['transactions'][0]
+        response = self.client.post('/transactions/get_sequence', json=dict(transaction=transaction))
+        assert response.get_json()['interval'] == 7
+        assert self.client.get('/transactions/export').data.count(b'\n') == 1
+        assert len(self.client.get('/transactions/sequences?interval=7').get_json()['sequences']) == 1
+
+        # Storages loaded from SQLite can't be extended.
+        assert self.client.post('/transactions/append', json=get_payload('MONTHLY RENT')).status_code == 400
+
+    def test_reload(self):
+        assert self.client.post('/transactions/load', json=get_payload()).status_code == 200
+        assert self.client.post('/transactions/load?account=a', json=get_payload()).status_code == 200
+        first = self.get_storage().path
+        assert self.client.post('/transactions/load', json=get_payload('MONTHLY RENT')).status_code == 200
+
+        # Replaced databases are removed once released.
+        gc.collect()
+        assert not os.path.exists(first)
+        assert len(os.listdir(self.directory.name)) == 2
+        transaction = get_payload('MONTHLY RENT')['transactions'][0]
+        response = self.client.post('/transactions/get_sequence', json=dict(transaction=transaction))
+        assert response.get_json()['interval'] == 7
+
+    def test_load_async(self):
+        response = self.client.post('/transactions/load?async=1', json=get_payload())
+        assert response.status_code == 202
+        self.client.application.extensions['transactions'].executor.shutdown(wait=True)
+        assert self.client.get(response.headers['Location']).get_json()['status'] == 'done'
+        assert isinstance(self.get_storage(), SQLiteStorage)
+
+    def test_snapshot_dir(self):
+        with self.assertRaises(ValueError):
+            create_client(TRANSACTIONS_SQLITE_DIR=self.directory.name, TRANSACTIONS_SNAPSHOT_DIR=self.directory.name)
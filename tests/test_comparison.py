@@ -1,6 +1,9 @@
 import unittest
+from unittest.mock import patch
 
-from src.transactions.comparison import compare_iterables, compare_sentences
+from src.transactions import comparison
+from src.transactions.comparison import compare_iterables, compare_sentences, compare_tokens, \
+    split_sentence, tokenize, compare_many, encode_tokens
 
 
 class ComparisonTests(unittest.TestCase):
@@ -76,3 +79,71 @@ class ComparisonTests(unittest.TestCase):
 
         result = compare_sentences(input_a, input_b)
         assert result < expected_threshold
+
+    def test_split_sentence(self):
+        input_a = ' THIRD*ONE--6565 - 12 '
+        expected_result = ['THIRD', 'ONE', '6565', '-', '12']
+
+        result = split_sentence(input_a)
+        assert result == expected_result
+
+    def test_split_sentence_in_order(self):
+        assert split_sentence('abc x', ['bc', 'ab']) == ['a', 'x']
+        assert split_sentence('a-b c', ['-b', 'a-']) == ['a', 'c']
+        assert compare_sentences('abc x', 'a x', ['bc', 'ab']) == 1.0
+        assert compare_sentences('a-b c', 'a b c', ['-b', 'a-']) == 0.5
+
+    def test_tokenize(self):
+        input_a = 'THIRD*ONE*6565'
+        input_b = 'THIRD ONE  6565'
+        expected_result = ('THIRD', 'ONE', '6565')
+
+        result_a = tokenize(input_a)
+        result_b = tokenize(input_b)
+        assert result_a == expected_result
+        assert result_a is result_b
+        assert tokenize(input_a) is result_a
+
+    @patch('src.transactions.comparison.TOKEN_CACHE_SIZE', 2)
+    def test_tokenize_cache_size(self):
+        for number in range(5):
+            assert tokenize('TEST INVOICE {}'.format(number)) == ('TEST', 'INVOICE', str(number))
+            assert len(comparison._sentence_tokens[tuple(comparison.DEFAULT_SPLITTERS)]) <= 2
+            assert len(comparison._interned_tokens) <= 2
+
+    def test_compare_tokens(self):
+        input_a = tokenize('JACK IN THE BOX 92495')
+        input_b = tokenize('JACK IN THE BOX 57812')
+        expected_result = compare_iterables(list(input_a), list(input_b))
+
+        assert compare_tokens(input_a, input_b) == expected_result
+        assert compare_tokens(input_b, input_a) == expected_result
+
+    def test_encode_tokens(self):
+        tokens = [tokenize('JACK IN THE BOX'), tokenize('NETFLIX'), tokenize('JACK IN THE BOX')]
+        matrix = encode_tokens(tokens)
+        assert len(matrix) == 3
+        assert matrix.ids.shape == (3, 4)
+        assert matrix.lengths.tolist() == [4, 1, 4]
+        assert matrix.ids[0].tolist() == matrix.ids[2].tolist()
+        assert matrix.ids[1].tolist()[1:] == [-1, -1, -1]
+        assert matrix.take([1]).lengths.tolist() == [1]
+        assert matrix.word_ids == {'JACK': 0, 'IN': 1, 'THE': 2, 'BOX': 3, 'NETFLIX': 4}
+        assert encode_tokens([tokenize('NETFLIX')]).word_ids == {'NETFLIX': 0}
+
+    def test_compare_many(self):
+        seed = tokenize('JACK IN THE BOX 92495')
+        candidates = [tokenize(sentence) for sentence in ['JACK IN THE BOX 57812', 'JACK IN', 'BOX THE IN JACK',
+                                                          'JACK IN THE BOX 92495 CA', 'UNSEEN WORDS HERE']]
+        expected = [compare_iterables(seed, candidate) for candidate in candidates]
+
+        assert compare_many(seed, candidates).tolist() == expected
+        assert compare_many(seed, encode_tokens(candidates)).tolist() == expected
+        assert compare_many(tokenize('NEVER SEEN BEFORE'), candidates).tolist() == [0, 0, 0, 0, 0]
+        assert compare_many(seed, []).tolist() == []
+
+    def test_compare_many_empty(self):
+        with self.assertRaises(ZeroDivisionError):
+            compare_many((), [tokenize('JACK IN THE BOX')])
+        with self.assertRaises(ZeroDivisionError):
+            compare_many(tokenize('JACK IN THE BOX'), [tokenize('JACK'), ()])
@@ -0,0 +1,43 @@
+import datetime
+import unittest
+
+from src.transactions.dates import parse_date, parse_ordinal, parse_ordinals
+
+
+class DateTests(unittest.TestCase):
+
+    def assert_same_as_strptime(self, date):
+        try:
+            expected = datetime.datetime.strptime(date, '%m/%d/%Y')
+        except (ValueError, TypeError) as e:
+            with self.assertRaises(type(e)):
+                parse_date(date)
+        else:
+            assert parse_date(date) == expected
+
+    def test_parse_date(self):
+        date = parse_date('12/24/2019')
+        assert date == datetime.datetime(2019, 12, 24)
+        assert parse_date('12/24/2019') is date
+
+    def test_parse_valid_dates(self):
+        for date in ['01/01/2017', '02/29/2020', '12/31/1999', '1/2/2020', '01/2/2020', '1/02/2020',
+                     '01/ 2/2020', '٠١/٠٢/٢٠٢٠']:
+            self.assert_same_as_strptime(date)
+
+    def test_parse_invalid_dates(self):
+        for date in ['00/10/2020', '13/10/2020', '10/00/2020', '10/32/2020', '02/29/2019', '02/30/2020',
+                     '01/01/0000', '01/01/20', '01/01/20201', '01-01-2020', ' 01/01/2020', '01/01/2020 ',
+                     '2020/01/01', '', 'TEST', 20200101, None]:
+            self.assert_same_as_strptime(date)
+
+    def test_parse_ordinal(self):
+        assert parse_ordinal('01/02/2020') == datetime.date(2020, 1, 2).toordinal()
+
+    def test_parse_ordinals(self):
+        ordinals = parse_ordinals(['01/02/2020', '01/12/2020', '01/02/2020'])
+        assert ordinals.tolist() == [737426, 737436, 737426]
+
+    def test_parse_ordinals_invalid(self):
+        with self.assertRaises(ValueError):
+            parse_ordinals(['01/02/2020', '02/30/2020'])
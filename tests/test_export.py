@@ -0,0 +1,95 @@
+import datetime
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src.transactions.backends import SQLiteStorage
+from src.transactions.export import iter_ndjson, write_ndjson
+from src.transactions.models import Transaction, TransactionSequence, SequenceStorage, TransactionBatch
+from src.transactions.parser import parse_storage
+from src.transactions.snapshot import write_snapshot, SnapshotStorage
+from tests import get_transactions
+
+
+TRANSACTIONS = [transaction for description in ['TEST INVOICE 1234', 'ANOTHER TEST 1432', 'THIRD PAYMENT 9']
+                for transaction in get_transactions(description, 10.5)]
+
+
+class ExportTests(unittest.TestCase):
+
+    def test_iter_ndjson(self):
+        storage = parse_storage(TRANSACTIONS)
+        chunks = list(iter_ndjson(storage, chunk_size=1))
+        sequences = list(storage.iter_sequences())
+
+        assert len(chunks) == 3
+        assert [json.loads(chunk) for chunk in chunks] == [sequence.to_dict() for sequence in sequences]
+        assert all(chunk.endswith(b'\n') for chunk in chunks)
+
+    def test_first_chunk(self):
+        storage = parse_storage(TRANSACTIONS)
+        chunks = list(iter_ndjson(storage))
+        assert len(chunks) == 2
+        assert chunks[0].count(b'\n') == 1
+        assert chunks[1].count(b'\n') == 2
+
+    def test_empty_storage(self):
+        assert list(iter_ndjson(parse_storage([]))) == []
+
+    def test_write_ndjson(self):
+        storage = parse_storage(TRANSACTIONS)
+        file = io.BytesIO()
+        write_ndjson(storage, file)
+        assert file.getvalue() == b''.join(iter_ndjson(storage))
+        # Exporting doesn't cache the encodings of the sequences.
+        assert all(sequence.encoded is None for sequence in storage.iter_sequences())
+
+    def test_storages(self):
+        expected = b''.join(iter_ndjson(parse_storage(TRANSACTIONS)))
+
+        batch = parse_storage(TransactionBatch.from_dicts(TRANSACTIONS))
+        assert b''.join(iter_ndjson(batch)) == expected
+        assert b''.join(iter_ndjson(parse_storage(TRANSACTIONS, storage=SQLiteStorage()))) == expected
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'snapshot.bin')
+            write_snapshot(parse_storage(TRANSACTIONS), path)
+            snapshot = SnapshotStorage(path)
+            assert b''.join(iter_ndjson(snapshot)) == expected
+            snapshot.close()
+
+
+class IterSequencesTests(unittest.TestCase):
+
+    def test_shared_keys(self):
+        transactions = [Transaction(**transaction) for transaction in TRANSACTIONS[:4]]
+        first = TransactionSequence(7)
+        first.add_transactions(transactions[:2], margin=3)
+        second = TransactionSequence(7)
+        second.add_transactions(transactions[:1], margin=3)
+        third = TransactionSequence(7)
+        third.add_transactions(transactions[2:], margin=3)
+
+        storage = SequenceStorage()
+        storage.add_sequences([first, second, third])
+        assert list(storage.iter_sequences()) == [second, first, third]
+
+        storage.add_sequence(TransactionSequence(7))
+        storage.add_sequence(first)
+        assert list(storage.iter_sequences()) == [first, third]
+
+    def test_long_sequence(self):
+        start = datetime.date(2020, 1, 1)
+        transactions = [Transaction(date=(start + datetime.timedelta(days=4 * day)).strftime('%m/%d/%Y'),
+                                    description='DAILY', amount=1) for day in range(100)]
+        sequence = TransactionSequence(4)
+        sequence.add_transactions(transactions, margin=3)
+        storage = SequenceStorage()
+        storage.add_sequence(sequence)
+
+        # Sequences aren't listed again for each of their keys.
+        with patch.object(TransactionSequence, '__iter__', side_effect=AssertionError):
+            assert list(storage.iter_sequences()) == [sequence]
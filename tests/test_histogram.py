@@ -0,0 +1,126 @@
+import datetime
+import random
+import unittest
+
+import numpy as np
+
+from src.transactions.models import Transaction, TransactionSequence
+from src.transactions.histogram import get_delta_histogram, get_candidate_intervals, parse_sequences_histogram
+from src.transactions.parser import parse_storage
+
+
+class HistogramTests(unittest.TestCase):
+
+    def create_transactions(self, dates):
+        return [Transaction(date=date,
+                            description='TEST INVOICE 1234',
+                            amount='435.23') for date in dates]
+
+    def test_delta_histogram(self):
+        ordinals = np.array([0, 10, 20, 21], dtype=np.int64)
+
+        histogram = get_delta_histogram(ordinals, 12)
+
+        assert histogram.tolist() == [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 2, 1, 0]
+
+    def test_candidate_intervals(self):
+        histogram = np.zeros(40, dtype=np.int64)
+        histogram[10] = 5
+        histogram[11] = 2
+        histogram[30] = 3
+
+        intervals = get_candidate_intervals(histogram, 3)
+
+        assert intervals == [10, 30]
+
+    def test_candidate_intervals_divisors(self):
+        histogram = np.zeros(70, dtype=np.int64)
+        histogram[30] = 9
+        histogram[60] = 11
+
+        intervals = get_candidate_intervals(histogram, 3)
+
+        assert intervals == [30, 60]
+
+    def test_parse_jittered_sequence(self):
+        # Monthly transactions, each up to 3 days off, give multiples of the interval as much support as itself.
+        jitter = random.Random(0)
+        start = datetime.date(2017, 1, 15)
+        transactions = self.create_transactions(
+            [(start + datetime.timedelta(days=30 * month + jitter.randint(-3, 3))).strftime('%m/%d/%Y')
+             for month in range(40)])
+
+        sequences = parse_sequences_histogram(transactions)
+
+        assert sequences
+        assert all(27 <= sequence.interval <= 33 for sequence in sequences)
+
+    def test_parse_single_sequence(self):
+        transactions = self.create_transactions(['01/02/2020', '01/12/2020', '01/22/2020', '02/01/2020'])
+
+        sequences = parse_sequences_histogram(transactions)
+
+        assert len(sequences) == 1
+        assert isinstance(sequences[0], TransactionSequence)
+        assert sequences[0].interval == 10
+        for transaction in transactions:
+            assert transaction in sequences[0]
+            assert transaction.sequence == sequences[0]
+
+    def test_parse_short_sequence(self):
+        transactions = self.create_transactions(['01/02/2020', '01/12/2020', '01/22/2020'])
+
+        sequences = parse_sequences_histogram(transactions)
+
+        assert len(sequences) == 0
+
+    def test_parse_short_interval(self):
+        transactions = self.create_transactions(['01/02/2020', '01/05/2020', '01/08/2020', '01/11/2020'])
+
+        sequences = parse_sequences_histogram(transactions)
+
+        assert len(sequences) == 0
+
+    def test_parse_single_sequence_with_singletons(self):
+        transactions = self.create_transactions(['01/02/2020', '01/03/2020', '01/12/2020', '01/20/2020',
+                                                 '01/22/2020', '02/01/2020'])
+
+        sequences = parse_sequences_histogram(transactions)
+
+        assert len(sequences) == 1
+        assert [transaction.date.strftime('%m/%d/%Y') for transaction in sequences[0]] == \
+            ['01/02/2020', '01/12/2020', '01/22/2020', '02/01/2020']
+
+    def test_parse_multiple_sequences(self):
+        transactions = self.create_transactions(['01/01/2020', '01/15/2020', '02/01/2020', '02/15/2020',
+                                                 '01/01/2021', '02/10/2021', '03/20/2021', '04/30/2021',
+                                                 '03/10/2022', '03/20/2022', '03/30/2022', '04/09/2022'])
+
+        sequences = parse_sequences_histogram(transactions)
+
+        assert len(sequences) == 3
+        assert list(sequences[0]) == transactions[0:4]
+        assert list(sequences[1]) == transactions[4:8]
+        assert list(sequences[2]) == transactions[8:12]
+
+    def test_parse_storage(self):
+        transactions = [
+            dict(date='01/02/2020',
+                 description='TEST INVOICE 1234',
+                 amount='435.23'),
+            dict(date='01/12/2020',
+                 description='TEST INVOICE 1234',
+                 amount='435.23'),
+            dict(date='01/22/2020',
+                 description='TEST INVOICE 1234',
+                 amount='435.23'),
+            dict(date='02/01/2020',
+                 description='TEST INVOICE 1234',
+                 amount='435.23')
+        ]
+        storage = parse_storage(transactions, sequence_parser=parse_sequences_histogram)
+        sequence1 = storage.get_sequence(Transaction(**transactions[0]))
+        sequence2 = storage.get_sequence(Transaction(**transactions[3]))
+
+        assert sequence1 is not None
+        assert sequence1 == sequence2
@@ -0,0 +1,111 @@
+import datetime
+import os
+import tempfile
+import unittest
+
+from src.transactions.indexes import SequenceIndex
+from src.transactions.jobs import StorageState
+from src.transactions.parser import parse_storage
+from src.transactions.snapshot import write_snapshot, SnapshotStorage
+
+
+def get_transactions():
+    # Monthly from January to April, weekly in February and every two weeks from March to May.
+    return ([dict(date='{:02d}/10/2020'.format(month), description='MONTHLY INVOICE', amount=10)
+             for month in range(1, 5)] +
+            [dict(date='02/{:02d}/2020'.format(day), description='WEEKLY GROCERIES', amount=20)
+             for day in range(1, 29, 7)] +
+            [dict(date=date, description='PAYROLL DEPOSIT', amount=30)
+             for date in ['03/20/2020', '04/03/2020', '04/17/2020', '05/01/2020']])
+
+
+def get_descriptions(sequences):
+    return [sequence.get_first_transaction().description for sequence in sequences]
+
+
+class SequenceIndexTests(unittest.TestCase):
+
+    def create_index(self):
+        return SequenceIndex.from_storage(parse_storage(get_transactions()))
+
+    def test_sorted(self):
+        index = self.create_index()
+        assert len(index) == 3
+        assert get_descriptions(index.by_first) == ['MONTHLY INVOICE', 'WEEKLY GROCERIES', 'PAYROLL DEPOSIT']
+        assert get_descriptions(index.by_last) == ['WEEKLY GROCERIES', 'MONTHLY INVOICE', 'PAYROLL DEPOSIT']
+        assert index.first_ordinals == sorted(index.first_ordinals)
+        assert index.intervals == [7, 14, 31]
+
+    def test_get_started(self):
+        index = self.create_index()
+        started = index.get_started(datetime.datetime(2020, 1, 11), datetime.datetime(2020, 3, 20))
+        assert get_descriptions(started) == ['WEEKLY GROCERIES', 'PAYROLL DEPOSIT']
+        assert index.get_started(datetime.datetime(2020, 6, 1), datetime.datetime(2020, 7, 1)) == []
+
+    def test_get_ended(self):
+        index = self.create_index()
+        ended = index.get_ended(datetime.datetime(2020, 4, 10), datetime.datetime(2020, 5, 1))
+        assert get_descriptions(ended) == ['MONTHLY INVOICE', 'PAYROLL DEPOSIT']
+
+    def test_get_active(self):
+        index = self.create_index()
+        march = index.get_active(datetime.datetime(2020, 3, 1), datetime.datetime(2020, 3, 31))
+        assert sorted(get_descriptions(march)) == ['MONTHLY INVOICE', 'PAYROLL DEPOSIT']
+        february = index.get_active(datetime.datetime(2020, 2, 20), datetime.datetime(2020, 2, 20))
+        assert sorted(get_descriptions(february)) == ['MONTHLY INVOICE', 'WEEKLY GROCERIES']
+        january = index.get_active(datetime.datetime(2019, 1, 1), datetime.datetime(2020, 1, 31))
+        assert get_descriptions(january) == ['MONTHLY INVOICE']
+
+    def test_get_by_interval(self):
+        index = self.create_index()
+        assert get_descriptions(index.get_by_interval(30)) == ['MONTHLY INVOICE']
+        assert get_descriptions(index.get_by_interval(10, margin=4)) == ['WEEKLY GROCERIES', 'PAYROLL DEPOSIT']
+        assert index.get_by_interval(90) == []
+
+    def test_expected(self):
+        index = self.create_index()
+        # The last transactions were on 04/10 (31 days), 02/22 (7 days) and 05/01 (14 days).
+        assert get_descriptions(index.by_expected) == ['WEEKLY GROCERIES', 'MONTHLY INVOICE', 'PAYROLL DEPOSIT']
+        assert index.expected_ordinals == [datetime.date(2020, 2, 29).toordinal(),
+                                           datetime.date(2020, 5, 11).toordinal(),
+                                           datetime.date(2020, 5, 15).toordinal()]
+
+    def test_get_upcoming(self):
+        index = self.create_index()
+        upcoming = index.get_upcoming(datetime.datetime(2020, 5, 1), datetime.datetime(2020, 5, 12))
+        assert [date for date, sequence in upcoming] == [datetime.datetime(2020, 5, 11),
+                                                         datetime.datetime(2020, 5, 15)]
+        assert get_descriptions(sequence for date, sequence in upcoming) == ['MONTHLY INVOICE', 'PAYROLL DEPOSIT']
+        assert index.get_upcoming(datetime.datetime(2020, 3, 4), datetime.datetime(2020, 5, 7)) == []
+        assert len(index.get_upcoming(datetime.datetime(2020, 3, 2), datetime.datetime(2020, 3, 2))) == 1
+
+    def test_snapshot(self):
+        storage = parse_storage(get_transactions())
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'snapshot')
+            write_snapshot(storage, path)
+            snapshot = SnapshotStorage(path)
+            index = SequenceIndex.from_storage(snapshot)
+            assert [sequence.to_dict() for sequence in index.by_first] == \
+                [sequence.to_dict() for sequence in self.create_index().by_first]
+            snapshot.close()
+
+
+class StateIndexTests(unittest.TestCase):
+
+    def test_published(self):
+        state = StorageState(indexed=True)
+        storage = parse_storage(get_transactions())
+        state.publish(storage)
+        index = state.get_index(storage)
+        assert len(index) == 3
+        assert state.get_index(storage) is index
+
+    def test_other_storage(self):
+        state = StorageState()
+        storage = parse_storage(get_transactions())
+        state.publish(storage)
+        assert state.index is None
+        other = parse_storage(get_transactions()[:4])
+        assert len(state.get_index(other)) == 1
+        assert len(state.get_index(storage)) == 3
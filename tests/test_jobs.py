@@ -0,0 +1,61 @@
+import threading
+import unittest
+
+from src.transactions.jobs import StorageState, DONE, FAILED
+
+
+class StorageStateTests(unittest.TestCase):
+
+    def wait(self, state):
+        state.executor.submit(lambda: None).result(timeout=5)
+
+    def test_publish(self):
+        state = StorageState()
+        storage = object()
+        version = state.publish(storage)
+        assert version == state.version == 1
+        assert state.storage is storage
+
+    def test_update(self):
+        state = StorageState()
+        state.publish([1])
+        version = state.update(lambda storage: storage + [2])
+        assert version == 2
+        assert state.storage == [1, 2]
+
+    def test_submit(self):
+        state = StorageState()
+        storage = object()
+        started = threading.Event()
+
+        def build():
+            started.wait(timeout=5)
+            return storage
+
+        job = state.submit(build)
+        assert state.get_job(job.id) is job
+        assert state.storage is None
+
+        started.set()
+        self.wait(state)
+        assert job.status == DONE
+        assert job.version == 1
+        assert job.finished is not None
+        assert state.storage is storage
+
+    def test_submit_failure(self):
+        state = StorageState()
+
+        def build():
+            raise ValueError('Invalid transactions')
+
+        job = state.submit(build)
+        self.wait(state)
+        assert job.status == FAILED
+        assert job.error == 'Invalid transactions'
+        assert state.storage is None
+        assert state.version == 0
+
+    def test_get_unknown_job(self):
+        state = StorageState()
+        assert state.get_job('unknown') is None
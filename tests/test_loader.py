@@ -0,0 +1,62 @@
+import io
+import json
+import unittest
+
+from src.transactions.loader import iter_transactions
+
+
+TRANSACTIONS = [
+    dict(date='01/02/2020',
+         description='TEST INVOICE 1234',
+         amount=435.23),
+    dict(date='01/12/2020',
+         description='TEST "INVOICE" 1234',
+         amount=-1234567.5),
+    dict(date='01/22/2020',
+         description='TEST INVOICE ÇÃO',
+         amount='435.23')
+]
+
+
+class LoaderTests(unittest.TestCase):
+
+    def test_iter_array(self):
+        stream = io.StringIO(json.dumps(TRANSACTIONS))
+        transactions = list(iter_transactions(stream))
+        assert transactions == TRANSACTIONS
+
+    def test_iter_array_small_chunks(self):
+        stream = io.BytesIO(json.dumps(TRANSACTIONS, ensure_ascii=False).encode('utf-8'))
+        transactions = list(iter_transactions(stream, read_size=3))
+        assert transactions == TRANSACTIONS
+
+    def test_iter_empty_array(self):
+        stream = io.StringIO(' [ ] ')
+        transactions = list(iter_transactions(stream))
+        assert transactions == []
+
+    def test_iter_object(self):
+        stream = io.StringIO(json.dumps({'account': {'id': 1}, 'transactions': TRANSACTIONS, 'other': [1, 2]}))
+        transactions = list(iter_transactions(stream, read_size=7))
+        assert transactions == TRANSACTIONS
+
+    def test_iter_object_without_key(self):
+        stream = io.StringIO(json.dumps({'transaction': TRANSACTIONS[0]}))
+        with self.assertRaises(KeyError):
+            list(iter_transactions(stream))
+
+    def test_iter_ndjson(self):
+        stream = io.BytesIO('\n'.join(json.dumps(transaction) for transaction in TRANSACTIONS).encode('utf-8'))
+        transactions = list(iter_transactions(stream, ndjson=True, read_size=5))
+        assert transactions == TRANSACTIONS
+
+    def test_iter_numbers_across_chunks(self):
+        stream = io.StringIO('[12345, 67890]')
+        transactions = list(iter_transactions(stream, read_size=3))
+        assert transactions == [12345, 67890]
+
+    def test_iter_invalid(self):
+        for payload in ['', '[{"date": "01/02/2020"}', '[1 2]', '{"transactions" [1]}', '"transactions"',
+                        '{"transactions": 1}']:
+            with self.assertRaises(json.JSONDecodeError):
+                list(iter_transactions(io.StringIO(payload), read_size=4))
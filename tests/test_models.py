@@ -1,7 +1,10 @@
+import datetime
+import json
 import unittest
 from unittest.mock import patch, call, Mock
 
-from src.transactions.models import Transaction, TransactionSequence, SequenceStorage
+from src.transactions.models import Transaction, TransactionSequence, SequenceStorage, TransactionBatch, \
+    get_key, get_transaction_key, to_cents
 
 
 class TransactionTests(unittest.TestCase):
@@ -39,6 +42,53 @@ class TransactionTests(unittest.TestCase):
                                    amount='432.23')
         assert transaction.id == transaction2.id == transaction3.id != transaction4.id
 
+    def test_id_amount_formats(self):
+        transaction = Transaction(date='12/24/2019',
+                                  description='TEST INVOICE 1234',
+                                  amount='435.23')
+        transaction2 = Transaction(date='12/24/2019',
+                                   description='TEST INVOICE 1234',
+                                   amount=435.23)
+        assert transaction.id == transaction2.id
+
+    def test_slots(self):
+        transaction = Transaction(date='12/24/2019',
+                                  description='TEST INVOICE 1234',
+                                  amount='435.23')
+        with self.assertRaises(AttributeError):
+            transaction.other = None
+
+
+class KeyTests(unittest.TestCase):
+
+    def test_to_cents(self):
+        assert to_cents('435.23') == 43523
+        assert to_cents(-99.69) == -9969
+        assert to_cents(12) == 1200
+        assert to_cents(0.29) == 29
+        assert to_cents('1e2') == 10000
+        assert str(to_cents('279455.0077')) == '27945500.77'
+        assert str(to_cents(566880.762)) == str(to_cents('566880.7620')) == '56688076.2'
+        for amount in ['abc', None, True, [1], 'NaN', float('inf')]:
+            with self.assertRaises(ValueError):
+                to_cents(amount)
+
+    def test_get_transaction_key(self):
+        transaction = Transaction(date='12/24/2019',
+                                  description='TEST INVOICE 1234',
+                                  amount='435.23')
+        assert get_transaction_key('12/24/2019', 'TEST INVOICE 1234', 435.23) == transaction.id
+        assert get_transaction_key('12/24/2019', 'TEST INVOICE 1234', '435.24') != transaction.id
+        # Amounts with a fraction of a cent aren't rounded into the same key.
+        assert get_transaction_key('12/24/2019', 'TEST INVOICE 1234', '435.231') != transaction.id
+        assert get_transaction_key('12/24/2019', 'TEST INVOICE 1234', '435.2300') == transaction.id
+
+    def test_get_key(self):
+        key = get_key(737418, 'TEST INVOICE 1234', 43523)
+        assert key == 2133782361672483966
+        assert key != get_key(737418, 'TEST INVOICE 1234', 43522)
+        assert key != get_key(737419, 'TEST INVOICE 1234', 43523)
+
 
 class SequenceTests(unittest.TestCase):
 
@@ -177,6 +227,23 @@ class SequenceTests(unittest.TestCase):
         length = len(sequence)
         assert length == expected_length
 
+    def test_to_bytes(self):
+        transaction1 = Transaction(date='01/02/2020',
+                                   description='TEST INVOICE 1234',
+                                   amount='435.23')
+        transaction2 = Transaction(date='01/12/2020',
+                                   description='TEST INVOICE 1234',
+                                   amount='435.23')
+        sequence = TransactionSequence(10)
+        sequence.add_transaction(transaction1, margin=3)
+        encoded = sequence.to_bytes()
+        assert encoded == str(sequence).encode('utf-8')
+        assert sequence.to_bytes() is encoded
+
+        sequence.add_transaction(transaction2, margin=3)
+        assert sequence.to_bytes() == str(sequence).encode('utf-8')
+        assert len(json.loads(sequence.to_bytes())['transactions']) == 2
+
     def test_contains(self):
         transaction1 = Transaction(date='01/02/2020',
                                    description='TEST INVOICE 1234',
@@ -293,6 +360,41 @@ class StorageTests(unittest.TestCase):
         assert transaction2.id in storage.sequences
         assert transaction3.id in storage.sequences
 
+    def test_add_group(self):
+        sequence = self.create_sequence()
+        transactions = list(sequence)
+
+        storage = SequenceStorage()
+        number = storage.add_group(transactions, [sequence])
+        assert number == 0
+        assert list(storage.groups[0]) == transactions
+        assert storage.get_group_candidates(('TEST', 'OTHER')) == [0]
+        assert storage.get_group_candidates(('OTHER', 'TEST')) == []
+        assert storage.get_sequence(transactions[0]) == sequence
+
+    def test_copy(self):
+        sequence = self.create_sequence()
+        transactions = list(sequence)
+
+        storage = SequenceStorage()
+        storage.add_group(transactions, [sequence])
+        copy = storage.copy()
+        copy.groups[0].append(transactions[0])
+        copy.remove_sequence(sequence)
+        assert copy.groups != storage.groups
+        assert storage.get_sequence(transactions[0]) == sequence
+        assert copy.get_sequence(transactions[0]) is None
+
+    def test_remove_sequence(self):
+        sequence = self.create_sequence()
+        transactions = list(sequence)
+
+        storage = SequenceStorage()
+        storage.add_sequence(sequence)
+        storage.remove_sequence(sequence)
+        assert storage.sequences == {}
+        assert transactions[0].sequence is None
+
     def test_get_sequence(self):
         transaction1 = Transaction(date='01/02/2020',
                                    description='TEST INVOICE 1234',
@@ -317,3 +419,224 @@ class StorageTests(unittest.TestCase):
         sequence3 = storage.get_sequence(transaction3)
         assert sequence1 == sequence2 == sequence
         assert sequence3 is None
+
+    def test_get_response(self):
+        transaction1 = Transaction(date='01/02/2020',
+                                   description='TEST INVOICE 1234',
+                                   amount='435.23')
+        transaction2 = Transaction(date='01/22/2020',
+                                   description='TEST INVOICE 1234',
+                                   amount='435.23')
+        sequence = TransactionSequence(10)
+        sequence.add_transaction(transaction1, margin=3)
+
+        storage = SequenceStorage()
+        storage.add_sequence(sequence)
+        response = storage.get_response(transaction1)
+        assert response == str(sequence).encode('utf-8')
+        assert storage.get_response(transaction1) is response
+        assert storage.get_response(transaction2) is None
+
+
+class CompactFormatTests(unittest.TestCase):
+
+    def create_storage(self):
+        transactions = [Transaction(date='01/{:02d}/2020'.format(day),
+                                    description='TEST INVOICE 1234',
+                                    amount='435.23')
+                        for day in range(2, 30, 7)]
+        sequence = TransactionSequence(7)
+        sequence.add_transactions(transactions, margin=3, set_ownership=True)
+        storage = SequenceStorage()
+        storage.add_sequence(sequence)
+        return storage
+
+    def test_to_compact_dict(self):
+        storage = self.create_storage()
+        sequence = next(iter(storage.sequences.values()))
+        data = storage.to_compact_dict()
+        assert data['sequences'] == [dict(sequence.to_dict(), id=0)]
+        assert data['keys'] == {key: 0 for key in storage.sequences}
+
+    def test_from_compact_dict(self):
+        storage = self.create_storage()
+        loaded = SequenceStorage.from_compact_dict(json.loads(json.dumps(storage.to_compact_dict())))
+        assert loaded.to_dict() == storage.to_dict()
+        assert len({id(sequence) for sequence in loaded.sequences.values()}) == 1
+        transaction = Transaction(date='01/09/2020', description='TEST INVOICE 1234', amount=435.23)
+        assert loaded.get_sequence(transaction).get_first_transaction().sequence is loaded.get_sequence(transaction)
+        with self.assertRaises(ValueError):
+            loaded.extend([])
+
+    def test_batch_to_compact_dict(self):
+        batch = TransactionBatch.from_dicts([dict(date='01/{:02d}/2020'.format(day),
+                                                  description='TEST INVOICE 1234',
+                                                  amount=435.23)
+                                             for day in range(2, 30, 7)])
+        batch.set_sequences([(7, [0, 1, 2, 3])], margin=3)
+        data = batch.to_compact_dict()
+        expected = self.create_storage().to_compact_dict()
+        assert data['keys'] == expected['keys']
+        assert [sequence['interval'] for sequence in data['sequences']] == [7]
+        assert len(data['sequences'][0]['transactions']) == 4
+
+
+class RetentionTests(unittest.TestCase):
+
+    def get_transactions(self, months, description='TEST INVOICE 1234'):
+        return [dict(date='{:02d}/10/{}'.format(month % 12 + 1, 2018 + month // 12),
+                     description=description,
+                     amount=10.5)
+                for month in months]
+
+    def get_months(self, storage):
+        return sorted({(transaction.date.year, transaction.date.month)
+                       for sequence in storage.iter_sequences() for transaction in sequence})
+
+    def test_trimmed(self):
+        from src.transactions.parser import parse_storage
+        storage = parse_storage(self.get_transactions(range(12)), retention=200)
+        assert self.get_months(storage) == [(2018, month) for month in range(6, 13)]
+        assert len(storage.groups[0]) == 7
+        assert len(storage.expiry) == 7
+
+    def test_dropped(self):
+        from src.transactions.parser import parse_storage
+        transactions = self.get_transactions(range(12)) + self.get_transactions(range(8, 12), 'ANOTHER TEST')
+        storage = parse_storage(sorted(transactions, key=lambda transaction: transaction['date'][-4:]),
+                                retention=330)
+        assert len(list(storage.iter_sequences())) == 2
+
+        storage.extend(self.get_transactions(range(12, 20)))
+        assert self.get_months(storage) == [(2018, month) for month in range(10, 13)] + \
+            [(2019, month) for month in range(1, 9)]
+        assert len(list(storage.iter_sequences())) == 1
+        assert all(transaction.sequence is None for transaction in storage.groups[1])
+
+    def test_evict(self):
+        from src.transactions.parser import parse_storage
+        storage = parse_storage(self.get_transactions(range(12)), retention=730)
+        copy = storage.copy()
+        sequence = next(storage.iter_sequences())
+
+        evicted = copy.evict(datetime.datetime(2020, 8, 20))
+        assert evicted == 8
+        assert len(next(copy.iter_sequences())) == 4
+        assert len(next(storage.iter_sequences())) == 12
+        assert next(copy.iter_sequences()) is not sequence
+        assert copy.evict() == 0
+
+    def test_evict_in_place(self):
+        from src.transactions.parser import parse_storage
+        transactions = self.get_transactions(range(12))
+        storage = parse_storage(transactions + transactions[-1:], retention=730)
+        sequence = next(storage.iter_sequences())
+        last = Transaction(**transactions[-1]).id
+        assert storage.duplicates == {last: 2}
+
+        # Sequences of owned groups are trimmed in place, and dropped once too short.
+        assert storage.evict(datetime.datetime(2020, 8, 20)) == 8
+        assert next(storage.iter_sequences()) is sequence
+        assert len(sequence) == 4
+        assert storage.get_response_by_key(last) == sequence.to_bytes()
+        assert len(json.loads(sequence.to_bytes())['transactions']) == 4
+
+        # Groups left empty are retired, along with their seeds and duplicates.
+        assert storage.evict(datetime.datetime(2022, 1, 1)) == 4
+        assert not storage.sequences
+        assert storage.groups == {}
+        assert storage.seeds == {}
+        assert not storage.seed_index
+        assert storage.duplicates == {}
+
+        storage.extend(self.get_transactions(range(40, 44)))
+        assert list(storage.groups) == [1]
+        assert len(list(storage.iter_sequences())) == 1
+
+    def test_no_retention(self):
+        storage = SequenceStorage()
+        storage.add_group([Transaction(date='01/10/2018', description='TEST', amount=1)])
+        assert storage.expiry == []
+        assert storage.evict() == 0
+
+
+class BatchTests(unittest.TestCase):
+
+    def create_batch(self):
+        return TransactionBatch.from_dicts([
+            dict(date='01/02/2020',
+                 description='TEST INVOICE 1234',
+                 amount='435.23'),
+            dict(date='01/12/2020',
+                 description='TEST INVOICE 1234',
+                 amount=435.23),
+            dict(date='01/22/2020',
+                 description='ANOTHER TEST 1432',
+                 amount='-12.5')
+        ])
+
+    def test_creation(self):
+        batch = self.create_batch()
+        assert len(batch) == 3
+        assert batch.ordinals.tolist() == [737426, 737436, 737446]
+        assert batch.keys.tolist() == [get_key(737426, 'TEST INVOICE 1234', 43523),
+                                       get_key(737436, 'TEST INVOICE 1234', 43523),
+                                       get_key(737446, 'ANOTHER TEST 1432', -1250)]
+        assert batch.descriptions.tolist() == [0, 0, 1]
+        assert batch.description_table == ['TEST INVOICE 1234', 'ANOTHER TEST 1432']
+        assert batch.amounts.tolist() == [0, 1, 2]
+        assert batch.amount_table == ['435.23', 435.23, '-12.5']
+        assert batch.sequences.tolist() == [-1, -1, -1]
+
+    def test_get_transaction(self):
+        batch = self.create_batch()
+        transaction = batch.get_transaction(2)
+        expected = Transaction(date='01/22/2020',
+                               description='ANOTHER TEST 1432',
+                               amount='-12.5')
+        assert transaction.to_dict() == dict(date='01/22/2020',
+                                             description='ANOTHER TEST 1432',
+                                             amount='-12.5')
+        assert transaction.id == expected.id == batch.get_key(2)
+
+    def test_amounts(self):
+        batch = TransactionBatch.from_dicts([dict(date='01/02/2020', description='TEST', amount=amount)
+                                             for amount in [10, 10.0, '10', 10]])
+        assert batch.amount_table == [10, 10.0, '10']
+        assert batch.amounts.tolist() == [0, 1, 2, 0]
+        assert [batch.get_transaction(row).amount for row in range(4)] == [10, 10.0, '10', 10]
+        assert str(batch.get_transaction(0)) == str(Transaction(date='01/02/2020', description='TEST', amount=10))
+        with self.assertRaises(ValueError):
+            batch.append('01/02/2020', 'TEST', 'abc')
+
+    def test_get_sequence(self):
+        batch = self.create_batch()
+        batch.set_sequences([(10, [0, 1])], margin=3)
+        sequence1 = batch.get_sequence(Transaction(date='01/02/2020',
+                                                   description='TEST INVOICE 1234',
+                                                   amount='435.23'))
+        sequence2 = batch.get_sequence(Transaction(date='01/12/2020',
+                                                   description='TEST INVOICE 1234',
+                                                   amount='435.23'))
+        sequence3 = batch.get_sequence(Transaction(date='01/22/2020',
+                                                   description='ANOTHER TEST 1432',
+                                                   amount='-12.5'))
+        assert batch.sequences.tolist() == [0, 0, -1]
+        assert isinstance(sequence1, TransactionSequence)
+        assert sequence1 is sequence2
+        assert sequence1.interval == 10
+        assert len(sequence1) == 2
+        assert sequence3 is None
+
+    def test_get_response(self):
+        batch = self.create_batch()
+        batch.set_sequences([(10, [0, 1])], margin=3)
+        transaction = Transaction(date='01/12/2020',
+                                  description='TEST INVOICE 1234',
+                                  amount='435.23')
+        response = batch.get_response(transaction)
+        assert response == str(batch.get_sequence(transaction)).encode('utf-8')
+        assert batch.get_response(transaction) is response
+        assert batch.get_response(Transaction(date='01/22/2020',
+                                              description='ANOTHER TEST 1432',
+                                              amount='-12.5')) is None
@@ -1,7 +1,16 @@
+import os
 import unittest
+from decimal import Decimal
+from unittest.mock import patch
 
-from src.transactions.models import Transaction, TransactionSequence
-from src.transactions.parser import parse_sequences, parse_storage
+from src.transactions.comparison import tokenize
+from src.transactions.loader import iter_transactions
+from src.transactions.models import Transaction, TransactionSequence, TransactionBatch
+from src.transactions.parser import parse_sequences, parse_storage, group_descriptions, find_sequences, \
+    extend_storage, parse_payloads_parallel, group_tokens, find_duplicates
+from src.transactions.histogram import parse_sequences_histogram
+
+SAMPLE_PATH = os.path.join(os.path.dirname(__file__), os.pardir, 'src', 'transactions.json')
 
 
 class ParserTests(unittest.TestCase):
@@ -157,6 +166,64 @@ class ParserTests(unittest.TestCase):
         assert transactionY3 in sequences[2]
         assert transactionY4 in sequences[2]
 
+    def test_find_sequences(self):
+        ordinals = [0, 10, 14, 20, 30, 40]
+        keys = [1, 2, 3, 4, 5, 6]
+        owned = [False, False, True, False, False, False]
+
+        sequences = find_sequences(ordinals, keys, owned)
+
+        assert sequences == [(10, [0, 1, 3, 4, 5])]
+        assert owned == [True, True, True, True, True, True]
+
+    def test_group_descriptions(self):
+        transaction1 = Transaction(date='01/02/2020',
+                                   description='TEST INVOICE 1234',
+                                   amount='435.23')
+        transaction2 = Transaction(date='01/02/2020',
+                                   description='ANOTHER TEST 1432',
+                                   amount='435.23')
+        transaction3 = Transaction(date='01/12/2020',
+                                   description='TEST INVOICE 4321',
+                                   amount='435.23')
+        transaction4 = Transaction(date='01/12/2020',
+                                   description='THIRD*ONE*6565',
+                                   amount='435.23')
+        transaction5 = Transaction(date='01/22/2020',
+                                   description='ANOTHER TEST 2234',
+                                   amount='435.23')
+        transactions = [transaction1, transaction2, transaction3, transaction4, transaction5]
+
+        groups = group_descriptions(transactions)
+
+        assert groups == [[transaction1, transaction3],
+                          [transaction2, transaction5],
+                          [transaction4]]
+
+    def test_group_descriptions_shared_words_in_different_positions(self):
+        transaction1 = Transaction(date='01/02/2020',
+                                   description='TEST INVOICE',
+                                   amount='435.23')
+        transaction2 = Transaction(date='01/12/2020',
+                                   description='INVOICE TEST',
+                                   amount='435.23')
+        transactions = [transaction1, transaction2]
+
+        groups = group_descriptions(transactions)
+
+        assert groups == [[transaction1], [transaction2]]
+
+    def test_group_tokens_block_comparisons(self):
+        descriptions = ['NETFLIX COM {}'.format(number) for number in range(100)] + \
+                       ['NETFLIX DVD', 'SPOTIFY COM 1', 'COM NETFLIX'] * 30
+        words = [tokenize(description) for description in descriptions]
+
+        groups = group_tokens(words)
+        with patch('src.transactions.parser.BLOCK_COMPARISON_SIZE', len(words) + 1):
+            assert group_tokens(words) == groups
+        assert groups[0] == list(range(100))
+        assert groups[1] == list(range(100, len(words), 3))
+
     def test_parse_storage_single_sequence(self):
         transactions = [
             dict(date='01/02/2020',
@@ -269,3 +336,189 @@ class ParserTests(unittest.TestCase):
         assert sequence5 == sequence6 == sequence7 == sequence8
         assert sequence9 == sequence10 == sequence11 == sequence12
         assert sequence1 != sequence5 != sequence12
+
+    def test_parse_storage_batch(self):
+        transactions = [
+            dict(date='01/02/2020',
+                 description='TEST INVOICE 1234',
+                 amount=435.23),
+            dict(date='01/02/2020',
+                 description='ANOTHER TEST 1432',
+                 amount=435.23),
+            dict(date='01/12/2020',
+                 description='TEST INVOICE 1234',
+                 amount=435.23),
+            dict(date='01/22/2020',
+                 description='TEST INVOICE 1234',
+                 amount=435.23),
+            dict(date='02/01/2020',
+                 description='TEST INVOICE 1234',
+                 amount=435.23)
+        ]
+        batch = TransactionBatch.from_dicts(transactions)
+        storage = parse_storage(batch)
+        sequence1 = storage.get_sequence(Transaction(**transactions[0]))
+        sequence2 = storage.get_sequence(Transaction(**transactions[4]))
+        sequence3 = storage.get_sequence(Transaction(**transactions[1]))
+
+        assert storage is batch
+        assert batch.sequences.tolist() == [0, -1, 0, 0, 0]
+        assert sequence1 is sequence2
+        assert sequence3 is None
+        assert str(storage) == str(parse_storage(transactions))
+
+    def test_extend_storage(self):
+        transactions = [
+            dict(date='01/02/2020',
+                 description='TEST INVOICE 1234',
+                 amount='435.23'),
+            dict(date='01/02/2020',
+                 description='ANOTHER TEST 1432',
+                 amount='435.23'),
+            dict(date='01/12/2020',
+                 description='TEST INVOICE 1234',
+                 amount='435.23'),
+            dict(date='01/22/2020',
+                 description='TEST INVOICE 1234',
+                 amount='435.23'),
+            dict(date='01/22/2020',
+                 description='THIRD*ONE*6565',
+                 amount='435.23'),
+            dict(date='02/01/2020',
+                 description='TEST INVOICE 1234',
+                 amount='435.23'),
+            dict(date='02/01/2020',
+                 description='THIRD*ONE*2907',
+                 amount='435.23')
+        ]
+        storage = parse_storage(transactions[:3])
+        assert storage.get_sequence(Transaction(**transactions[0])) is None
+
+        affected = extend_storage(storage, transactions[3:])
+        sequence1 = storage.get_sequence(Transaction(**transactions[0]))
+        sequence2 = storage.get_sequence(Transaction(**transactions[5]))
+
+        assert affected == [0, 2]
+        assert len(storage.groups) == 3
+        assert sequence1 is not None
+        assert sequence1 == sequence2
+        assert storage.to_dict() == parse_storage(transactions).to_dict()
+
+    def test_extend_copy(self):
+        transactions = [dict(date=date, description='TEST INVOICE 1234', amount='435.23')
+                        for date in ['01/02/2020', '01/12/2020', '01/22/2020', '02/01/2020', '02/11/2020']]
+        storage = parse_storage(transactions[:4])
+        sequence = storage.get_sequence(Transaction(**transactions[0]))
+        expected = storage.to_dict()
+
+        copy = storage.copy()
+        extend_storage(copy, transactions[4:])
+        assert copy.to_dict() == parse_storage(transactions).to_dict()
+
+        # The copy's transactions were copied before being parsed again, so the original is unchanged.
+        assert storage.to_dict() == expected
+        assert all(transaction.sequence is sequence for transaction in storage.groups[0])
+        assert len(sequence) == 4
+
+        other = [dict(date='02/10/2020', description='TEST INVOICE 1234', amount='435.23')]
+        extend_storage(storage, other)
+        assert storage.to_dict() == parse_storage(transactions[:4] + other).to_dict()
+        assert copy.to_dict() == parse_storage(transactions).to_dict()
+
+    def test_extend_storage_duplicates(self):
+        transactions = [dict(date='01/{:02d}/2020'.format(day), description=description, amount=435.23)
+                        for description in ['TEST INVOICE 1234', 'THIRD*ONE*6565'] for day in range(2, 30, 7)]
+        storage = parse_storage(transactions[:3])
+
+        affected = extend_storage(storage, transactions[1:4] + transactions[3:4] + transactions[4:] * 2)
+        assert affected == [0, 1]
+        assert str(storage) == str(parse_storage(transactions))
+        assert [len(group) for group in storage.groups.values()] == [4, 4]
+        assert storage.duplicates == dict((Transaction(**transaction).id, 2)
+                                          for transaction in transactions[1:4] + transactions[4:])
+
+        extend_storage(storage, transactions[1:2])
+        assert storage.duplicates[Transaction(**transactions[1]).id] == 3
+
+    def test_parse_payloads_parallel(self):
+        payloads = [([0, 10, 20, 30], [1, 2, 3, 4]),
+                     ([0, 10], [5, 6]),
+                     ([0, 30, 60, 90, 120], [7, 8, 9, 10, 11])]
+
+        results = parse_payloads_parallel(payloads, workers=2)
+
+        assert results == [[(10, [0, 1, 2, 3])], [], [(30, [0, 1, 2, 3, 4])]]
+
+    def test_parse_storage_workers(self):
+        transactions = []
+        for description in ['TEST INVOICE 1234', 'ANOTHER TEST 1432', 'THIRD*ONE*6565']:
+            for date in ['01/02/2020', '01/12/2020', '01/22/2020', '02/01/2020', '02/03/2020']:
+                transactions.append(dict(date=date, description=description, amount='435.23'))
+
+        storage = parse_storage(transactions, workers=2)
+
+        assert str(storage) == str(parse_storage(transactions))
+        assert len(storage.groups) == 3
+
+    def test_parse_storage_workers_unsupported_parser(self):
+        with self.assertRaises(ValueError):
+            parse_storage([], sequence_parser=parse_sequences_histogram, workers=2)
+
+    def test_parse_storage_batch_unsupported(self):
+        with self.assertRaises(ValueError):
+            parse_storage(TransactionBatch(), sequence_parser=parse_sequences_histogram)
+        with self.assertRaises(ValueError):
+            parse_storage(TransactionBatch(), retention=30)
+
+    def test_parse_storage_batch_amounts(self):
+        transactions = [dict(date='01/{:02d}/2020'.format(day), description=description, amount=amount)
+                        for description, amount in [('TEST INVOICE 1234', 10), ('THIRD*ONE*6565', '12.50')]
+                        for day in range(2, 30, 7)]
+        batch = parse_storage(TransactionBatch.from_dicts(transactions))
+        assert str(batch) == str(parse_storage(transactions))
+        assert len(batch.intervals) == 2
+
+    def test_find_duplicates(self):
+        positions, duplicates = find_duplicates([3, 1, 3, 2, 3, 1])
+        assert positions == [0, 1, 3]
+        assert duplicates == {3: 3, 1: 2}
+        assert find_duplicates([]) == ([], {})
+
+    def test_parse_storage_duplicates(self):
+        transactions = [dict(date='01/{:02d}/2020'.format(day), description='TEST INVOICE 1234', amount=435.23)
+                        for day in range(2, 30, 7)]
+        duplicated = [transactions[0]] + transactions[:3] * 2 + transactions[3:]
+        storage = parse_storage(duplicated)
+        key = Transaction(**transactions[0]).id
+
+        assert str(storage) == str(parse_storage(transactions))
+        assert len(storage.groups[0]) == 4
+        assert storage.duplicates == {key: 3,
+                                      Transaction(**transactions[1]).id: 2,
+                                      Transaction(**transactions[2]).id: 2}
+        assert parse_storage(transactions).duplicates == {}
+
+        batch = parse_storage(TransactionBatch.from_dicts(duplicated))
+        assert batch.duplicates == storage.duplicates
+        assert str(batch) == str(storage)
+        assert batch.get_sequence(Transaction(**transactions[1])) is not None
+
+
+class SampleTests(unittest.TestCase):
+
+    def test_parse_sample(self):
+        # The sample data holds amounts with fractions of a cent, which are keyed without rounding.
+        with open(SAMPLE_PATH, 'r') as file:
+            json_transactions = list(iter_transactions(file))
+        storage = parse_storage(json_transactions)
+
+        transactions = [Transaction(**transaction) for transaction in json_transactions]
+        contents = {(transaction['date'], transaction['description'], Decimal(str(transaction['amount'])))
+                    for transaction in json_transactions}
+        assert len({transaction.id for transaction in transactions}) == len(contents)
+        assert len(list(storage.iter_sequences())) > 0
+        assert all(storage.get_response(transaction) is not None for transaction in transactions
+                   if transaction.id in storage.sequences)
+
+        batch = parse_storage(TransactionBatch.from_dicts(json_transactions))
+        assert str(batch) == str(storage)
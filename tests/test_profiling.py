@@ -0,0 +1,85 @@
+import logging
+import unittest
+
+from src.transactions.models import TransactionBatch
+from src.transactions.parser import parse_storage, find_sequences
+from src.transactions.histogram import parse_sequences_histogram
+from src.transactions.profiling import ParseProfile, COUNTERS
+from tests import get_transactions
+
+
+TRANSACTIONS = get_transactions() + [dict(date='01/05/2020', description='ANOTHER TEST 1432', amount='-12.5')]
+
+
+class ParseProfileTests(unittest.TestCase):
+
+    def test_stage(self):
+        times = iter([1.0, 1.5, 2.0, 2.25])
+        profile = ParseProfile(clock=lambda: next(times))
+        with profile.stage('grouping'):
+            pass
+        with profile.stage('grouping'):
+            pass
+        assert profile.stages == {'grouping': 0.75}
+
+    def test_get_slowest_groups(self):
+        profile = ParseProfile()
+        profile.add_group(10, 'A', 0.5, 1, {'comparisons': 3, 'pairs': 45})
+        profile.add_group(20, 'B', 2.0, 2, {'comparisons': 1, 'pairs': 190})
+        profile.add_group(5, 'C', 1.0, 0, {'comparisons': 2, 'pairs': 10})
+        assert [group.description for group in profile.get_slowest_groups(2)] == ['B', 'C']
+        assert profile.counters['pairs'] == 245
+
+        data = profile.to_dict(count=1)
+        assert data['groups'] == 3
+        assert data['sequences'] == 3
+        assert data['counters'] == dict(comparisons=6, pairs=245, candidates=0, rejected=0)
+        assert data['slowest_groups'][0]['number'] == 1
+
+    def test_log(self):
+        profile = ParseProfile()
+        profile.add_group(10, 'A', 0.5, 1, {'comparisons': 3})
+        with self.assertLogs('profiling', level=logging.INFO) as logs:
+            profile.log(logging.getLogger('profiling'))
+        assert len(logs.output) == 2
+
+
+class ParseStorageProfileTests(unittest.TestCase):
+
+    def test_parse_storage(self):
+        profile = ParseProfile()
+        storage = parse_storage(TRANSACTIONS, profile=profile)
+
+        assert str(storage) == str(parse_storage(TRANSACTIONS))
+        assert list(profile.stages) == ['transactions', 'grouping', 'sequences', 'storage']
+        assert [group.size for group in profile.groups] == [4, 1]
+        assert [group.sequences for group in profile.groups] == [1, 0]
+        assert profile.counters['comparisons'] == 5
+        assert profile.counters['pairs'] == 6
+        assert profile.counters['candidates'] == 3
+        assert profile.counters['rejected'] == 2
+
+    def test_parse_storage_other_parser(self):
+        profile = ParseProfile()
+        parse_storage(TRANSACTIONS, sequence_parser=parse_sequences_histogram, profile=profile)
+        assert [group.sequences for group in profile.groups] == [1, 0]
+        assert profile.counters['pairs'] == 0
+
+    def test_parse_batch(self):
+        profile = ParseProfile()
+        parse_storage(TransactionBatch.from_dicts(TRANSACTIONS), profile=profile)
+        assert list(profile.stages) == ['grouping', 'sequences', 'storage']
+        # Only distinct descriptions are compared.
+        assert profile.counters['comparisons'] == 2
+        assert set(profile.to_dict()['counters']) == set(COUNTERS)
+
+
+class FindSequencesStatsTests(unittest.TestCase):
+
+    def test_stats(self):
+        stats = {}
+        sequences = find_sequences([1, 8, 15, 22, 100], [1, 2, 3, 4, 5], stats=stats)
+        assert len(sequences) == 1
+        assert stats['pairs'] == 10
+        assert stats['candidates'] > 1
+        assert stats['rejected'] == stats['candidates'] - 1
@@ -0,0 +1,134 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src.transactions.models import Transaction
+from src.transactions.parser import parse_storage
+from src.transactions.snapshot import write_snapshot, SnapshotStorage, SnapshotDirectory, StaleSnapshotError, \
+    VERSION_FILE, read_job
+from tests import get_transactions
+
+
+class SnapshotTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'snapshot.bin')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_get_sequence(self):
+        storage = parse_storage(get_transactions('TEST INVOICE 1234', '435.23') +
+                                get_transactions('ÇÃO SUBSCRIPTION', 12.5, start=1))
+        write_snapshot(storage, self.path)
+
+        snapshot = SnapshotStorage(self.path)
+        assert len(snapshot) == len(storage.sequences) == 8
+        for key, sequence in storage.sequences.items():
+            transaction = sequence.transactions[key]
+            assert str(snapshot.get_sequence(transaction)) == str(sequence)
+        snapshot.close()
+
+    def test_get_response(self):
+        storage = parse_storage(get_transactions('TEST INVOICE 1234', '435.23'))
+        write_snapshot(storage, self.path)
+
+        snapshot = SnapshotStorage(self.path)
+        transaction = Transaction(date='01/09/2020', description='TEST INVOICE 1234', amount='435.23')
+        response = snapshot.get_response(transaction)
+        assert response == str(storage.get_sequence(transaction)).encode('utf-8')
+        assert snapshot.get_response(transaction) is response
+        snapshot.close()
+
+    def test_get_missing_sequence(self):
+        storage = parse_storage(get_transactions('TEST INVOICE 1234', '435.23'))
+        write_snapshot(storage, self.path)
+
+        snapshot = SnapshotStorage(self.path)
+        transaction = Transaction(date='01/02/2020', description='TEST INVOICE 1234', amount='435.24')
+        assert snapshot.get_sequence(transaction) is None
+        snapshot.close()
+
+    def test_empty_storage(self):
+        write_snapshot(parse_storage([]), self.path)
+
+        snapshot = SnapshotStorage(self.path)
+        transaction = Transaction(date='01/02/2020', description='TEST INVOICE 1234', amount='435.23')
+        assert len(snapshot) == 0
+        assert snapshot.get_sequence(transaction) is None
+        snapshot.close()
+
+    def test_invalid_file(self):
+        with open(self.path, 'wb') as file:
+            file.write(b'\0' * 128)
+
+        with self.assertRaises(ValueError):
+            SnapshotStorage(self.path)
+
+
+class SnapshotDirectoryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_current(self):
+        writer = SnapshotDirectory(self.directory.name)
+        reader = SnapshotDirectory(self.directory.name)
+        assert reader.current() is None
+
+        transaction = Transaction(date='01/02/2020', description='TEST INVOICE 1234', amount='435.23')
+        writer.publish(parse_storage([]))
+        first = reader.current()
+        assert first.get_sequence(transaction) is None
+        assert reader.current() is first
+
+        writer.publish(parse_storage(get_transactions('TEST INVOICE 1234', '435.23')))
+        second = reader.current()
+        assert second is not first
+        assert len(second.get_sequence(transaction)) == 4
+
+    def test_publish_removes_old_snapshots(self):
+        snapshots = SnapshotDirectory(self.directory.name, keep=2)
+        names = [snapshots.publish(parse_storage([])) for _ in range(4)]
+
+        files = set(os.listdir(self.directory.name))
+        assert files == {VERSION_FILE, names[-2], names[-1]}
+        with open(os.path.join(self.directory.name, VERSION_FILE)) as file:
+            assert file.read() == names[-1]
+
+    def test_publish_stale(self):
+        first = SnapshotDirectory(self.directory.name)
+        second = SnapshotDirectory(self.directory.name)
+        first.publish(parse_storage([]))
+        assert not first.is_stale()
+        name = second.publish(parse_storage([]))
+        assert first.is_stale()
+        assert not second.is_stale()
+
+        with self.assertRaises(StaleSnapshotError):
+            first.publish(parse_storage([]), check=True)
+        assert first.get_current_name() == name
+        assert len([entry for entry in os.listdir(self.directory.name) if entry.startswith('snapshot-')]) == 2
+
+        second.publish(parse_storage([]), check=True)
+        first.publish(parse_storage([]))
+        assert not first.is_stale()
+
+    @patch('src.transactions.snapshot.MAX_JOB_FILES', 2)
+    def test_jobs(self):
+        directory = SnapshotDirectory(self.directory.name)
+        jobs = [dict(id='{:032x}'.format(number), status='pending') for number in range(3)]
+        for job in jobs:
+            directory.write_job(job)
+        directory.write_job(dict(jobs[2], status='done'))
+
+        # Only the most recently written jobs are kept.
+        assert read_job(self.directory.name, jobs[2]['id']) == dict(jobs[2], status='done')
+        assert read_job(self.directory.name, jobs[1]['id']) == jobs[1]
+        assert read_job(self.directory.name, jobs[0]['id']) is None
+        assert read_job(self.directory.name, '../' + VERSION_FILE) is None
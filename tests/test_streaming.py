@@ -0,0 +1,85 @@
+import datetime
+import unittest
+
+from src.transactions.models import Transaction
+from src.transactions.streaming import StreamingSequenceDetector, DETECTED, EXTENDED
+
+
+def get_transaction(ordinal, description='TEST INVOICE 1234', amount=10.5):
+    return Transaction.from_ordinal(ordinal, description, amount)
+
+
+START = datetime.date(2020, 1, 2).toordinal()
+
+
+class StreamingSequenceDetectorTests(unittest.TestCase):
+
+    def test_detected_at_minimum_transactions(self):
+        detector = StreamingSequenceDetector()
+        events = [detector.add(get_transaction(START + days)) for days in [0, 30, 61, 90]]
+
+        assert events[:3] == [[], [], []]
+        assert len(events[3]) == 1
+        event = events[3][0]
+        assert event.kind == DETECTED
+        assert event.sequence.interval == 30
+        assert len(event.sequence) == 4
+        assert all(transaction.sequence is event.sequence for transaction in event.sequence)
+
+    def test_extended(self):
+        detector = StreamingSequenceDetector()
+        events = [event for days in range(0, 180, 30) for event in detector.add(get_transaction(START + days))]
+
+        assert [event.kind for event in events] == [DETECTED, EXTENDED, EXTENDED]
+        assert len({id(event.sequence) for event in events}) == 1
+        assert len(events[-1].sequence) == 6
+
+    def test_noise(self):
+        detector = StreamingSequenceDetector()
+        days = [0, 5, 30, 60, 62, 89]
+        events = [event for day in days for event in detector.add(get_transaction(START + day))]
+
+        assert len(events) == 1
+        assert [(transaction.date.toordinal() - START) for transaction in events[0].sequence] == [0, 30, 60, 89]
+
+    def test_missed_date(self):
+        detector = StreamingSequenceDetector()
+        events = [event for days in [0, 30, 60, 100, 130] for event in detector.add(get_transaction(START + days))]
+        assert events == []
+
+        assert detector.add(get_transaction(START + 160)) == []
+        sequence = detector.add(get_transaction(START + 190))[0].sequence
+        assert [(transaction.date.toordinal() - START) for transaction in sequence] == [100, 130, 160, 190]
+
+    def test_groups(self):
+        detector = StreamingSequenceDetector()
+        events = []
+        for days in range(0, 120, 30):
+            events.extend(detector.add(get_transaction(START + days, 'NETFLIX SUBSCRIPTION')))
+            events.extend(detector.add(get_transaction(START + days + 1, 'EXXON MOBIL 0001')))
+
+        assert [event.group for event in events] == [0, 1]
+        assert len(detector.groups) == 2
+
+    def test_date_order(self):
+        detector = StreamingSequenceDetector()
+        detector.add(get_transaction(START + 10))
+        with self.assertRaises(ValueError):
+            detector.add(get_transaction(START))
+
+    def test_bounded_state(self):
+        detector = StreamingSequenceDetector(history_size=8, max_candidates=16)
+        for days in range(0, 400):
+            detector.add(get_transaction(START + days, amount=days))
+
+        group = detector.groups[0]
+        assert len(group.history) <= 8
+        assert len(group.candidates) <= 16 + 1
+
+    def test_process(self):
+        detector = StreamingSequenceDetector()
+        transactions = [dict(date='{:02d}/10/2020'.format(month), description='TEST INVOICE', amount=1)
+                        for month in range(1, 7)]
+        events = list(detector.process(transactions))
+        assert [event.kind for event in events] == [DETECTED, EXTENDED, EXTENDED]
+        assert events[0].to_dict()['sequence'] == events[0].sequence.to_dict()
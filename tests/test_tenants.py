@@ -0,0 +1,161 @@
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from src.transactions.backends import SQLiteStorage
+from src.transactions.jobs import StorageState
+from src.transactions.models import Transaction
+from src.transactions.parser import parse_storage
+from src.transactions.snapshot import SnapshotStorage
+from src.transactions.tenants import TenantRegistry, DEFAULT_ACCOUNT, get_storage_size, get_account_name
+from tests import get_transactions
+
+
+class TenantRegistryTests(unittest.TestCase):
+
+    def test_get(self):
+        registry = TenantRegistry()
+        state = registry.get('a')
+        assert isinstance(state, StorageState)
+        assert registry.get('a') is state
+        assert registry.get('b') is not state
+        assert registry.get() is registry.get(DEFAULT_ACCOUNT)
+        assert state.executor is registry.executor
+
+    def test_evict_tenants(self):
+        registry = TenantRegistry(max_tenants=2)
+        registry.get('a')
+        registry.get('b')
+        registry.get('a')
+        registry.get('c')
+        assert list(registry.states) == ['a', 'c']
+
+    def test_evict_transactions(self):
+        registry = TenantRegistry(max_transactions=9)
+        registry.get('a').publish(parse_storage(get_transactions(days=5)))
+        registry.get('b').publish(parse_storage(get_transactions(count=6, days=5)))
+        assert list(registry.states) == ['a', 'b']
+
+        # The budget is enforced on the next request.
+        registry.get('c')
+        assert list(registry.states) == ['b', 'c']
+
+    def test_busy_tenants_are_kept(self):
+        registry = TenantRegistry(max_tenants=1)
+        started = threading.Event()
+        job = registry.get('a').submit(lambda: started.wait(timeout=5) and parse_storage([]))
+        registry.get('b')
+        assert list(registry.states) == ['a', 'b']
+
+        started.set()
+        registry.executor.submit(lambda: None).result(timeout=5)
+        assert job.status == 'done'
+        registry.get('b')
+        assert list(registry.states) == ['b']
+
+    def test_tenants_in_use_are_kept(self):
+        registry = TenantRegistry(max_tenants=1)
+        with registry.use('a') as state:
+            registry.get('b')
+            assert list(registry.states) == ['a', 'b']
+            state.publish(parse_storage(get_transactions(days=5)))
+        assert registry.get('b').storage is None
+        assert list(registry.states) == ['b']
+
+    def test_total(self):
+        registry = TenantRegistry(max_transactions=20)
+        registry.get('a').publish(parse_storage(get_transactions(days=5)))
+        registry.get('b').publish(parse_storage(get_transactions(count=6, days=5)))
+        assert registry.total == 10
+        registry.get('a').publish(parse_storage(get_transactions(count=5, days=5)))
+        assert registry.total == 11
+
+        registry.max_transactions = 9
+        registry.get('c')
+        assert list(registry.states) == ['a', 'c']
+        assert registry.total == 5
+
+    def test_restore_while_spilling(self):
+        with tempfile.TemporaryDirectory() as directory:
+            registry = TenantRegistry(max_tenants=1, spill_dir=directory)
+            storage = parse_storage(get_transactions(days=5))
+            registry.get('a').publish(storage)
+            restored = []
+
+            def spill(account, spilled):
+                # Requests arriving while the snapshot is written get the storage back from memory.
+                restored.append(registry.get(account).storage)
+
+            with patch.object(registry, 'spill', side_effect=spill):
+                registry.get('b')
+            assert restored == [storage]
+            assert list(registry.states) == ['a']
+            assert registry.total == 4
+            assert not registry.spilling
+
+    def test_spill(self):
+        with tempfile.TemporaryDirectory() as directory:
+            registry = TenantRegistry(max_tenants=1, spill_dir=directory)
+            storage = parse_storage(get_transactions(days=5))
+            registry.get('a').publish(storage)
+            registry.get('b')
+            assert 'a' not in registry
+
+            restored = registry.get('a').storage
+            assert isinstance(restored, SnapshotStorage)
+            transaction = Transaction(date='01/07/2020', description='TEST INVOICE 1234', amount='435.23')
+            assert restored.get_response(transaction) == storage.get_response(transaction)
+            assert registry.get('b').storage is None
+
+    def test_find(self):
+        registry = TenantRegistry(max_tenants=2)
+        registry.get('a').publish(parse_storage(get_transactions(days=5)))
+        registry.get('b').publish(parse_storage(get_transactions(days=5)))
+
+        # Lookups for unknown accounts don't create states, so they don't evict the loaded ones.
+        assert registry.find('x') is None
+        assert registry.find('y') is None
+        assert list(registry.states) == ['a', 'b']
+
+        assert registry.find('a') is registry.states['a']
+        assert list(registry.states) == ['b', 'a']
+
+    def test_find_spilled(self):
+        with tempfile.TemporaryDirectory() as directory:
+            registry = TenantRegistry(max_tenants=1, spill_dir=directory)
+            registry.get('a').publish(parse_storage(get_transactions(days=5)))
+            registry.get('b').publish(parse_storage(get_transactions(days=5)))
+            assert 'a' not in registry
+
+            assert isinstance(registry.find('a').storage, SnapshotStorage)
+            assert list(registry.states) == ['a']
+            assert registry.find('x') is None
+
+    def test_find_has_storage(self):
+        registry = TenantRegistry(has_storage=lambda account: account == 'shared')
+        assert registry.find('shared') is registry.states['shared']
+        assert registry.find('x') is None
+
+    def test_evict_backend(self):
+        registry = TenantRegistry(max_tenants=1, max_transactions=2)
+        storage = parse_storage(get_transactions(days=5), storage=SQLiteStorage())
+        registry.get('a').publish(storage)
+        assert registry.total == 0
+
+        # Backends keep their sequences on disk, so they are kept when evicted, without their cache.
+        storage.get_response_by_key(next(iter(storage.iter_sequences())).get_first_transaction().id)
+        assert storage.cache
+        registry.get('b')
+        assert 'a' not in registry
+        assert not storage.cache
+        assert registry.find('a').storage is storage
+
+    def test_get_storage_size(self):
+        assert get_storage_size(None) == 0
+        assert get_storage_size(parse_storage(get_transactions(count=5, days=5))) == 5
+
+    def test_get_account_name(self):
+        assert get_account_name('../a') == get_account_name('../a')
+        assert get_account_name('../a') != get_account_name('../b')
+        assert '/' not in get_account_name('../a')